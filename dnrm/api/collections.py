@@ -23,7 +23,7 @@ class CollectionController(wsgi.Controller):
         super(CollectionController, self).__init__()
 
     def _get_collections(self):
-        return ["resources", "drivers"]
+        return ["resources", "drivers", "pools", "stats"]
 
     def index(self, request):
         """Return a summary list of collections."""
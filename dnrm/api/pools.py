@@ -0,0 +1,68 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+from webob import exc
+
+from dnrm import exceptions
+from dnrm.openstack.common import log as logging
+from dnrm.resources import manager
+from dnrm import wsgi
+
+LOG = logging.getLogger(__name__)
+
+
+class PoolController(wsgi.Controller):
+    def __init__(self):
+        self.resource_manager = manager.ResourceManager()
+        super(PoolController, self).__init__()
+
+    def index(self, request):
+        """Return a summary list of pools."""
+        context = request.environ.get('dnrm.context', None)
+        return {'pools': self.resource_manager.list_pools(context)}
+
+    def allocate(self, request, driver_name, body=None):
+        """Allocate started resources from pool.
+
+        Either all count resources are allocated or request fails with
+        conflict error.
+        """
+        context = request.environ.get('dnrm.context', None)
+        LOG.audit(_("Allocating resources from pool %s"), driver_name,
+                  context=context)
+        count = 1
+        if body:
+            if not self.is_valid_body(body, 'pool'):
+                raise exc.HTTPBadRequest()
+            try:
+                count = int(body['pool'].get('count', count))
+            except (TypeError, ValueError):
+                raise exc.HTTPBadRequest()
+            if count < 1:
+                raise exc.HTTPBadRequest()
+        try:
+            resources = self.resource_manager.allocate_from_pool(
+                context, driver_name, count)
+        except exceptions.InvalidDriverName:
+            raise exc.HTTPNotFound()
+        except (exceptions.PoolExhausted,
+                exceptions.ResourceClaimConflict) as e:
+            raise exc.HTTPConflict(explanation=unicode(e))
+        return {'resources': resources}
+
+
+def create_resource():
+    return wsgi.Resource(PoolController())
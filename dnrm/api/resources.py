@@ -15,6 +15,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import urllib
+
 import webob
 from webob import exc
 
@@ -36,7 +38,50 @@ class ResourceController(wsgi.Controller):
         context = request.environ.get('dnrm.context', None)
         search_opts = {}
         search_opts.update(request.GET)
-        return {'resources': self.resource_manager.list(context, search_opts)}
+        if 'fields' in search_opts:
+            search_opts['fields'] = self._get_fields(request)
+        for key in ('limit', 'offset'):
+            if key in search_opts:
+                try:
+                    search_opts[key] = int(search_opts[key])
+                except ValueError:
+                    raise exc.HTTPBadRequest()
+                if search_opts[key] < 0:
+                    raise exc.HTTPBadRequest()
+        limit = search_opts.get('limit')
+        try:
+            if limit is None:
+                # Unlimited listing is streamed to keep memory usage flat.
+                resources = self.resource_manager.iterate(context,
+                                                          dict(search_opts))
+                return webob.Response(
+                    content_type='application/json',
+                    app_iter=wsgi.JSONDictSerializer().stream('resources',
+                                                              resources))
+            resources = self.resource_manager.list(context,
+                                                   dict(search_opts))
+        except (exceptions.MarkerNotFound, ValueError) as e:
+            raise exc.HTTPBadRequest(explanation=unicode(e))
+        result = {'resources': resources}
+        if limit and len(resources) == limit:
+            result['resources_links'] = [
+                self._next_link(request, resources[-1]['id'])]
+        return result
+
+    @staticmethod
+    def _get_fields(request):
+        """Returns list of fields requested by fields parameter or None."""
+        fields = request.GET.get('fields')
+        if not fields:
+            return None
+        return [field.strip() for field in fields.split(',') if field.strip()]
+
+    def _next_link(self, request, marker):
+        params = dict(request.GET)
+        params.pop('offset', None)
+        params['marker'] = marker
+        return {'rel': 'next',
+                'href': '%s?%s' % (request.path_url, urllib.urlencode(params))}
 
     def create(self, request, body):
         """Create a new resource."""
@@ -49,11 +94,87 @@ class ResourceController(wsgi.Controller):
         resource = self.resource_manager.add(context, resource_type, resource)
         return resource
 
+    def batch(self, request, body):
+        """Create, delete, allocate or deallocate several resources.
+
+        Body holds list of operations, each operation gets its own result
+        with HTTP status code of this operation.
+        """
+        context = request.environ.get('dnrm.context', None)
+        LOG.audit(_("Processing batch of resource operations"))
+        if not body or not isinstance(body.get('operations'), list):
+            raise exc.HTTPBadRequest()
+        operations = body['operations']
+        results = [None] * len(operations)
+        creates = []
+        for i, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                results[i] = self._batch_error(exc.HTTPBadRequest.code,
+                                               _('Invalid operation'))
+                continue
+            action = operation.get('action')
+            if action == 'create':
+                if not self.is_valid_body(operation, 'resource'):
+                    results[i] = self._batch_error(exc.HTTPBadRequest.code,
+                                                   _('Invalid resource'))
+                    continue
+                resource = operation['resource']
+                creates.append((i, resource.get('resource_type', None),
+                                resource))
+            elif action in ('delete', 'allocate', 'deallocate'):
+                results[i] = self._batch_update(context, action, operation)
+            else:
+                results[i] = self._batch_error(
+                    exc.HTTPBadRequest.code,
+                    _('Invalid action: %s') % action)
+        if creates:
+            created = self.resource_manager.add_many(
+                context, [(driver_name, resource)
+                          for _i, driver_name, resource in creates])
+            for (i, _driver_name, _resource), result in zip(creates,
+                                                            created):
+                if isinstance(result, Exception):
+                    results[i] = self._batch_error(exc.HTTPBadRequest.code,
+                                                   unicode(result))
+                else:
+                    results[i] = {'status': 201, 'resource': result}
+        return {'results': results}
+
+    def _batch_update(self, context, action, operation):
+        resource_id = operation.get('id')
+        if not resource_id:
+            return self._batch_error(exc.HTTPBadRequest.code,
+                                     _('Resource id missing'))
+        try:
+            if action == 'delete':
+                self.resource_manager.delete(
+                    context, resource_id, operation.get('force') is True)
+                return {'status': 204, 'id': resource_id}
+            resource = getattr(self.resource_manager, action)(context,
+                                                              resource_id)
+        except exceptions.ResourceNotFound as e:
+            return self._batch_error(exc.HTTPNotFound.code, unicode(e))
+        except (exceptions.ResourceProcessing,
+                exceptions.ResourceAllocated,
+                exceptions.ResourceUpdateConflict) as e:
+            return self._batch_error(exc.HTTPConflict.code, unicode(e))
+        except Exception:
+            LOG.exception(_('Failed to %(action)s resource %(id)s') %
+                          {'action': action, 'id': resource_id})
+            return self._batch_error(exc.HTTPServerError.code,
+                                     _('Internal error'))
+        return {'status': 200, 'resource': resource}
+
+    @staticmethod
+    def _batch_error(code, message):
+        return {'status': code, 'error': message}
+
     def show(self, request, resource_id):
         """Get a resource."""
         context = request.environ.get('dnrm.context', None)
         try:
-            resource = self.resource_manager.get(context, resource_id)
+            resource = self.resource_manager.get(context, resource_id,
+                                                 self._get_fields(request))
         except exceptions.ResourceNotFound:
             raise exc.HTTPNotFound()
         return {'resource': resource}
@@ -73,13 +194,17 @@ class ResourceController(wsgi.Controller):
             raise exc.HTTPNotFound()
 
         allocate = body['resource'].get('allocated', None)
-        if allocate is not None:
+        try:
             if allocate is True:
                 resource = self.resource_manager.allocate(context,
                                                           resource['id'])
-            else:
+            elif allocate is not None:
                 resource = self.resource_manager.deallocate(context,
                                                             resource['id'])
+        except (exceptions.ResourceProcessing,
+                exceptions.ResourceAllocated,
+                exceptions.ResourceUpdateConflict) as e:
+            raise exc.HTTPConflict(explanation=unicode(e))
 
         return {'resource': resource}
 
@@ -98,6 +223,10 @@ class ResourceController(wsgi.Controller):
             self.resource_manager.delete(context, resource_id, force)
         except exceptions.ResourceNotFound:
             raise exc.HTTPNotFound()
+        except (exceptions.ResourceProcessing,
+                exceptions.ResourceAllocated,
+                exceptions.ResourceUpdateConflict) as e:
+            raise exc.HTTPConflict(explanation=unicode(e))
         return webob.Response(status_int=204)
 
 
@@ -18,7 +18,9 @@
 from dnrm import api
 from dnrm.api import collections
 from dnrm.api import drivers
+from dnrm.api import pools
 from dnrm.api import resources
+from dnrm.api import stats
 from dnrm.api import versions
 
 
@@ -47,6 +49,11 @@ class APIRouter(api.APIRouter):
                        action='create',
                        conditions={'method': ['POST']})
 
+        mapper.connect("resource", "/v1/resources/batch",
+                       controller=self.resources['resources'],
+                       action='batch',
+                       conditions={'method': ['POST']})
+
         mapper.connect("resource", "/v1/resources/{resource_id}",
                        controller=self.resources['resources'],
                        action='show',
@@ -72,3 +79,20 @@ class APIRouter(api.APIRouter):
                        controller=self.resources['drivers'],
                        action='show',
                        conditions={'method': ['GET']})
+
+        self.resources['pools'] = pools.create_resource()
+        mapper.connect("pool", "/v1/pools/",
+                       controller=self.resources['pools'],
+                       action='index',
+                       conditions={'method': ['GET']})
+
+        mapper.connect("pool", "/v1/pools/{driver_name}/allocate",
+                       controller=self.resources['pools'],
+                       action='allocate',
+                       conditions={'method': ['POST']})
+
+        self.resources['stats'] = stats.create_resource()
+        mapper.connect("stats", "/v1/stats",
+                       controller=self.resources['stats'],
+                       action='index',
+                       conditions={'method': ['GET']})
@@ -0,0 +1,43 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+from webob import exc
+
+from dnrm.resources import manager
+from dnrm import wsgi
+
+
+class StatsController(wsgi.Controller):
+    def __init__(self):
+        self.resource_manager = manager.ResourceManager()
+        super(StatsController, self).__init__()
+
+    def index(self, request):
+        """Return resource counts and pool watermarks."""
+        context = request.environ.get('dnrm.context', None)
+        group_by = request.GET.get('group_by')
+        if group_by:
+            group_by = [field.strip() for field in group_by.split(',')
+                        if field.strip()]
+        try:
+            stats = self.resource_manager.stats(context, group_by)
+        except ValueError as e:
+            raise exc.HTTPBadRequest(explanation=unicode(e))
+        return {'stats': stats}
+
+
+def create_resource():
+    return wsgi.Resource(StatsController())
@@ -15,14 +15,38 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import abc
+import math
+import time
+
+from oslo.config import cfg
 
 from dnrm.openstack.common import log
 from dnrm.resources import base
 from dnrm import tasks
 
+CONF = cfg.CONF
 LOG = log.getLogger(__name__)
 
 
+def count_resources(stats, **conditions):
+    """Sums counts of stats items that match all conditions.
+
+    Condition value may be a tuple, in that case item matches if its value
+    is in this tuple.
+    """
+    count = 0
+    for item in stats:
+        for key, value in conditions.items():
+            if isinstance(value, tuple):
+                if item[key] not in value:
+                    break
+            elif item[key] != value:
+                break
+        else:
+            count += item['count']
+    return count
+
+
 class Balancer(object):
     __meta__ = abc.ABCMeta
 
@@ -38,11 +62,18 @@ class Balancer(object):
     def list_resources(self, state, count=None):
         return self._unused_set.list(state, count)
 
+    def get_stats(self):
+        return self._unused_set.stats()
+
     def push_resources(self, resources):
         for resource in resources:
             LOG.debug(_('Push resource into pool: %(id)s/%(type)s') % resource)
             self._pool.push(resource['id'])
 
+    def count_allocations(self, count):
+        """Called when count resources are allocated from pool."""
+        pass
+
     def pop_resources(self, count=None):
         LOG.debug(_('Pop resources from pool: %(count)s') % {'count': 'all'
                                                              if count is None
@@ -53,6 +84,10 @@ class Balancer(object):
     def start(self, resource):
         pass
 
+    def start_many(self, resources):
+        for resource in resources:
+            self.start(resource)
+
     @abc.abstractmethod
     def stop(self, resource):
         pass
@@ -61,6 +96,11 @@ class Balancer(object):
     def balance(self):
         pass
 
+    def get_targets(self):
+        """Returns watermarks that balancer currently keeps pool within."""
+        return {'low_watermark': self.low_watermark,
+                'high_watermark': self.high_watermark}
+
     def __str__(self):
         return self._pool.name
 
@@ -78,6 +118,14 @@ class TaskBasedBalancer(Balancer):
         task = tasks.StartTask(resource)
         self._queue.push(task)
 
+    def start_many(self, resources):
+        if len(resources) < 2:
+            return super(TaskBasedBalancer, self).start_many(resources)
+        LOG.debug(_('Start task for %(count)d resources of %(pool)s') %
+                  {'count': len(resources), 'pool': self._pool.name})
+        task = tasks.StartManyTask(resources)
+        self._queue.push(task)
+
     def stop(self, resource):
         super(TaskBasedBalancer, self).stop(resource)
         LOG.debug(_('Stop task for resource: %(id)s/%(type)s') % resource)
@@ -94,8 +142,8 @@ class SimpleBalancer(Balancer):
         deficit -= len(resources)
         if deficit > 0:
             resources = self.get_resources(base.STATE_STOPPED, deficit)
-            for resource in resources:
-                self.start(resource)
+            if resources:
+                self.start_many(resources)
 
     def eliminate_overflow(self, overflow):
         resources = self.pop_resources(overflow)
@@ -112,26 +160,120 @@ class SimpleBalancer(Balancer):
             self.stop(resource)
 
     def balance(self):
+        self.balance_stats(self.get_stats())
+
+    def balance_stats(self, stats):
+        pool_count = count_resources(stats, pool=self._pool.name,
+                                     allocated=False)
         LOG.debug(
             _('Run balancer for pool "%(name)s".\nLow watermark: %(low)d\n'
               'High watermark: %(high)d\nCurrent number: %(number)d\n') %
             {'name': self._pool.name, 'low': self.low_watermark,
-             'high': self.high_watermark, 'number': self._pool.count()}
+             'high': self.high_watermark, 'number': pool_count}
         )
         # Eliminate deficit.
-        deficit = (self.low_watermark - self._pool.count() -
-                   self._unused_set.count(base.ACTIVE_STATES, True))
+        processing = count_resources(stats, pool=None, allocated=False,
+                                     processing=True, deleted=False,
+                                     status=base.ACTIVE_STATES)
+        deficit = self.low_watermark - pool_count - processing
         if deficit > 0:
             self.eliminate_deficit(deficit)
 
         # Eliminate overflow
-        overflow = self._pool.count() - self.high_watermark
+        overflow = pool_count - self.high_watermark
         if overflow > 0:
             self.eliminate_overflow(overflow)
 
         # Stop unused started resources
-        self.stop_unused()
+        unused = count_resources(stats, pool=None, allocated=False,
+                                 processing=False, deleted=False,
+                                 status=base.STATE_STARTED)
+        if unused > 0:
+            self.stop_unused()
 
 
 class DNRMBalancer(SimpleBalancer, TaskBasedBalancer):
     pass
+
+
+class PredictiveBalancer(SimpleBalancer):
+    """
+    Balancer that raises low watermark of pool to cover allocations expected
+    while new resources boot. Allocation rate is exponentially weighted
+    moving average over predictive_window seconds of allocations reported by
+    count_allocations, boot time is moving average of observed durations
+    from start of resource to its push into pool. Low watermark is raised at
+    most by predictive_max_extra.
+    """
+
+    # Weight of newest observed boot duration in boot time average.
+    boot_time_weight = 0.3
+
+    def __init__(self, *args, **kwargs):
+        super(PredictiveBalancer, self).__init__(*args, **kwargs)
+        self.configured_low_watermark = self.low_watermark
+        self.configured_high_watermark = self.high_watermark
+        self.allocation_rate = 0.0
+        self.boot_time = float(CONF.predictive_boot_time)
+        self._starting = {}
+        self._last_observed = None
+        self._allocations = 0
+
+    def balance(self):
+        self.observe_allocations(time.time())
+        self.low_watermark, self.high_watermark = self.compute_watermarks()
+        self.balance_stats(self.get_stats())
+
+    def count_allocations(self, count):
+        # Allocations are counted as they happen, growth of allocated
+        # resources would hide allocations matched by deallocations.
+        self._allocations += count
+
+    def observe_allocations(self, now):
+        if self._last_observed is not None:
+            if now <= self._last_observed:
+                return
+            elapsed = now - self._last_observed
+            rate = self._allocations / elapsed
+            weight = 1 - math.exp(-elapsed / CONF.predictive_window)
+            self.allocation_rate += weight * (rate - self.allocation_rate)
+        self._last_observed = now
+        self._allocations = 0
+
+    def compute_watermarks(self):
+        expected = int(math.ceil(self.allocation_rate * self.boot_time))
+        low = (self.configured_low_watermark +
+               min(expected, CONF.predictive_max_extra))
+        return low, max(self.configured_high_watermark, low)
+
+    def start_many(self, resources):
+        now = time.time()
+        # Resources that never reached pool are forgotten when reaper
+        # considers them stuck.
+        timeout = CONF.processing_deadlines.get(base.STATE_STARTING)
+        if timeout is not None:
+            for resource_id, started in self._starting.items():
+                if started < now - int(timeout):
+                    del self._starting[resource_id]
+        for resource in resources:
+            self._starting[resource['id']] = now
+        super(PredictiveBalancer, self).start_many(resources)
+
+    def push_resources(self, resources):
+        now = time.time()
+        for resource in resources:
+            started = self._starting.pop(resource['id'], None)
+            if started is not None:
+                self.boot_time += self.boot_time_weight * (
+                    now - started - self.boot_time)
+        super(PredictiveBalancer, self).push_resources(resources)
+
+    def get_targets(self):
+        targets = super(PredictiveBalancer, self).get_targets()
+        targets.update(allocation_rate=self.allocation_rate,
+                       boot_time=self.boot_time)
+        return targets
+
+
+class PredictiveDNRMBalancer(PredictiveBalancer, TaskBasedBalancer):
+    pass
@@ -15,8 +15,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import abc
+import time
 
 import eventlet
+from eventlet import greenpool
+from eventlet import queue as eventlet_queue
+import greenlet
 from oslo.config import cfg
 
 from dnrm.openstack.common import importutils
@@ -31,6 +35,7 @@ class BalancersManager(object):
 
     def __init__(self):
         self.balancers = {}
+        self.passes = {}
 
     @abc.abstractmethod
     def create_balancer(self, pool, unused_set,
@@ -49,52 +54,189 @@ class BalancersManager(object):
         self.balancers[pool_key] = balancer
         return balancer
 
+    def get_balancers(self, pool_keys=None):
+        """Returns (pool key, balancer) pairs, all or only for pool_keys."""
+        if pool_keys is None:
+            return self.balancers.items()
+        return [(pool_key, self.balancers[pool_key])
+                for pool_key in pool_keys if pool_key in self.balancers]
+
     @abc.abstractmethod
-    def balance_pools(self):
+    def balance_pools(self, pool_keys=None):
+        pass
+
+    def wait_balancers(self):
+        """Blocks until balancing passes in progress are finished."""
         pass
 
+    def overdue_passes(self):
+        """
+        Returns pool key to number of seconds for balancing passes that run
+        longer than sleep_time. Passes are not interrupted, hung pass is
+        reported here instead.
+        """
+        now = time.time()
+        return dict((pool_key, now - started)
+                    for pool_key, started in self.passes.items()
+                    if now - started > CONF.sleep_time)
+
+    def _balance_once(self, pool_key, balancer):
+        """Runs one balancing pass of pool, errors are logged."""
+        started = time.time()
+        self.passes[pool_key] = started
+        try:
+            balancer.balance()
+        except Exception as e:
+            msg = _('Balancer {0} error: {1}').format(str(balancer), str(e))
+            LOG.exception(msg)
+        finally:
+            del self.passes[pool_key]
+        duration = time.time() - started
+        if duration > CONF.sleep_time:
+            LOG.warning(_('Balancer %(pool)s pass took %(duration)d '
+                          'seconds.') % {'pool': pool_key,
+                                         'duration': duration})
+
 
 class SerialBalancersManager(BalancersManager):
-    def balance_pools(self):
-        for balancer in self.balancers.values():
-            try:
-                balancer.balance()
-            except Exception as e:
-                msg = _('Balancer {0} error: {1}').format(str(balancer),
-                                                          str(e))
-                LOG.exception(msg)
+    def balance_pools(self, pool_keys=None):
+        for pool_key, balancer in self.get_balancers(pool_keys):
+            self._balance_once(pool_key, balancer)
+
+
+class ParallelBalancersManager(BalancersManager):
+    """
+    Runs balancers of all pools concurrently. If previous pass of a pool is
+    still running, another pass is run right after it instead.
+    """
 
+    def __init__(self):
+        super(ParallelBalancersManager, self).__init__()
+        self.greenpool = greenpool.GreenPool(CONF.balancer_concurrency)
+        self.balancing = set()
+        self.rebalance = set()
+
+    def balance_pools(self, pool_keys=None):
+        overdue = self.overdue_passes()
+        for pool_key, balancer in self.get_balancers(pool_keys):
+            if pool_key in overdue:
+                LOG.warning(_('Balancer %(pool)s pass runs for %(duration)d '
+                              'seconds.') % {'pool': pool_key,
+                                             'duration': overdue[pool_key]})
+            if pool_key in self.balancing:
+                LOG.debug(_('Balancer %s is still running, balance pool '
+                            'again after it.') % pool_key)
+                self.rebalance.add(pool_key)
+                continue
+            self.balancing.add(pool_key)
+            self.greenpool.spawn_n(self._balance, pool_key, balancer)
+
+    def wait_balancers(self):
+        self.greenpool.waitall()
+
+    def _balance(self, pool_key, balancer):
+        # Pass is not interrupted by timeout, resources claimed by balancer
+        # would stay in processing state otherwise. Overdue passes are
+        # reported by overdue_passes.
+        try:
+            while True:
+                self._balance_once(pool_key, balancer)
+                if pool_key not in self.rebalance:
+                    break
+                self.rebalance.discard(pool_key)
+        finally:
+            self.balancing.discard(pool_key)
+
+
+class PeriodicBalancersManager(BalancersManager):
+    """
+    Balances all pools every sleep_time seconds. Pools passed to notify are
+    balanced as soon as possible, notifications that arrive within
+    balancer_notify_delay seconds are coalesced into one pass. Passes of
+    notified pools do not postpone passes of all pools.
+    """
 
-class DNRMBalancersManager(SerialBalancersManager):
     def __init__(self, queue):
-        super(DNRMBalancersManager, self).__init__()
+        super(PeriodicBalancersManager, self).__init__()
         self.queue = queue
         self.threads = []
         self.is_runned = False
+        self.waiting = False
         self.BALANCER_CLASS = importutils.import_class(CONF.balancer)
         self.SLEEP = CONF.sleep_time
+        self.notifications = eventlet_queue.LightQueue()
 
     def create_balancer(self, pool, unused_set,
                         low_watermark, high_watermark):
         return self.BALANCER_CLASS(pool, unused_set, low_watermark,
                                    high_watermark, self.queue)
 
-    def balance_pools(self):
+    def notify(self, pool_key):
+        """Wakes balancer of pool_key up."""
+        self.notifications.put(pool_key)
+
+    def wait_notifications(self, timeout=None):
+        """
+        Blocks up to timeout (sleep_time by default) seconds until some pools
+        are notified. Returns set of notified pool keys or None on timeout.
+        """
+        if timeout is None:
+            timeout = self.SLEEP
+        try:
+            pool_keys = set([self.notifications.get(timeout=timeout)])
+        except eventlet_queue.Empty:
+            return None
+        eventlet.sleep(CONF.balancer_notify_delay)
+        while not self.notifications.empty():
+            pool_keys.add(self.notifications.get_nowait())
+        return pool_keys
+
+    def balance_forever(self):
+        pool_keys = None
+        full_pass_at = None
         while True:
-            super(DNRMBalancersManager, self).balance_pools()
-            eventlet.sleep(self.SLEEP)
+            if pool_keys is None:
+                full_pass_at = time.time()
+            self.balance_pools(pool_keys)
+            if not self.is_runned:
+                return
+            self.waiting = True
+            try:
+                pool_keys = self.wait_notifications(
+                    max(full_pass_at + self.SLEEP - time.time(), 0))
+            except greenlet.GreenletExit:
+                return
+            finally:
+                self.waiting = False
+            if time.time() >= full_pass_at + self.SLEEP:
+                pool_keys = None
 
     def join(self):
         for thread in self.threads:
             thread.wait()
+        self.wait_balancers()
 
     def run(self):
         if self.is_runned:
             return
-        self.threads.append(eventlet.spawn(self.balance_pools))
         self.is_runned = True
+        self.threads.append(eventlet.spawn(self.balance_forever))
 
     def kill(self):
-        for thread in self.threads:
-            eventlet.kill(thread)
+        """
+        Stops balancing. Waiting thread is interrupted immediately, running
+        pass is finished first, join waits for it.
+        """
         self.is_runned = False
+        if self.waiting:
+            for thread in self.threads:
+                eventlet.kill(thread)
+
+
+class DNRMBalancersManager(PeriodicBalancersManager, SerialBalancersManager):
+    pass
+
+
+class ParallelDNRMBalancersManager(PeriodicBalancersManager,
+                                   ParallelBalancersManager):
+    pass
@@ -33,13 +33,54 @@ core_opts = [
                help=_("The port to bind to")),
     cfg.StrOpt('api_paste_config', default="api-paste.ini",
                help=_("The API paste config file to use")),
-    cfg.IntOpt('task_queue_timeout', default=5,
-               help=_("Number of seconds for worker to wait on task queue.")),
-    cfg.IntOpt('workers_count', default=5, help=_("Number of workers.")),
+    cfg.IntOpt('workers_count', default=5,
+               help=_("Number of workers shared by drivers without dedicated "
+                      "workers.")),
+    cfg.IntOpt('init_concurrency', default=10,
+               help=_("Number of resources of a batch initialized "
+                      "concurrently by drivers without bulk init")),
     cfg.StrOpt('balancer', default='dnrm.balancer.balancer.DNRMBalancer',
                help=_("The class of balancer")),
+    cfg.IntOpt('predictive_window', default=300,
+               help=_("Seconds of allocation history averaged by "
+                      "predictive balancer")),
+    cfg.IntOpt('predictive_boot_time', default=300,
+               help=_("Boot time in seconds assumed by predictive balancer "
+                      "until boots are observed")),
+    cfg.IntOpt('predictive_max_extra', default=10,
+               help=_("Maximum number of resources predictive balancer adds "
+                      "to low watermark of pool")),
+    cfg.FloatOpt('balancer_notify_delay', default=1,
+                 help=_("Seconds to collect pool change notifications "
+                        "before balancing notified pools")),
+    cfg.StrOpt('balancers_manager',
+               default='dnrm.balancer.manager.DNRMBalancersManager',
+               help=_("The class of balancers manager")),
+    cfg.IntOpt('balancer_concurrency', default=10,
+               help=_("Number of pools balanced concurrently by parallel "
+                      "balancers manager")),
     cfg.IntOpt('sleep_time', default=30,
                help=_("The waiting time for a thread in seconds")),
+    cfg.IntOpt('health_check_interval', default=60,
+               help=_("Seconds between health checks of pooled resources")),
+    cfg.IntOpt('health_check_concurrency', default=10,
+               help=_("Number of resources checked concurrently")),
+    cfg.IntOpt('health_check_batch_size', default=50,
+               help=_("Number of resources checked by one bulk driver "
+                      "call")),
+    cfg.IntOpt('task_priority_aging', default=60,
+               help=_("Seconds of waiting that raise task priority by one "
+                      "level")),
+    cfg.IntOpt('reaper_interval', default=60,
+               help=_("Seconds between searches for stuck resources")),
+    cfg.DictOpt('processing_deadlines',
+                default={'STARTING': '1800', 'STOPPING': '900',
+                         'WIPING': '900', 'DELETING': '900'},
+                help=_("Seconds a resource may stay in each processing "
+                       "state before it is considered stuck")),
+    cfg.BoolOpt('reaper_requeue', default=False,
+                help=_("Requeue tasks of stuck resources instead of putting "
+                       "resources to error state")),
 ]
 
 CONF.register_opts(core_opts)
@@ -45,8 +45,12 @@ def resource_create(resource_type, resource_data):
     return IMPL.resource_create(resource_type, resource_data)
 
 
-def resource_get_by_id(resource_id):
-    return IMPL.resource_get_by_id(resource_id)
+def resource_create_many(items):
+    return IMPL.resource_create_many(items)
+
+
+def resource_get_by_id(resource_id, fields=None):
+    return IMPL.resource_get_by_id(resource_id, fields)
 
 
 def resource_update(resource_id, resource_data):
@@ -61,9 +65,51 @@ def resource_find(filter_opts={}):
     return IMPL.resource_find(filter_opts)
 
 
+def resource_iter(filter_opts={}, batch_size=100):
+    return IMPL.resource_iter(filter_opts, batch_size)
+
+
 def resource_count(filter_opts={}):
     return IMPL.resource_count(filter_opts)
 
 
 def resource_compare_update(id, filters, values):
     return IMPL.resource_compare_update(id, filters, values)
+
+
+def resource_claim(filters, values, limit=None, all_or_nothing=False):
+    return IMPL.resource_claim(filters, values, limit, all_or_nothing)
+
+
+def resource_find_stuck(deadlines):
+    return IMPL.resource_find_stuck(deadlines)
+
+
+def resource_bulk_update(resource_ids, values, finish_tasks=False,
+                         deadlines=None):
+    return IMPL.resource_bulk_update(resource_ids, values, finish_tasks,
+                                     deadlines)
+
+
+def resource_stats(resource_type):
+    return IMPL.resource_stats(resource_type)
+
+
+def resource_aggregate(group_by):
+    return IMPL.resource_aggregate(group_by)
+
+
+def task_push(resource_id, filters, values, task_type, params):
+    return IMPL.task_push(resource_id, filters, values, task_type, params)
+
+
+def task_finish(task_id, resource_id, filters, values):
+    return IMPL.task_finish(task_id, resource_id, filters, values)
+
+
+def task_find(resource_ids=None):
+    return IMPL.task_find(resource_ids)
+
+
+def task_rollback(task_ids, values):
+    return IMPL.task_rollback(task_ids, values)
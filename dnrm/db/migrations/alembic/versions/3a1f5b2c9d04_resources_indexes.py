@@ -0,0 +1,48 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add indexes on resources table
+
+Revision ID: 3a1f5b2c9d04
+Revises: 18f2096048cb
+Create Date: 2026-10-17 10:12:41.218340
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3a1f5b2c9d04'
+down_revision = '18f2096048cb'
+
+from alembic import op
+
+
+INDEXES = (
+    ('ix_resources_unused', ['type', 'pool', 'allocated', 'processing',
+                             'deleted', 'status']),
+    ('ix_resources_pool', ['pool', 'allocated']),
+    ('ix_resources_status', ['status', 'processing']),
+)
+
+
+def upgrade():
+    for name, columns in INDEXES:
+        op.create_index(name, 'resources', columns)
+
+
+def downgrade():
+    for name, _columns in INDEXES:
+        op.drop_index(name, 'resources')
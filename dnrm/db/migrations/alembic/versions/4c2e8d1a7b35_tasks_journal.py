@@ -0,0 +1,47 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""add tasks journal table
+
+Revision ID: 4c2e8d1a7b35
+Revises: 3a1f5b2c9d04
+Create Date: 2026-10-17 14:02:13.530712
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4c2e8d1a7b35'
+down_revision = '3a1f5b2c9d04'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'tasks',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('resource_id', sa.String(length=36), nullable=False),
+        sa.Column('type', sa.String(length=250), nullable=False),
+        sa.Column('params', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        mysql_engine='InnoDB')
+    op.create_index('ix_tasks_resource_id', 'tasks', ['resource_id'])
+
+
+def downgrade():
+    op.drop_index('ix_tasks_resource_id', 'tasks')
+    op.drop_table('tasks')
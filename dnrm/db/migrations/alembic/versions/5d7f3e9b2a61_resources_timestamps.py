@@ -0,0 +1,54 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""add timestamps to resources table
+
+Revision ID: 5d7f3e9b2a61
+Revises: 4c2e8d1a7b35
+Create Date: 2026-10-17 16:41:05.117294
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d7f3e9b2a61'
+down_revision = '4c2e8d1a7b35'
+
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import sql
+
+
+def upgrade():
+    op.add_column('resources', sa.Column('created_at', sa.DateTime()))
+    op.add_column('resources', sa.Column('updated_at', sa.DateTime()))
+    # Existing resources count as changed at upgrade time, so they are not
+    # reported stuck at once. New resources get updated_at on insert too,
+    # reaper compares it with deadlines directly.
+    resources = sql.table('resources',
+                          sql.column('created_at', sa.DateTime()),
+                          sql.column('updated_at', sa.DateTime()))
+    now = datetime.datetime.utcnow()
+    op.execute(resources.update().values(created_at=now, updated_at=now))
+    op.create_index('ix_resources_processing', 'resources',
+                    ['processing', 'status', 'updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_resources_processing', 'resources')
+    op.drop_column('resources', 'updated_at')
+    op.drop_column('resources', 'created_at')
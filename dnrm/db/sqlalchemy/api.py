@@ -21,6 +21,7 @@ import sqlalchemy as sa
 
 from dnrm.db.sqlalchemy import models
 from dnrm.exceptions import db as exceptions
+from dnrm.openstack.common.db import exception as db_exception
 from dnrm.openstack.common.db.sqlalchemy import session as db_session
 
 
@@ -84,8 +85,14 @@ def filters_to_condition(model, filter_fields, filter_values):
 # Resources
 
 
+# Bookkeeping columns that are not exposed as resource fields.
+_HIDDEN_COLUMNS = ('created_at', 'updated_at')
+
+
 def _resource_to_dict(resource):
     resource = dict(resource)
+    for key in _HIDDEN_COLUMNS:
+        resource.pop(key, None)
     resource['class'] = resource.pop('klass')
     data = resource.pop('data', {})
     resource.update(data)
@@ -93,9 +100,48 @@ def _resource_to_dict(resource):
     return resource
 
 
+def _fields_to_columns(model, fields):
+    """Returns names of columns required to build given resource fields.
+
+    Fields that are not columns are stored in data column. Id is always
+    selected.
+    """
+    column_names = set(model.__table__.columns.keys()) - set(_HIDDEN_COLUMNS)
+    columns = set(['id'])
+    for field in fields:
+        if field == 'class':
+            field = 'klass'
+        elif field == 'unused':
+            field = 'pool'
+        if field not in column_names:
+            field = 'data'
+        columns.add(field)
+    return sorted(columns)
+
+
+def _project(query, model, columns):
+    return query.with_entities(*[getattr(model, column)
+                                 for column in columns])
+
+
+def _row_to_dict(row, columns, fields):
+    resource = dict(zip(columns, row))
+    data = resource.pop('data', None) or {}
+    if 'klass' in resource:
+        resource['class'] = resource.pop('klass')
+    if 'pool' in resource:
+        resource['unused'] = resource['pool'] is None
+    for key, value in data.items():
+        resource.setdefault(key, value)
+    fields = set(fields)
+    fields.add('id')
+    return dict((key, value) for key, value in resource.items()
+                if key in fields)
+
+
 def _update_resource(resource, values):
     values = copy.deepcopy(values)
-    for key in ('id', 'unused'):
+    for key in ('id', 'unused') + _HIDDEN_COLUMNS:
         if key in values:
             del values[key]
     if 'class' in values:
@@ -121,6 +167,71 @@ def resource_create(driver_name, values):
     return _resource_to_dict(resource)
 
 
+def _column_default(column):
+    default = column.default
+    if default is None:
+        return None
+    if default.is_callable:
+        return default.arg(None)
+    return copy.deepcopy(default.arg)
+
+
+def _resource_row(driver_name, values):
+    """Makes INSERT parameters of resource with every column set."""
+    resource = models.Resource()
+    _update_resource(resource, values)
+    resource['type'] = driver_name
+    row = {}
+    for column in models.Resource.__table__.columns:
+        value = resource[column.name]
+        if value is None:
+            value = _column_default(column)
+        if value is None and not column.nullable:
+            field = 'class' if column.name == 'klass' else column.name
+            raise exceptions.ResourceFieldRequired(field=field)
+        row[column.name] = value
+    return row
+
+
+def _resource_insert(session, row):
+    try:
+        with session.begin():
+            session.execute(models.Resource.__table__.insert(), row)
+    except db_exception.DBError as e:
+        return e
+    return row
+
+
+def resource_create_many(items):
+    """Creates resources from (driver name, values) pairs.
+
+    Rows are inserted by one executemany INSERT in one transaction. If it
+    fails, rows are inserted one by one. Returns created resources and
+    exceptions of rows that can't be inserted, in order of items.
+    """
+    results = []
+    rows = []
+    for driver_name, values in items:
+        try:
+            row = _resource_row(driver_name, values)
+        except exceptions.ResourceFieldRequired as e:
+            results.append(e)
+            continue
+        results.append(row)
+        rows.append(row)
+    if rows:
+        session = db_session.get_session()
+        try:
+            with session.begin():
+                session.execute(models.Resource.__table__.insert(), rows)
+        except db_exception.DBError:
+            results = [_resource_insert(session, result)
+                       if isinstance(result, dict) else result
+                       for result in results]
+    return [_resource_to_dict(result) if isinstance(result, dict) else result
+            for result in results]
+
+
 def _resource_get_by_id(id, session=None):
     task = (model_query(models.Resource, session=session)
             .filter_by(id=id)
@@ -130,8 +241,16 @@ def _resource_get_by_id(id, session=None):
     return task
 
 
-def resource_get_by_id(id):
-    return _resource_to_dict(_resource_get_by_id(id))
+def resource_get_by_id(id, fields=None):
+    if not fields:
+        return _resource_to_dict(_resource_get_by_id(id))
+    columns = _fields_to_columns(models.Resource, fields)
+    row = (_project(model_query(models.Resource), models.Resource, columns)
+           .filter_by(id=id)
+           .first())
+    if not row:
+        raise exceptions.ResourceNotFound(id=id)
+    return _row_to_dict(row, columns, fields)
 
 
 def resource_update(id, values):
@@ -151,35 +270,126 @@ def resource_delete(id):
 
 
 def make_query(model, search_opts, session=None):
+    """Builds query from search options.
+
+    Supported options are filters, limit, offset, marker, sort_key and
+    sort_dir. Results are sorted by sort_key and id if any of limit, marker,
+    sort_key or sort_dir is given. Marker is id of the last resource of the
+    previous page.
+    """
     search_opts = copy.deepcopy(search_opts)
 
     filters = search_opts.pop('filters', {})
     limit = search_opts.pop('limit', None)
     offset = search_opts.pop('offset', None)
+    marker = search_opts.pop('marker', None)
+    sort_key = search_opts.pop('sort_key', None)
+    sort_dir = search_opts.pop('sort_dir', None)
 
     if search_opts:
-        raise ValueError(_('Unexpected search options: %(options)s'),
-                         options=', '.join(search_opts.keys()))
+        raise ValueError(_('Unexpected search options: %s') %
+                         ', '.join(search_opts.keys()))
 
-    query = model_query(models.Resource, session=session)
+    query = model_query(model, session=session)
 
     condition = filters_to_condition(model, model.FILTER_FIELDS, filters)
 
     if condition is not None:
         query = query.filter(condition)
 
+    if any(opt is not None for opt in (limit, marker, sort_key, sort_dir)):
+        sort_keys = _sort_keys(model, sort_key)
+        if sort_dir not in (None, 'asc', 'desc'):
+            raise ValueError(_('Unknown sort direction: %s') % sort_dir)
+        marker_resource = None
+        if marker is not None:
+            marker_resource = (model_query(model, session=session)
+                               .filter_by(id=marker)
+                               .first())
+            if marker_resource is None:
+                raise exceptions.MarkerNotFound(marker=marker)
+        query = _paginate_query(query, model, limit, sort_keys,
+                                marker_resource, sort_dir)
+
     if offset is not None:
-        query = query.offset(limit)
+        query = query.offset(offset)
 
+    return query
+
+
+def _sort_keys(model, sort_key):
+    if sort_key is None or sort_key == 'id':
+        return ['id']
+    if sort_key == 'class':
+        sort_key = 'klass'
+    if sort_key not in model.FILTER_FIELDS:
+        raise ValueError(_('Invalid sort key: %s') % sort_key)
+    # Rows after marker are selected by comparison with its values, that
+    # does not work for NULL values.
+    if model.__table__.c[sort_key].nullable:
+        raise ValueError(_('Sort key may not be nullable: %s') % sort_key)
+    return [sort_key, 'id']
+
+
+def _paginate_query(query, model, limit, sort_keys, marker=None,
+                    sort_dir=None):
+    """Sorts query by sort keys and selects limit rows after marker.
+
+    Sort keys must be not nullable and last of them unique, so that rows
+    after marker are those greater (or less for desc) in sort keys order.
+    """
+    columns = [getattr(model, key) for key in sort_keys]
+    for column in columns:
+        query = query.order_by(column.desc() if sort_dir == 'desc'
+                               else column.asc())
+    if marker is not None:
+        values = [getattr(marker, key) for key in sort_keys]
+        criteria = []
+        for i, column in enumerate(columns):
+            conditions = [columns[j] == values[j] for j in xrange(i)]
+            if sort_dir == 'desc':
+                conditions.append(column < values[i])
+            else:
+                conditions.append(column > values[i])
+            criteria.append(sa.and_(*conditions))
+        query = query.filter(sa.or_(*criteria))
     if limit is not None:
         query = query.limit(limit)
-
     return query
 
 
-def resource_find(search_opts):
+def _find_query(search_opts):
+    """Returns query and function converting its rows to resource dicts.
+
+    If search options have fields, only columns needed for these fields
+    are selected.
+    """
+    search_opts = copy.deepcopy(search_opts)
+    fields = search_opts.pop('fields', None)
     query = make_query(models.Resource, search_opts)
-    return [_resource_to_dict(resource) for resource in query.all()]
+    if not fields:
+        return query, _resource_to_dict
+    columns = _fields_to_columns(models.Resource, fields)
+    query = _project(query, models.Resource, columns)
+    return query, lambda row: _row_to_dict(row, columns, fields)
+
+
+def resource_find(search_opts):
+    query, to_dict = _find_query(search_opts)
+    return [to_dict(resource) for resource in query.all()]
+
+
+def resource_iter(search_opts, batch_size=100):
+    """Returns iterator over resources fetched batch_size rows at a time.
+
+    Query is built immediately so invalid search options are reported
+    before iteration starts. Rows are streamed by server side cursor on
+    backends that support it.
+    """
+    query, to_dict = _find_query(search_opts)
+    query = (query.execution_options(stream_results=True)
+             .yield_per(batch_size))
+    return (to_dict(resource) for resource in query)
 
 
 def resource_count(search_opts):
@@ -187,15 +397,280 @@ def resource_count(search_opts):
     return query.count()
 
 
+def _column_values(values):
+    """Returns copy of values with keys mapped to resource columns.
+
+    Raises ValueError if values hold fields that are not columns.
+    """
+    values = copy.deepcopy(values)
+    if 'class' in values:
+        values['klass'] = values.pop('class')
+    unknown = set(values) - set(models.Resource.FILTER_FIELDS)
+    if unknown:
+        raise ValueError(_('Unexpected resource fields: %s') %
+                         ', '.join(unknown))
+    return values
+
+
 def resource_compare_update(id, filters, values):
+    """Updates resource if it matches filters.
+
+    Resource is updated by one conditional UPDATE statement and read back in
+    the same transaction. Returns updated resource or None if resource does
+    not exist or does not match filters. Only resource columns may be set
+    through values.
+    """
+    values = _column_values(values)
     session = db_session.get_session()
     with session.begin():
-        filters = copy.deepcopy(filters)
         query = make_query(models.Resource, {'filters': filters}, session)
-        query = query.filter(models.Resource.id == id)
-        resource = query.first()
-        if resource:
-            _update_resource(resource, values)
-            return _resource_to_dict(resource)
+        count = (query.filter(models.Resource.id == id)
+                 .update(values, synchronize_session=False))
+        if not count:
+            return None
+        resource = _resource_get_by_id(id, session=session)
+        return _resource_to_dict(resource)
+
+
+# Number of times claim is tried again when selected rows change before
+# they are updated.
+_CLAIM_ATTEMPTS = 3
+
+
+def resource_claim(filters, values, limit=None, all_or_nothing=False):
+    """Atomically select and update up to limit resources.
+
+    Rows matching filters are locked (SELECT ... FOR UPDATE on backends
+    that support it) and updated with a single UPDATE statement in the
+    same transaction. The UPDATE matches filters again, so rows changed
+    in between by backends without row locks are not claimed; claim is
+    rolled back and tried again then. ResourceClaimConflict is raised if
+    rows keep changing. If all_or_nothing is true, nothing is claimed
+    unless limit rows match. Only resource columns may be set through
+    values.
+    """
+    values = _column_values(values)
+    for attempt in xrange(_CLAIM_ATTEMPTS):
+        try:
+            return _resource_claim(filters, values, limit, all_or_nothing)
+        except exceptions.ResourceClaimConflict:
+            if attempt == _CLAIM_ATTEMPTS - 1:
+                raise
+
+
+def _resource_claim(filters, values, limit, all_or_nothing):
+    session = db_session.get_session()
+    with session.begin():
+        ids = _claim_ids(session, filters, limit)
+        if not ids or (all_or_nothing and len(ids) < limit):
+            return []
+        count = (make_query(models.Resource, {'filters': filters}, session)
+                 .filter(models.Resource.id.in_(ids))
+                 .update(values, synchronize_session=False))
+        if count != len(ids):
+            raise exceptions.ResourceClaimConflict(filters=filters)
+        query = (model_query(models.Resource, session=session)
+                 .filter(models.Resource.id.in_(ids)))
+        return [_resource_to_dict(resource) for resource in query.all()]
+
+
+def _claim_ids(session, filters, limit):
+    search_opts = {'filters': filters}
+    if limit is not None:
+        search_opts['limit'] = limit
+    query = make_query(models.Resource, search_opts, session)
+    return [row[0] for row in (query.with_entities(models.Resource.id)
+                               .with_lockmode('update')
+                               .all())]
+
+
+def resource_find_stuck(deadlines):
+    """Returns processing resources that stay in a state for too long.
+
+    Deadlines map state to time, resource in this state is stuck if it was
+    last updated before this time. Resources are created with updated_at
+    set, so the query is served by ix_resources_processing index.
+    """
+    if not deadlines:
+        return []
+    query = (model_query(models.Resource)
+             .filter(models.Resource.processing == True)
+             .filter(_stuck_condition(models.Resource, deadlines)))
+    return [_resource_to_dict(resource) for resource in query.all()]
+
+
+def _stuck_condition(model, deadlines):
+    return sa.or_(*[sa.and_(model.status == state,
+                            model.updated_at < deadline)
+                    for state, deadline in deadlines.items()])
+
+
+def resource_bulk_update(resource_ids, values, finish_tasks=False,
+                         deadlines=None):
+    """Updates processing resources with given ids by one statement.
+
+    If deadlines are given, only resources that are still stuck by them
+    (see resource_find_stuck) are updated, so resources that have moved on
+    since they were found stuck are left alone. If finish_tasks is true,
+    journaled tasks of updated resources are removed in the same
+    transaction. Returns number of updated resources.
+    """
+    if not resource_ids:
+        return 0
+    session = db_session.get_session()
+    with session.begin():
+        query = (model_query(models.Resource, session=session)
+                 .filter(models.Resource.id.in_(resource_ids))
+                 .filter(models.Resource.processing == True))
+        if deadlines:
+            query = query.filter(_stuck_condition(models.Resource,
+                                                  deadlines))
+        if finish_tasks:
+            rows = (query.with_entities(models.Resource.id)
+                    .with_lockmode('update')
+                    .all())
+            resource_ids = [row[0] for row in rows]
+            if not resource_ids:
+                return 0
+            query = (model_query(models.Resource, session=session)
+                     .filter(models.Resource.id.in_(resource_ids)))
+        count = query.update(values, synchronize_session=False)
+        if finish_tasks:
+            (model_query(models.Task, session=session)
+             .filter(models.Task.resource_id.in_(resource_ids))
+             .delete(synchronize_session=False))
+    return count
+
+
+def resource_stats(resource_type):
+    """Returns histogram of resources of given type.
+
+    Each item holds pool, status, processing, allocated and deleted values
+    of a group of resources and number of resources in this group.
+    """
+    fields = ('pool', 'status', 'processing', 'allocated', 'deleted')
+    columns = [getattr(models.Resource, field) for field in fields]
+    session = db_session.get_session()
+    query = (session.query(sa.func.count(models.Resource.id), *columns)
+             .filter(models.Resource.type == resource_type)
+             .group_by(*columns))
+    stats = []
+    for row in query.all():
+        item = dict(zip(fields, row[1:]))
+        item['count'] = row[0]
+        stats.append(item)
+    return stats
+
+
+def resource_aggregate(group_by):
+    """Returns number of resources in groups with equal group_by fields.
+
+    Group field may be any resource filter field, class or unused. Each item
+    holds values of group fields and number of resources in the group.
+    """
+    columns = []
+    for field in group_by:
+        if field == 'unused':
+            column = (models.Resource.pool == None)
+        elif field == 'class':
+            column = models.Resource.klass
+        elif field in models.Resource.FILTER_FIELDS:
+            column = getattr(models.Resource, field)
         else:
+            raise ValueError(_('Invalid group field: %s') % field)
+        columns.append(column)
+    session = db_session.get_session()
+    query = session.query(sa.func.count(models.Resource.id), *columns)
+    if columns:
+        query = query.group_by(*columns)
+    stats = []
+    for row in query.all():
+        item = dict(zip(group_by, row[1:]))
+        if 'unused' in item:
+            item['unused'] = bool(item['unused'])
+        item['count'] = row[0]
+        stats.append(item)
+    return stats
+
+
+###############################################################################
+# Tasks
+
+
+def _task_to_dict(task):
+    task = dict(task)
+    task['params'] = task['params'] or {}
+    return task
+
+
+def task_push(resource_id, filters, values, task_type, params):
+    """Updates resource if it matches filters and journals task for it.
+
+    Both changes are made in one transaction. Returns journaled task or
+    None if resource does not match filters.
+    """
+    session = db_session.get_session()
+    with session.begin():
+        query = make_query(models.Resource, {'filters': filters}, session)
+        resource = query.filter(models.Resource.id == resource_id).first()
+        if not resource:
+            return None
+        _update_resource(resource, values)
+        task = models.Task()
+        task.update({'resource_id': resource_id, 'type': task_type,
+                     'params': params})
+        session.add(task)
+    return _task_to_dict(task)
+
+
+def task_finish(task_id, resource_id, filters, values):
+    """Updates resource and removes finished task from journal.
+
+    Resource is updated only if task is still journaled and resource matches
+    filters, otherwise task has been rolled back or superseded and its
+    result is dropped. Both changes are made in one transaction. Returns
+    updated resource or None if result is dropped.
+    """
+    session = db_session.get_session()
+    with session.begin():
+        count = (model_query(models.Task, session=session)
+                 .filter_by(id=task_id)
+                 .delete(synchronize_session=False))
+        if not count:
             return None
+        query = make_query(models.Resource, {'filters': filters}, session)
+        resource = (query.filter(models.Resource.id == resource_id)
+                    .with_lockmode('update')
+                    .first())
+        if not resource:
+            return None
+        _update_resource(resource, values)
+        return _resource_to_dict(resource)
+
+
+def task_find(resource_ids=None):
+    """Returns unfinished tasks, all or only of given resources."""
+    query = model_query(models.Task)
+    if resource_ids is not None:
+        query = query.filter(models.Task.resource_id.in_(resource_ids))
+    return [_task_to_dict(task) for task in query.all()]
+
+
+def task_rollback(task_ids, values):
+    """Updates resources of tasks and removes tasks from journal.
+
+    All tasks are rolled back with two statements in one transaction.
+    """
+    if not task_ids:
+        return
+    session = db_session.get_session()
+    with session.begin():
+        tasks = (model_query(models.Task.resource_id, session=session)
+                 .filter(models.Task.id.in_(task_ids))
+                 .subquery())
+        (model_query(models.Resource, session=session)
+         .filter(models.Resource.id.in_(tasks))
+         .update(values, synchronize_session=False))
+        (model_query(models.Task, session=session)
+         .filter(models.Task.id.in_(task_ids))
+         .delete(synchronize_session=False))
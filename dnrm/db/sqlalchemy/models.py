@@ -25,6 +25,7 @@ from sqlalchemy.ext.declarative import declarative_base
 from dnrm.db.sqlalchemy import types
 from dnrm.openstack.common.db.sqlalchemy import models
 from dnrm.openstack.common.db.sqlalchemy import session as db_session
+from dnrm.openstack.common import timeutils
 from dnrm.openstack.common import uuidutils
 from dnrm.resources import base
 
@@ -58,8 +59,21 @@ class HasId(object):
                    default=uuidutils.generate_uuid)
 
 
-class Resource(BASE, DNRMBase, HasId):
+class Resource(BASE, DNRMBase, HasId, models.TimestampMixin):
     __tablename__ = 'resources'
+    __table_args__ = (
+        # Unused set and balancer statistics queries.
+        sa.Index('ix_resources_unused', 'type', 'pool', 'allocated',
+                 'processing', 'deleted', 'status'),
+        # Pool queries.
+        sa.Index('ix_resources_pool', 'pool', 'allocated'),
+        # Cleaner queries.
+        sa.Index('ix_resources_status', 'status', 'processing'),
+        # Reaper queries.
+        sa.Index('ix_resources_processing', 'processing', 'status',
+                 'updated_at'),
+        DNRMBase.__table_args__,
+    )
 
     STATES = (base.STATE_STARTED, base.STATE_STOPPED, base.STATE_ERROR,
               base.STATE_DELETED, base.STATE_STARTING, base.STATE_STOPPING,
@@ -81,3 +95,24 @@ class Resource(BASE, DNRMBase, HasId):
     processing = sa.Column(sa.Boolean, nullable=False, default=False)
     allocated = sa.Column(sa.Boolean, nullable=False, default=False)
     deleted = sa.Column(sa.Boolean, nullable=False, default=False)
+
+    # Set on insert too, so that reaper compares it with deadlines directly
+    # and its query is served by ix_resources_processing.
+    updated_at = sa.Column(sa.DateTime, default=timeutils.utcnow,
+                           onupdate=timeutils.utcnow)
+
+
+class Task(BASE, DNRMBase, HasId):
+    """Journal entry of a queued task that is not finished yet."""
+
+    __tablename__ = 'tasks'
+    __table_args__ = (
+        sa.Index('ix_tasks_resource_id', 'resource_id'),
+        DNRMBase.__table_args__,
+    )
+
+    MAX_TASK_TYPE_LENGTH = 250
+
+    resource_id = sa.Column(sa.String(UUID_LENGTH), nullable=False)
+    type = sa.Column(sa.String(MAX_TASK_TYPE_LENGTH), nullable=False)
+    params = sa.Column(types.JSON(), default={})
@@ -16,6 +16,15 @@
 #    under the License.
 import abc
 
+from eventlet import greenpool
+from oslo.config import cfg
+
+from dnrm.common import config  # noqa
+from dnrm.openstack.common import excutils
+from dnrm.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
 
 class DriverBase(object):
     """
@@ -35,6 +44,84 @@ class DriverBase(object):
         """
         pass
 
+    def init_many(self, resources):
+        """
+        Initializes several previously stopped resources at once. E.g. boot
+        several virtual machines with one Nova request. Returns list of
+        exceptions in order of resources, None for initialized resources.
+        By default resources are initialized by at most init_concurrency
+        concurrent init calls.
+        """
+        pool = greenpool.GreenPool(cfg.CONF.init_concurrency)
+        return list(pool.imap(self._try_init, resources))
+
+    def _try_init(self, resource):
+        try:
+            self.init(resource)
+        except Exception as e:
+            return e
+        return None
+
+    def begin_init(self, resource):
+        """
+        Optional asynchronous variant of init. Starts initialization of
+        resource and returns handle that is passed to poll, or None if driver
+        initializes resources with init only. Driver that overrides
+        begin_init must override poll too.
+
+        Values put to resource by begin_init are saved before the first
+        poll. They should identify whatever was created on backend, e.g.
+        instance id, so that initialization interrupted by restart may be
+        continued by resume_init.
+        """
+        return None
+
+    def poll(self, resource, handle):
+        """
+        Continues initialization started by begin_init. Returns number of
+        seconds before next poll or None when resource is initialized.
+        Throws exception if initialization failed.
+        """
+        raise NotImplementedError()
+
+    def begin_init_many(self, resources):
+        """
+        Optional asynchronous variant of init_many. Starts initialization of
+        several resources at once and returns list of handles that are
+        passed to poll, in order of resources, or None if driver initializes
+        resources with init_many only. Values put to resources are saved
+        before the first poll, like with begin_init.
+        By default initialization of each resource is started by begin_init,
+        resources started before failed one are stopped.
+        """
+        handles = []
+        for resource in resources:
+            try:
+                handle = self.begin_init(resource)
+            except Exception:
+                with excutils.save_and_reraise_exception():
+                    for started in resources[:len(handles)]:
+                        self._try_stop(started)
+            if handle is None:
+                # Driver without begin_init, nothing has been started.
+                return None
+            handles.append(handle)
+        return handles
+
+    def _try_stop(self, resource):
+        try:
+            self.stop(resource)
+        except Exception:
+            LOG.exception(_('Failed to stop resource %s') % resource.get('id'))
+
+    def resume_init(self, resource):
+        """
+        Continues initialization started by begin_init before restart.
+        Returns handle that is passed to poll, or None if initialization of
+        resource can not be resumed.
+        """
+        return None
+
     @abc.abstractmethod
     def stop(self, resource):
         """
@@ -61,6 +148,23 @@ class DriverBase(object):
         """
         pass
 
+    def check_many(self, resources):
+        """
+        Checks several resources at once. Returns list of exceptions in
+        order of resources, None for resources that are ok. By default
+        resources are checked by at most health_check_concurrency concurrent
+        check calls.
+        """
+        pool = greenpool.GreenPool(cfg.CONF.health_check_concurrency)
+        return list(pool.imap(self._try_check, resources))
+
+    def _try_check(self, resource):
+        try:
+            self.check(resource)
+        except Exception as e:
+            return e
+        return None
+
     @abc.abstractmethod
     def validate_resource(self, resource):
         """
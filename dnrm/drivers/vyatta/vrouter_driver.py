@@ -14,20 +14,33 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import collections
+import contextlib
 import httplib
 import netaddr
 import os
+import random
 import socket
 import time
 
+from eventlet import event
+from eventlet import greenpool
 from eventlet import greenthread
+from eventlet import semaphore
+from novaclient import exceptions as nova_exceptions
 from novaclient.v1_1 import client as novaclient
 from oslo.config import cfg
 
 from dnrm.drivers import base
 from dnrm import exceptions
+from dnrm.openstack.common import excutils
+from dnrm.openstack.common import importutils
+from dnrm.openstack.common import log
+from dnrm.openstack.common import timeutils
 from dnrm.resources import base as resources
 
+LOG = log.getLogger(__name__)
+
 
 cfg.CONF.register_opts([
     cfg.IntOpt('api_port', default=5000,
@@ -53,15 +66,52 @@ cfg.CONF.register_opts([
     cfg.IntOpt('nova_poll_interval', default=5,
                help=_('Number of seconds between consecutive Nova queries '
                       'when waitong for server status change.')),
+    cfg.IntOpt('nova_page_size', default=1000,
+               help=_('Number of Nova servers requested in one page when '
+                      'polling server statuses, must not exceed Nova '
+                      'osapi_max_limit.')),
+    cfg.IntOpt('nova_get_limit', default=3,
+               help=_('Maximum number of booting Nova servers that are '
+                      'polled with one request per server. More servers are '
+                      'polled by listing servers changed since the oldest '
+                      'boot started.')),
     cfg.IntOpt('nova_spawn_timeout', default=600,
                help=_('Number of seconds to wait for Nova to activate '
                       'instance before setting resource to error state.')),
     cfg.IntOpt('vrouter_poll_interval', default=5,
-               help=_('Number of seconds between consecutive Vyatta vRouter '
-                      'queries when waitong for server boot.')),
+               help=_('Initial number of seconds between consecutive Vyatta '
+                      'vRouter queries when waitong for server boot.')),
+    cfg.StrOpt('poll_backoff_policy',
+               default='dnrm.drivers.vyatta.vrouter_driver.BackoffPolicy',
+               help=_('The class of policy that computes intervals between '
+                      'Vyatta vRouter queries.')),
+    cfg.FloatOpt('poll_backoff_multiplier', default=1.5,
+                 help=_('Factor that each next interval between Vyatta '
+                        'vRouter queries is multiplied by.')),
+    cfg.FloatOpt('poll_backoff_cap', default=30,
+                 help=_('Maximum number of seconds between Vyatta vRouter '
+                        'queries, 0 means no limit.')),
+    cfg.FloatOpt('poll_backoff_jitter', default=0.1,
+                 help=_('Fraction of interval between Vyatta vRouter queries '
+                        'that is randomly added or subtracted.')),
+    cfg.IntOpt('boot_history_size', default=10,
+               help=_('Number of recent Vyatta vRouter boot durations used '
+                      'to schedule first query of booting server.')),
     cfg.IntOpt('vrouter_boot_timeout', default=600,
                help=_('Number of seconds to wait for Vyatta vRouter to boot '
                       'before setting resource to error state.')),
+    cfg.FloatOpt('api_connect_timeout', default=5,
+                 help=_('Number of seconds to wait for connection to '
+                        'Vyatta vRouter API proxy.')),
+    cfg.FloatOpt('api_read_timeout', default=10,
+                 help=_('Number of seconds to wait for response from '
+                        'Vyatta vRouter API proxy.')),
+    cfg.IntOpt('api_check_concurrency', default=20,
+               help=_('Maximum number of Vyatta vRouter API proxies '
+                      'checked concurrently.')),
+    cfg.IntOpt('keystone_token_expiry_window', default=60,
+               help=_('Number of seconds before Keystone token expiration '
+                      'when cached Nova client is reauthenticated.')),
 ], "VROUTER")
 
 
@@ -82,6 +132,316 @@ class InstanceBootTimeout(exceptions.DriverException):
     message = _("Timeout waiting for instance to boot.")
 
 
+# Nova errors after which cached client is dropped, so that next call
+# connects and authenticates anew.
+NOVA_CLIENT_ERRORS = (nova_exceptions.Unauthorized,
+                      nova_exceptions.ConnectionRefused,
+                      socket.error)
+
+
+class NovaClientCache(object):
+    """
+    Shares one authenticated Nova client between all driver calls.
+    Client is reauthenticated when its Keystone token is about to expire.
+    Requests rejected with 401 are reauthenticated by the client itself,
+    callers invalidate cache when client fails with one of
+    NOVA_CLIENT_ERRORS anyway.
+    """
+
+    def __init__(self, factory, expiry_window=0):
+        self._factory = factory
+        self._expiry_window = expiry_window
+        self._client = None
+        self._expires = None
+        self._lock = semaphore.Semaphore()
+
+    def get(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._factory()
+                self._authenticate()
+            elif (self._expires is not None and
+                  timeutils.is_soon(self._expires, self._expiry_window)):
+                self._authenticate()
+            return self._client
+
+    def invalidate(self):
+        with self._lock:
+            self._client = None
+            self._expires = None
+
+    def _authenticate(self):
+        try:
+            self._client.client.unauthenticate()
+            self._client.authenticate()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self._client = None
+                self._expires = None
+        self._expires = self._token_expires()
+
+    def _token_expires(self):
+        try:
+            catalog = self._client.client.service_catalog.catalog
+            return timeutils.parse_isotime(
+                catalog['access']['token']['expires'])
+        except Exception:
+            return None
+
+
+class ServerStatusPoller(object):
+    """
+    Waits for Nova servers to become active. Up to get_limit servers being
+    waited on are requested one by one each interval. More servers are
+    polled with one listing of servers changed since the oldest waiter
+    started, so number of requests does not depend on number of concurrent
+    waiters. If client_error is given it is called when Nova client fails
+    with one of NOVA_CLIENT_ERRORS.
+    """
+
+    def __init__(self, client_getter, interval, page_size=1000,
+                 client_error=None, get_limit=3):
+        self._client_getter = client_getter
+        self._client_error = client_error
+        self._interval = interval
+        self._page_size = page_size
+        self._get_limit = get_limit
+        self._waiters = {}
+        self._running = False
+
+    def wait(self, server_id, timeout=0):
+        """
+        Blocks until server becomes active and returns it. Raises
+        InstanceSpawnError if server goes to error state and
+        InstanceBootTimeout if it is not active after timeout seconds.
+        """
+        return self.watch(server_id, timeout).wait()
+
+    def watch(self, server_id, timeout=0):
+        """
+        Starts waiting for server without blocking. Returns event that is
+        sent the same result wait would return. Server should be watched
+        before Nova activates it, e.g. right after it is created.
+        """
+        waiter = event.Event()
+        deadline = time.time() + timeout if timeout > 0 else None
+        self._waiters[server_id] = (waiter, deadline, timeutils.utcnow())
+        if not self._running:
+            self._running = True
+            greenthread.spawn_n(self._run)
+        return waiter
+
+    def _run(self):
+        try:
+            while self._waiters:
+                greenthread.sleep(self._interval)
+                self._poll()
+        finally:
+            self._running = False
+
+    def _poll(self):
+        try:
+            servers = self._get_servers()
+        except Exception:
+            LOG.exception(_('Failed to get Nova servers.'))
+            servers = {}
+        now = time.time()
+        for server_id, (waiter, deadline, _started) in self._waiters.items():
+            server = servers.get(server_id)
+            if server is not None and server.status == 'ACTIVE':
+                del self._waiters[server_id]
+                waiter.send(server)
+            elif server is not None and server.status == 'ERROR':
+                del self._waiters[server_id]
+                waiter.send_exception(InstanceSpawnError())
+            elif deadline is not None and now >= deadline:
+                del self._waiters[server_id]
+                waiter.send_exception(InstanceBootTimeout())
+
+    def _get_servers(self):
+        """Returns servers being waited on that Nova knows, by id."""
+        if not self._waiters:
+            return {}
+        client = self._client_getter()
+        try:
+            if len(self._waiters) <= self._get_limit:
+                return self._get_each(client)
+            return self._list_changed(client)
+        except NOVA_CLIENT_ERRORS:
+            with excutils.save_and_reraise_exception():
+                if self._client_error is not None:
+                    self._client_error()
+
+    def _get_each(self, client):
+        servers = {}
+        for server_id in self._waiters.keys():
+            try:
+                servers[server_id] = client.servers.get(server_id)
+            except nova_exceptions.NotFound:
+                pass
+        return servers
+
+    def _list_changed(self, client):
+        # Nova can't filter servers by list of ids. Servers are activated
+        # after they are watched, so servers not changed since the oldest
+        # waiter started are skipped.
+        since = min(started for _waiter, _deadline, started
+                    in self._waiters.values())
+        servers = {}
+        marker = None
+        while True:
+            search_opts = {'limit': self._page_size,
+                           'changes-since': timeutils.isotime(since)}
+            if marker is not None:
+                search_opts['marker'] = marker
+            page = client.servers.list(search_opts=search_opts)
+            for server in page:
+                servers[server.id] = server
+            if len(page) < self._page_size:
+                return servers
+            marker = page[-1].id
+
+
+class InstanceProber(object):
+    """
+    Checks whether Vyatta vRouter API proxies are up. Connections to proxies
+    are kept alive and reused for subsequent checks of the same address.
+    """
+
+    def __init__(self, port, connect_timeout=None, read_timeout=None,
+                 concurrency=1):
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.concurrency = concurrency
+        self._idle = collections.defaultdict(list)
+
+    def probe(self, address):
+        """
+        Returns True if API proxy on address is up. Kept alive connections
+        to proxy that failed are dropped.
+        """
+        idle = self._idle.get(address)
+        if idle:
+            conn = idle.pop()
+            if not idle:
+                self._idle.pop(address, None)
+            alive = self._request(address, conn)
+            if alive is not None:
+                return alive
+            # Kept alive connection was closed by proxy, retry with new one.
+        conn = self._connect(address)
+        if not conn:
+            self.forget(address)
+            return False
+        return bool(self._request(address, conn))
+
+    def probe_many(self, addresses, concurrency=None):
+        """
+        Probes addresses concurrently, returns address to status map. At most
+        concurrency probes run at once, never more than concurrency of
+        prober.
+        """
+        addresses = list(set(addresses))
+        if concurrency is None:
+            concurrency = self.concurrency
+        pool = greenpool.GreenPool(min(concurrency, self.concurrency))
+        return dict(zip(addresses, pool.imap(self.probe, addresses)))
+
+    def forget(self, address):
+        """Closes kept alive connections to address."""
+        for conn in self._idle.pop(address, []):
+            conn.close()
+
+    def _connect(self, address):
+        try:
+            conn = httplib.HTTPConnection(address, self.port,
+                                          timeout=self.connect_timeout)
+            conn.connect()
+            if self.read_timeout is not None:
+                conn.sock.settimeout(self.read_timeout)
+            return conn
+        except (socket.timeout, socket.error):
+            return None
+
+    def _request(self, address, conn):
+        """
+        Returns True if proxy is up, False if it is down or does not respond
+        in time and None if connection was broken.
+        """
+        try:
+            conn.request('GET', '/v2.0/router')
+            response = conn.getresponse()
+            response.read()
+        except socket.timeout:
+            conn.close()
+            self.forget(address)
+            return False
+        except (socket.error, httplib.HTTPException):
+            conn.close()
+            self.forget(address)
+            return None
+        if response.will_close:
+            conn.close()
+        else:
+            self._idle[address].append(conn)
+        return response.status == 401
+
+
+class BackoffPolicy(object):
+    """
+    Computes intervals between consecutive queries. Intervals start with
+    initial and grow by multiplier up to cap. Each interval is randomized
+    by jitter fraction so that queries of servers booted together spread.
+    """
+
+    def __init__(self, initial, multiplier=1, cap=0, jitter=0):
+        self.initial = initial
+        self.multiplier = multiplier
+        self.cap = cap
+        self.jitter = jitter
+
+    def intervals(self):
+        """Returns endless iterator over intervals."""
+        interval = self.initial
+        while True:
+            yield interval * (1 + random.uniform(-self.jitter, self.jitter))
+            interval *= self.multiplier
+            if self.cap > 0:
+                interval = min(interval, self.cap)
+
+
+class BootHistory(object):
+    """Keeps durations of recent boots to predict duration of next one."""
+
+    def __init__(self, size):
+        self._durations = collections.deque(maxlen=size)
+
+    def add(self, duration):
+        self._durations.append(duration)
+
+    def expected(self):
+        """
+        Returns shortest recent boot duration, so that first query does not
+        come later than server may be ready, or None if nothing was observed.
+        """
+        if not self._durations:
+            return None
+        return min(self._durations)
+
+
+class InitHandle(object):
+    """State of asynchronous Vyatta vRouter instance initialization."""
+
+    def __init__(self, server, spawned):
+        self.server = server
+        self.spawned = spawned
+        self.address = None
+        self.deadline = None
+        self.boot_started = None
+        self.intervals = None
+
+
 class VyattaVRouterDriver(base.DriverBase):
     resource_class = 'L3'
 
@@ -100,55 +460,98 @@ class VyattaVRouterDriver(base.DriverBase):
         self.nova_timeout = cfg.CONF.VROUTER.nova_spawn_timeout
         self.vrouter_timeout = cfg.CONF.VROUTER.vrouter_boot_timeout
         self.api_port = cfg.CONF.VROUTER.api_port
+        self.nova_clients = NovaClientCache(
+            self._create_nova_client,
+            cfg.CONF.VROUTER.keystone_token_expiry_window)
+        self.server_poller = ServerStatusPoller(
+            self._nova_client, self.nova_interval,
+            cfg.CONF.VROUTER.nova_page_size, self.nova_clients.invalidate,
+            cfg.CONF.VROUTER.nova_get_limit)
+        self.prober = InstanceProber(
+            self.api_port, cfg.CONF.VROUTER.api_connect_timeout,
+            cfg.CONF.VROUTER.api_read_timeout,
+            cfg.CONF.VROUTER.api_check_concurrency)
+        policy_class = importutils.import_class(
+            cfg.CONF.VROUTER.poll_backoff_policy)
+        self.boot_backoff = policy_class(
+            self.vrouter_interval, cfg.CONF.VROUTER.poll_backoff_multiplier,
+            cfg.CONF.VROUTER.poll_backoff_cap,
+            cfg.CONF.VROUTER.poll_backoff_jitter)
+        self.boot_history = BootHistory(cfg.CONF.VROUTER.boot_history_size)
 
     def init(self, resource):
-        name = 'vrouter_{0}'.format(os.urandom(6).encode('hex'))
-        client = self._nova_client()
-        server = client.servers.create(name, self.image_id, self.flavor,
-                                       nics=[{'net-id': self.net_id}])
-
-        # Wait for Nova to start to boot VM instance
-        def server_active():
-            while True:
-                try:
-                    updated = client.servers.get(server.id)
-                except Exception:
-                    yield self.nova_interval
-                    continue
-                if updated.status not in ('ACTIVE', 'ERROR'):
-                    yield self.nova_interval
-                elif updated.status == 'ERROR':
-                    raise InstanceSpawnError()
-                else:
-                    break
-        self._wait(server_active, timeout=self.nova_timeout)
+        handle = self.begin_init(resource)
+        # Server poller wakes us up when Nova activates server, boot of
+        # vRouter is polled then.
+        handle.spawned.wait()
+        interval = self.poll(resource, handle)
+        while interval is not None:
+            greenthread.sleep(interval)
+            interval = self.poll(resource, handle)
 
-        # When VM is ready we can get list of attached interfaces and retreive
-        # IP address
-        interfaces = server.interface_list()
-        if len(interfaces) != 1:
-            # TODO(anfrolov): replace by meaningful exception
-            raise InvalidInstanceConfiguration(
-                cause=_("number of interfaces = %s") % len(interfaces))
-        fixed_ips = interfaces[0].fixed_ips
-        if len(fixed_ips) != 1:
-            raise InvalidInstanceConfiguration(
-                cause=_("number of fixed ips = %s") % len(fixed_ips))
-        address = fixed_ips[0]['ip_address']
+    def begin_init(self, resource):
+        server = self._create_server()
         resource['instance_id'] = server.id
-        resource['address'] = address
+        spawned = self.server_poller.watch(server.id,
+                                           timeout=self.nova_timeout)
+        return InitHandle(server, spawned)
+
+    def begin_init_many(self, resources):
+        servers = self._create_servers(len(resources))
+        handles = []
+        for resource, server in zip(resources, servers):
+            resource['instance_id'] = server.id
+            spawned = self.server_poller.watch(server.id,
+                                               timeout=self.nova_timeout)
+            handles.append(InitHandle(server, spawned))
+        return handles
 
-        # Now wait for server to boot
-        def server_boot():
-            while not self._check_instance(address):
-                yield self.vrouter_interval
-        self._wait(server_boot, timeout=self.vrouter_timeout)
+    def resume_init(self, resource):
+        instance_id = resource.get('instance_id')
+        if instance_id is None:
+            return None
+        with self._nova() as client:
+            server = client.servers.get(instance_id)
+        spawned = self.server_poller.watch(server.id,
+                                           timeout=self.nova_timeout)
+        return InitHandle(server, spawned)
+
+    def poll(self, resource, handle):
+        if handle.address is None:
+            if not handle.spawned.ready():
+                return self.nova_interval
+            # Raises exception sent by server poller if spawn failed.
+            handle.spawned.wait()
+            handle.address = self._set_address(resource, handle.server)
+            handle.boot_started = time.time()
+            handle.deadline = handle.boot_started + self.vrouter_timeout
+            handle.intervals = self.boot_backoff.intervals()
+            expected = self.boot_history.expected()
+            if expected:
+                return expected
+        if self._check_instance(handle.address):
+            self.boot_history.add(time.time() - handle.boot_started)
+            return None
+        if self.vrouter_timeout > 0 and time.time() >= handle.deadline:
+            raise InstanceBootTimeout()
+        return handle.intervals.next()
 
     def stop(self, resource):
-        client = self._nova_client()
-        client.servers.delete(resource['instance_id'])
-        del resource['instance_id']
-        del resource['address']
+        self.prober.forget(resource.get('address'))
+        instance_id = resource.get('instance_id')
+        if instance_id is not None:
+            with self._nova() as client:
+                try:
+                    client.servers.delete(instance_id)
+                except nova_exceptions.NotFound:
+                    # Stop may be restored from task journal after instance
+                    # was deleted.
+                    LOG.info(_('Instance %s is already deleted.') %
+                             instance_id)
+        # Values are cleared rather than removed, so that they are cleared
+        # in database too.
+        resource['instance_id'] = None
+        resource['address'] = None
 
     def wipe(self, resource):
         # TODO(anfrolov): Implement when wipe will be implemented in proxy
@@ -165,6 +568,26 @@ class VyattaVRouterDriver(base.DriverBase):
         if not self._check_instance(address):
             raise exceptions.ResourceCheckFailed(error='failed to connect')
 
+    def check_many(self, items):
+        errors = [None] * len(items)
+        addresses = {}
+        for i, resource in enumerate(items):
+            if resource['status'] != resources.STATE_STARTED:
+                continue
+            try:
+                self._validate_address(resource['address'])
+            except Exception as ex:
+                errors[i] = exceptions.ResourceCheckFailed(error=str(ex))
+                continue
+            addresses[i] = resource['address']
+        alive = self.prober.probe_many(addresses.values(),
+                                       cfg.CONF.health_check_concurrency)
+        for i, address in addresses.items():
+            if not alive[address]:
+                errors[i] = exceptions.ResourceCheckFailed(
+                    error='failed to connect')
+        return errors
+
     def validate_resource(self, resource):
         if resource['status'] == resources.STATE_STARTED:
             # Check address
@@ -197,32 +620,92 @@ class VyattaVRouterDriver(base.DriverBase):
             raise NotImplementedError()
 
     def _nova_client(self):
-        # TODO(anfrolov): cache keystone token
+        return self.nova_clients.get()
+
+    @contextlib.contextmanager
+    def _nova(self):
+        """
+        Yields cached Nova client. Cache is invalidated if client fails with
+        one of NOVA_CLIENT_ERRORS.
+        """
+        client = self._nova_client()
+        try:
+            yield client
+        except NOVA_CLIENT_ERRORS:
+            with excutils.save_and_reraise_exception():
+                self.nova_clients.invalidate()
+
+    def _create_nova_client(self):
         return novaclient.Client(
             self.admin_login, self.admin_password, None, self.keystone_url,
             service_type='compute', tenant_id=self.tenant)
 
-    def _wait(self, query_fn, timeout=0):
-        # TODO(anfrolov): Implement when TaskQueue will be ready
-        end = time.time() + timeout
-        for interval in query_fn():
-            greenthread.sleep(interval)
-            if timeout > 0 and time.time() >= end:
-                raise InstanceBootTimeout()
+    def _create_server(self):
+        with self._nova() as client:
+            return client.servers.create(self._server_name(), self.image_id,
+                                         self.flavor,
+                                         nics=[{'net-id': self.net_id}])
 
-    def _check_instance(self, address):
-        conn = httplib.HTTPConnection(address, self.api_port)
-        if not conn:
-            return False
+    def _create_servers(self, count):
+        name = self._server_name()
+        with self._nova() as client:
+            client.servers.create(name, self.image_id, self.flavor,
+                                  nics=[{'net-id': self.net_id}],
+                                  min_count=count, max_count=count)
+        # Servers are not bound to resources until they are found, nothing
+        # would delete them later.
         try:
-            conn.request('GET', '/v2.0/router')
-            response = conn.getresponse()
-            if response.status == 401:
-                return True
-        except (socket.timeout, socket.error):
-            return False
-        finally:
-            conn.close()
+            servers = self._find_servers(name)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                LOG.error(_('Failed to find created instances, instances '
+                            'named %s have to be deleted manually.') % name)
+        if len(servers) != count:
+            client = self._nova_client()
+            for server in servers:
+                try:
+                    client.servers.delete(server.id)
+                except Exception:
+                    LOG.exception(_('Failed to delete instance %s.') %
+                                  server.id)
+            raise InstanceSpawnError()
+        return servers
+
+    def _find_servers(self, name):
+        # Nova returns only first of created servers, all of them are found
+        # by unique name prefix. Lookup that failed because of client is
+        # retried once with new client.
+        try:
+            with self._nova() as client:
+                return client.servers.list(search_opts={'name': name})
+        except NOVA_CLIENT_ERRORS:
+            LOG.exception(_('Failed to find instances named %s, '
+                            'retrying.') % name)
+        with self._nova() as client:
+            return client.servers.list(search_opts={'name': name})
+
+    def _server_name(self):
+        return 'vrouter_{0}'.format(os.urandom(6).encode('hex'))
+
+    def _set_address(self, resource, server):
+        # When VM is ready we can get list of attached interfaces and retreive
+        # IP address
+        interfaces = server.interface_list()
+        if len(interfaces) != 1:
+            # TODO(anfrolov): replace by meaningful exception
+            raise InvalidInstanceConfiguration(
+                cause=_("number of interfaces = %s") % len(interfaces))
+        fixed_ips = interfaces[0].fixed_ips
+        if len(fixed_ips) != 1:
+            raise InvalidInstanceConfiguration(
+                cause=_("number of fixed ips = %s") % len(fixed_ips))
+        address = fixed_ips[0]['ip_address']
+        resource['instance_id'] = server.id
+        resource['address'] = address
+        return address
+
+    def _check_instance(self, address):
+        return self.prober.probe(address)
 
     def _validate_address(self, address):
         try:
@@ -20,3 +20,16 @@ from dnrm.exceptions import base
 
 class ResourceNotFound(base.SupervisorException):
     message = _('Resource with id %(id)s not found.')
+
+
+class MarkerNotFound(base.SupervisorException):
+    message = _('Marker %(marker)s not found.')
+
+
+class ResourceFieldRequired(base.SupervisorException):
+    message = _('Resource field %(field)s is required.')
+
+
+class ResourceClaimConflict(base.SupervisorException):
+    message = _('Resources matching %(filters)s kept changing while they '
+                'were claimed.')
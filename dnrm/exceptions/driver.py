@@ -31,3 +31,8 @@ class ResourceCheckFailed(DriverException):
 
 class InvalidDriverName(DriverException):
     message = _('Invalid driver name: %(driver_name)s')
+
+
+class InitNotResumable(DriverException):
+    message = _('Interrupted initialization of resource %(resource_id)s can '
+                'not be resumed.')
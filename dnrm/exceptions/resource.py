@@ -36,3 +36,13 @@ class ResourceAllocated(base.SupervisorException):
 
 class ResourceProcessing(base.SupervisorException):
     message = _("Resource %(resource_id)s is processed.")
+
+
+class PoolExhausted(base.SupervisorException):
+    message = _("Pool %(driver_name)s has %(available)d of %(count)d "
+                "requested resources.")
+
+
+class ResourceUpdateConflict(base.SupervisorException):
+    message = _("Resource %(resource_id)s kept changing while it was "
+                "updated.")
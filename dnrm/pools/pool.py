@@ -30,15 +30,16 @@ class Pool(object):
                                          'processing': False})
 
     def pop(self, count=1, processing=True):
-        search_opts = {'filters': {'pool': self.name, 'allocated': False}}
-        if count is not None:
-            search_opts['limit'] = count
-        resources = db.resource_find(search_opts)
-        for resource in resources:
-            resource.update(db.resource_update(resource['id'],
-                                               {'pool': None,
-                                                'processing': processing}))
-        return resources
+        return db.resource_claim({'pool': self.name, 'allocated': False},
+                                 {'pool': None, 'processing': processing},
+                                 count)
+
+    def allocate(self, count=1):
+        """Allocates count resources, or none if pool has fewer."""
+        return db.resource_claim({'pool': self.name, 'allocated': False,
+                                  'processing': False},
+                                 {'allocated': True}, count,
+                                 all_or_nothing=True)
 
     def list(self):
         resources = db.resource_find({'filters': {'pool': self.name,
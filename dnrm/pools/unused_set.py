@@ -23,10 +23,8 @@ class UnusedSet(object):
         self.driver_factory = driver_factory
 
     def get(self, state, count=None):
-        resources = self.list(state, count)
-        for resource in resources:
-            res = db.resource_update(resource['id'], {'processing': True})
-            resource.update(res)
+        resources = db.resource_claim(self._filters(state),
+                                      {'processing': True}, count)
         if len(resources) < (count or 0):
             try:
                 for _i in xrange(count - len(resources)):
@@ -40,9 +38,7 @@ class UnusedSet(object):
         return resources
 
     def list(self, state, count=None):
-        filter_opts = {'filters': {'type': self.driver_name, 'pool': None,
-                                   'allocated': False, 'processing': False,
-                                   'deleted': False, 'status': state}}
+        filter_opts = {'filters': self._filters(state)}
         if count is not None:
             filter_opts['limit'] = count
         resources = db.resource_find(filter_opts)
@@ -55,3 +51,10 @@ class UnusedSet(object):
                                    'allocated': False, 'status': state,
                                    'processing': processing, 'deleted': False}}
         return db.resource_count(filter_opts)
+
+    def stats(self):
+        return db.resource_stats(self.driver_name)
+
+    def _filters(self, state):
+        return {'type': self.driver_name, 'pool': None, 'allocated': False,
+                'processing': False, 'deleted': False, 'status': state}
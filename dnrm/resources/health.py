@@ -0,0 +1,123 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import collections
+import time
+
+import eventlet
+from oslo.config import cfg
+
+from dnrm import db
+from dnrm import exceptions
+from dnrm.openstack.common import log
+from dnrm.resources import base
+
+CONF = cfg.CONF
+LOG = log.getLogger(__name__)
+
+
+class HealthChecker(object):
+    """
+    Periodically checks started resources that wait in pools and moves
+    resources that failed the check out of pool into error state.
+    """
+
+    def __init__(self, driver_factory):
+        self._driver_factory = driver_factory
+        self._running = False
+        self.last_sweep = None
+
+    def run(self):
+        while self._running:
+            try:
+                self.sweep()
+            except Exception:
+                LOG.exception(_('Health check sweep failed'))
+            eventlet.sleep(CONF.health_check_interval)
+
+    def sweep(self):
+        """Checks all pooled resources once, returns sweep statistics."""
+        started_at = time.time()
+        batch_size = CONF.health_check_batch_size
+        marker = None
+        checked = 0
+        failed = 0
+        while True:
+            search_opts = {'filters': {'unused': False, 'allocated': False,
+                                       'processing': False, 'deleted': False,
+                                       'status': base.STATE_STARTED},
+                           'limit': batch_size}
+            if marker is not None:
+                search_opts['marker'] = marker
+            try:
+                batch = db.resource_find(search_opts)
+            except exceptions.MarkerNotFound:
+                # Last checked resource is gone, the rest is checked by next
+                # sweep.
+                break
+            checked += len(batch)
+            for resource in self._check_batch(batch):
+                if self._fail(resource):
+                    failed += 1
+            if len(batch) < batch_size:
+                break
+            marker = batch[-1]['id']
+        self.last_sweep = {'duration': time.time() - started_at,
+                           'checked': checked,
+                           'failed': failed}
+        LOG.info(_('Health check sweep: %(checked)d checked, %(failed)d '
+                   'failed in %(duration).3f seconds') % self.last_sweep)
+        return self.last_sweep
+
+    def _check_batch(self, batch):
+        """Checks resources with bulk driver calls, returns failed ones."""
+        by_type = collections.defaultdict(list)
+        for resource in batch:
+            by_type[resource['type']].append(resource)
+        failed = []
+        for resource_type, resources in by_type.items():
+            try:
+                driver = self._driver_factory.get(resource_type)
+                errors = driver.check_many(resources)
+            except Exception as e:
+                errors = [e] * len(resources)
+            for resource, error in zip(resources, errors):
+                if error is not None:
+                    LOG.warning(_('Resource %(id)s failed health check: '
+                                  '%(error)s') % {'id': resource['id'],
+                                                  'error': str(error)})
+                    failed.append(resource)
+        return failed
+
+    def _fail(self, resource):
+        # Resource may be taken from pool while it was checked.
+        result = db.resource_compare_update(
+            resource['id'],
+            {'pool': resource['pool'], 'allocated': False,
+             'processing': False, 'status': base.STATE_STARTED},
+            {'pool': None, 'status': base.STATE_ERROR})
+        if result is not None:
+            LOG.debug(_('Resource state change: %(id)s/%(status)s') % result)
+        return result is not None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        eventlet.spawn_n(self.run)
+
+    def stop(self):
+        self._running = False
@@ -16,22 +16,26 @@
 #    under the License.
 from oslo.config import cfg
 
-from dnrm.balancer import manager as balancer
 from dnrm.common import config
 from dnrm.common import singleton
 from dnrm import db
 from dnrm.drivers import factory as driver_factory
 
 from dnrm import exceptions
+from dnrm.openstack.common import importutils
 from dnrm.pools import pool
 from dnrm.pools import unused_set
 from dnrm.resources import base as resources
 from dnrm.resources import cleaner
+from dnrm.resources import health
+from dnrm.resources import reaper
 from dnrm import task_queue
 from dnrm import tasks
 
 CONF = cfg.CONF
 
+_UPDATE_ATTEMPTS = 3
+
 
 class ResourceManager(object):
     __metaclass__ = singleton.Singleton
@@ -39,15 +43,22 @@ class ResourceManager(object):
     def __init__(self):
         self.driver_factory = driver_factory.DriverFactory()
 
-        self.task_queue = task_queue.TaskQueue()
+        lanes = {}
+        for driver_name in config.get_drivers_names():
+            conf = config.get_driver_config(driver_name)
+            if 'workers_count' in conf:
+                lanes[driver_name] = int(conf['workers_count'])
+        self.task_queue = task_queue.TaskQueue(lanes)
+        self.task_queue.restore()
+        manager_class = importutils.import_class(CONF.balancers_manager)
+        self.balancer_manager = manager_class(self.task_queue)
+
+        self.task_poller = task_queue.TaskPoller(self.driver_factory)
         self.task_workers = []
-        for _i in xrange(CONF.workers_count):
-            t = task_queue.QueuedTaskWorker(self.task_queue,
-                                            self.driver_factory)
-            self.task_workers.append(t)
-            t.start()
+        self._start_workers(None, CONF.workers_count)
+        for driver_name, workers_count in lanes.items():
+            self._start_workers(driver_name, workers_count)
 
-        self.balancer_manager = balancer.DNRMBalancersManager(self.task_queue)
         self.pools = {}
         for driver_name in config.get_drivers_names():
             new_pool = pool.Pool(driver_name)
@@ -65,68 +76,188 @@ class ResourceManager(object):
         self.balancer_manager.run()
         self.cleaner = cleaner.Cleaner()
         self.cleaner.start()
+        self.health_checker = health.HealthChecker(self.driver_factory)
+        self.health_checker.start()
+        self.reaper = reaper.Reaper(self.task_queue)
+        self.reaper.start()
+
+    def _start_workers(self, lane, workers_count):
+        for _i in xrange(workers_count):
+            t = task_queue.QueuedTaskWorker(self.task_queue,
+                                            self.driver_factory,
+                                            self.balancer_manager.notify,
+                                            lane, self.task_poller)
+            self.task_workers.append(t)
+            t.start()
 
     def close(self):
         self.balancer_manager.kill()
         self.balancer_manager.join()
         for t in self.task_workers:
             t.stop()
-        for p in self.pools:
+        self.task_poller.stop()
+        for p in self.pools.values():
             p['pool'].pop(count=None, processing=False)
         self.cleaner.stop()
+        self.health_checker.stop()
+        self.reaper.stop()
 
-    def add(self, context, driver_name, resource_data):
+    def _prepare(self, driver_name, resource_data):
         driver = self.driver_factory.get(driver_name)
         driver.validate_resource(resource_data)
-        resource = driver.prepare_resource(resources.STATE_STARTED,
-                                           resource_data)
+        return driver.prepare_resource(resources.STATE_STARTED,
+                                       resource_data)
+
+    def add(self, context, driver_name, resource_data):
+        resource = self._prepare(driver_name, resource_data)
         resource = db.resource_create(driver_name, resource)
         return resource
 
-    def delete(self, context, resource_id, force=False):
-        resource = db.resource_get_by_id(resource_id)
-        if not force:
-            if resource['processing']:
-                raise exceptions.ResourceProcessing(resource_id=resource_id)
-            if resource['allocated']:
-                raise exceptions.ResourceAllocated(resource_id=resource_id)
-        resource = db.resource_update(resource_id, {'processing': True})
-        task = tasks.DeleteTask(resource, force)
-        self.task_queue.push(task)
+    def add_many(self, context, items):
+        """Adds resources from (driver name, resource data) pairs.
 
-    def allocate(self, context, resource_id):
+        Valid resources are created in one transaction. Returns list of
+        created resources and exceptions of items that failed validation or
+        insert, in order of items.
+        """
+        results = []
+        valid = []
+        for driver_name, resource_data in items:
+            try:
+                resource = self._prepare(driver_name, resource_data)
+            except Exception as e:
+                results.append(e)
+                continue
+            results.append(None)
+            valid.append((driver_name, resource))
+        created = iter(db.resource_create_many(valid))
+        return [created.next() if result is None else result
+                for result in results]
+
+    def _raise_conflict(self, resource_id, filters):
+        """Raises exception explaining why conditional update failed."""
         resource = db.resource_get_by_id(resource_id)
-        if resource['processing']:
+        if 'processing' in filters and resource['processing']:
             raise exceptions.ResourceProcessing(resource_id=resource_id)
-        if resource['allocated']:
+        if 'allocated' in filters and resource['allocated']:
             raise exceptions.ResourceAllocated(resource_id=resource_id)
-        resource = db.resource_update(resource_id, {'allocated': True,
-                                                    'processing': False})
+
+    def _compare_update(self, resource_id, filters, values):
+        for _attempt in xrange(_UPDATE_ATTEMPTS):
+            resource = db.resource_compare_update(resource_id, filters,
+                                                  values)
+            if resource is not None:
+                return resource
+            # Nothing is raised if resource has been changed after
+            # conditional update, try again in that case.
+            self._raise_conflict(resource_id, filters)
+        raise exceptions.ResourceUpdateConflict(resource_id=resource_id)
+
+    def delete(self, context, resource_id, force=False):
+        if force:
+            # Resource is put to processing state in any state when task
+            # is journaled, in the same transaction.
+            resource = db.resource_get_by_id(resource_id)
+            task = tasks.DeleteTask(resource, force)
+            self.task_queue.push(task, filters={})
+        else:
+            resource = self._compare_update(
+                resource_id, {'processing': False, 'allocated': False},
+                {'processing': True})
+            task = tasks.DeleteTask(resource, force)
+            self.task_queue.push(task)
+        self.balancer_manager.notify(resource['type'])
+
+    def allocate(self, context, resource_id):
+        resource = self._compare_update(
+            resource_id, {'processing': False, 'allocated': False},
+            {'allocated': True, 'processing': False})
+        if resource['pool'] is not None:
+            self._count_allocations(resource['type'], 1)
+        self.balancer_manager.notify(resource['type'])
         return resource
 
+    def _count_allocations(self, driver_name, count):
+        pool = self.pools.get(driver_name)
+        if pool is not None:
+            pool['balancer'].count_allocations(count)
+
+    def allocate_from_pool(self, context, driver_name, count=1):
+        """
+        Allocates count started resources from pool of driver. Nothing is
+        allocated if pool has fewer resources.
+        """
+        if driver_name not in self.pools:
+            raise exceptions.InvalidDriverName(driver_name=driver_name)
+        pool = self.pools[driver_name]['pool']
+        resources = pool.allocate(count)
+        self.balancer_manager.notify(driver_name)
+        if not resources:
+            raise exceptions.PoolExhausted(driver_name=driver_name,
+                                           available=pool.count(),
+                                           count=count)
+        self._count_allocations(driver_name, count)
+        return resources
+
+    def list_pools(self, context):
+        """Returns names of drivers that have pools."""
+        return sorted(self.pools.keys())
+
     def deallocate(self, context, resource_id):
-        resource = db.resource_get_by_id(resource_id)
-        if resource['processing']:
-            raise exceptions.ResourceProcessing(resource_id=resource_id)
-        resource = db.resource_update(resource_id, {'allocated': False,
-                                                    'processing': True})
+        resource = self._compare_update(
+            resource_id, {'processing': False},
+            {'allocated': False, 'processing': True})
         task = tasks.WipeTask(resource)
         self.task_queue.push(task)
+        self.balancer_manager.notify(resource['type'])
         return resource
 
-    def list(self, context, search_opts):
+    def _search_opts(self, search_opts):
         so = {}
-        for key in ('limit', 'offset'):
+        for key in ('limit', 'offset', 'marker', 'sort_key', 'sort_dir',
+                    'fields'):
             if key in search_opts:
                 so[key] = search_opts.pop(key)
 
         if search_opts:
             so['filters'] = search_opts
 
-        return db.resource_find(so)
+        return so
+
+    def list(self, context, search_opts):
+        return db.resource_find(self._search_opts(search_opts))
+
+    def iterate(self, context, search_opts):
+        """Same as list, but resources are fetched from DB lazily."""
+        return db.resource_iter(self._search_opts(search_opts))
+
+    def stats(self, context, group_by=None):
+        """Returns resource counts grouped by group_by fields, configured
+        watermarks of pools, targets their balancers currently keep, number
+        of queued tasks per priority in each task queue lane, seconds
+        balancing passes run for pools whose passes run longer than
+        sleep_time and statistics of the last health check sweep, None
+        before the first one.
+        """
+        if not group_by:
+            group_by = ['type', 'status', 'unused', 'allocated']
+        watermarks = {}
+        targets = {}
+        for driver_name, pool_info in self.pools.items():
+            conf = config.get_driver_config(driver_name)
+            watermarks[driver_name] = {
+                'low_watermark': int(conf.get('low_watermark')),
+                'high_watermark': int(conf.get('high_watermark'))}
+            targets[driver_name] = pool_info['balancer'].get_targets()
+        return {'resources': db.resource_aggregate(group_by),
+                'watermarks': watermarks,
+                'targets': targets,
+                'queue': self.task_queue.lane_depth(),
+                'overdue_balancers': self.balancer_manager.overdue_passes(),
+                'health': self.health_checker.last_sweep}
 
-    def get(self, context, resource_id):
-        return db.resource_get_by_id(resource_id)
+    def get(self, context, resource_id, fields=None):
+        return db.resource_get_by_id(resource_id, fields)
 
     def schema(self, context, driver_name):
         driver = self.driver_factory.get(driver_name)
@@ -0,0 +1,92 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import datetime
+
+import eventlet
+from oslo.config import cfg
+
+from dnrm import db
+from dnrm.openstack.common import log
+from dnrm.openstack.common import timeutils
+from dnrm.resources import base
+
+CONF = cfg.CONF
+LOG = log.getLogger(__name__)
+
+
+class Reaper(object):
+    """
+    Periodically finds resources that stay in a processing state longer
+    than deadline of this state. Their tasks are requeued from task journal
+    if reaper_requeue is set, other stuck resources are put to error state.
+    Resources whose tasks wait in queue or were taken from queue within
+    deadline are not stuck.
+    """
+
+    def __init__(self, task_queue):
+        self._task_queue = task_queue
+        self._running = False
+
+    def run(self):
+        while self._running:
+            try:
+                self.sweep()
+            except Exception:
+                LOG.exception(_('Reaper sweep failed'))
+            eventlet.sleep(CONF.reaper_interval)
+
+    def sweep(self):
+        now = timeutils.utcnow()
+        deadlines = dict(
+            (state, now - datetime.timedelta(seconds=int(timeout)))
+            for state, timeout in CONF.processing_deadlines.items())
+        stuck = [resource for resource in db.resource_find_stuck(deadlines)
+                 if not self._in_progress(resource, deadlines)]
+        if not stuck:
+            return
+        failed_ids = set(resource['id'] for resource in stuck)
+        LOG.warning(_('Resources stuck in processing: %s') %
+                    ', '.join(sorted(failed_ids)))
+        if CONF.reaper_requeue:
+            entries = db.task_find(list(failed_ids))
+            failed = self._task_queue.requeue(entries)
+            requeued = (set(entry['resource_id'] for entry in entries) -
+                        set(entry['resource_id'] for entry in failed))
+            # Refresh updated_at to give requeued tasks a new deadline.
+            db.resource_bulk_update(list(requeued), {'processing': True},
+                                    deadlines=deadlines)
+            failed_ids -= requeued
+        # Resources that moved on since they were found stuck are left alone.
+        db.resource_bulk_update(list(failed_ids),
+                                {'status': base.STATE_ERROR,
+                                 'processing': False},
+                                finish_tasks=True, deadlines=deadlines)
+
+    def _in_progress(self, resource, deadlines):
+        if self._task_queue.is_queued(resource['id']):
+            return True
+        started = self._task_queue.started_at(resource['id'])
+        return started is not None and started >= deadlines[resource['status']]
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        eventlet.spawn_n(self.run)
+
+    def stop(self):
+        self._running = False
@@ -15,13 +15,20 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import abc
+import collections
+import itertools
+import time
 
 from eventlet import greenthread
 from eventlet import queue
+import greenlet
 from oslo.config import cfg
 
 from dnrm.db import api as db_api
 from dnrm.openstack.common import log
+from dnrm.openstack.common import timeutils
+from dnrm.resources import base
+from dnrm import tasks
 
 CONF = cfg.CONF
 LOG = log.getLogger(__name__)
@@ -51,82 +58,333 @@ class Worker(object):
 class QueuedTaskWorker(Worker):
     """
     Worker that takes tasks from task queue and executes them in loop.
+    If notify callback is given it is called with resource type after each
+    task is finished. Worker takes tasks from given lane of queue only.
+    Asynchronous tasks are handed over to poller if it is given, otherwise
+    worker polls them itself.
     """
 
-    def __init__(self, queue, driver_factory):
+    def __init__(self, queue, driver_factory, notify=None, lane=None,
+                 poller=None):
         self._queue = queue
         self._driver_factory = driver_factory
+        self._notify = notify
+        self._lane = lane
+        self._poller = poller
         self._running = False
-        self._timeout = CONF.task_queue_timeout
+        self._waiting = False
+        self._thread = None
 
     def run(self):
         while self._running:
             # Drop reference to python object before blocking on pop
             task = None
-            task = self._queue.pop(timeout=self._timeout)
+            self._waiting = True
+            try:
+                task = self._queue.pop(lane=self._lane)
+            except greenlet.GreenletExit:
+                break
+            finally:
+                self._waiting = False
             if task is None:
                 continue
+            self._execute(task)
+
+    def _execute(self, task):
+        if isinstance(task, tasks.BatchTask):
+            self._execute_batch(task)
+            return
+        try:
+            resource = task.execute(self._driver_factory)
+        except Exception:
+            LOG.exception(_('Exception executing task %s.') % repr(task))
+            resource = None
+        self._continue(task, resource)
+
+    def _continue(self, task, resource):
+        """
+        Polls executed task until it is done, asynchronous tasks are handed
+        over to poller. Resource is None if task failed.
+        """
+        if resource is not None:
             try:
-                resource = task.execute(self._driver_factory)
-                resource['processing'] = False
-                resource['status'] = task.success_state
-                LOG.debug(
-                    _('Resource state change: %(id)s/%(status)s') % resource)
-                db_api.resource_update(resource['id'], resource)
+                self._save_progress(task)
+                delay = task.poll(self._driver_factory)
+                if delay is not None and self._poller is not None:
+                    self._poller.add(task, delay, self._complete)
+                    return
+                while delay is not None:
+                    greenthread.sleep(delay)
+                    delay = task.poll(self._driver_factory)
             except Exception:
                 LOG.exception(_('Exception executing task %s.') % repr(task))
-                resource_id = task.get_resource_id()
-                LOG.debug(_('Resource state change: %(id)s/%(status)s') % {
-                    'id': resource_id,
-                    'status': task.fail_state,
-                })
-                db_api.resource_update(resource_id, {'status': task.fail_state,
-                                                     'processing': False})
-            # TODO(anfrolov): mark task as finished in database
+                resource = None
+        self._complete(task, resource)
+
+    def _save_progress(self, task):
+        progress = task.get_progress()
+        if progress:
+            db_api.resource_update(task.get_resource_id(), progress)
+
+    def _execute_batch(self, task):
+        try:
+            results = task.execute(self._driver_factory)
+        except Exception:
+            LOG.exception(_('Exception executing task %s.') % repr(task))
+            results = [None] * len(task.tasks)
+        for subtask, resource in zip(task.tasks, results):
+            self._continue(subtask, resource)
+
+    def _complete(self, task, resource):
+        """Saves result of task, resource is None if task failed."""
+        if resource is not None:
+            resource['processing'] = False
+            resource['status'] = task.success_state
+            LOG.debug(
+                _('Resource state change: %(id)s/%(status)s') % resource)
+            self._finish(task, resource['id'], resource)
+        else:
+            resource_id = task.get_resource_id()
+            LOG.debug(_('Resource state change: %(id)s/%(status)s') % {
+                'id': resource_id,
+                'status': task.fail_state,
+            })
+            self._finish(task, resource_id, {'status': task.fail_state,
+                                             'processing': False})
+        self._queue.finished(task)
+        if self._notify is not None:
+            self._notify(task.get_resource_type())
+
+    def _finish(self, task, resource_id, values):
+        if task.task_id is None:
+            db_api.resource_update(resource_id, values)
+        else:
+            result = db_api.task_finish(
+                task.task_id, resource_id,
+                {'status': task.process_state, 'processing': True}, values)
+            if result is None:
+                LOG.warning(_('Task %(task)s of resource %(id)s has been '
+                              'rolled back, its result is dropped.') %
+                            {'task': task.task_id, 'id': resource_id})
 
     def start(self):
         if not self._running:
             self._running = True
-            greenthread.spawn_n(self.run)
+            self._thread = greenthread.spawn(self.run)
 
     def stop(self):
+        """
+        Stops worker. Idle worker is interrupted immediately, busy worker
+        finishes its current task first. Returns when worker has stopped.
+        """
+        if not self._running:
+            return
         self._running = False
+        if self._waiting:
+            greenthread.kill(self._thread)
+        self._thread.wait()
+        self._thread = None
+
+
+class TaskPoller(object):
+    """
+    Polls asynchronous tasks started by workers until they are done. Polls
+    are scheduled as timers of eventlet hub, so any number of tasks may be
+    in flight without holding workers.
+    """
+
+    def __init__(self, driver_factory):
+        self._driver_factory = driver_factory
+        self._threads = {}
+
+    def add(self, task, delay, callback):
+        """
+        Polls task after delay seconds and then as long as task asks for.
+        When task is done callback is called with task and its resource, or
+        with task and None if task failed.
+        """
+        self._threads[task] = greenthread.spawn_after(delay, self._poll,
+                                                      task, callback)
+
+    def pending(self):
+        """Returns number of tasks being polled."""
+        return len(self._threads)
+
+    def _poll(self, task, callback):
+        del self._threads[task]
+        try:
+            delay = task.poll(self._driver_factory)
+        except Exception:
+            LOG.exception(_('Exception polling task %s.') % repr(task))
+            callback(task, None)
+            return
+        if delay is None:
+            callback(task, task.get_resource())
+        else:
+            self.add(task, delay, callback)
+
+    def stop(self):
+        """
+        Stops polling. Unfinished tasks stay in task journal and are
+        restored on next start.
+        """
+        for thread in self._threads.values():
+            greenthread.kill(thread)
+        self._threads.clear()
 
 
 class TaskQueue(object):
     """
     Manages task queue for workers.
+
+    Tasks are ordered by priority, smaller value goes first. Waiting task
+    overtakes tasks of one level higher priority queued task_priority_aging
+    seconds after it, so low priority tasks are not starved.
+
+    Tasks of resource types listed in lanes are routed to separate queues
+    served by dedicated workers, tasks of other types share default lane.
     """
 
-    def __init__(self):
-        self._queue = queue.LightQueue()
+    def __init__(self, lanes=()):
+        self._queue = queue.PriorityQueue()
+        self._lanes = dict((lane, queue.PriorityQueue()) for lane in lanes)
+        self._counter = itertools.count()
+        # Number of queued tasks per lane and priority, default lane is None.
+        self._depth = collections.defaultdict(int)
+        # Number of queued tasks per resource id.
+        self._queued = collections.defaultdict(int)
+        # Time when worker took task of resource from queue, by resource id.
+        self._started = {}
+
+    def _resource_ids(self, task):
+        if isinstance(task, tasks.BatchTask):
+            return [subtask.get_resource_id() for subtask in task.tasks]
+        return [task.get_resource_id()]
+
+    def _lane_name(self, lane):
+        return lane if lane in self._lanes else None
 
-    def push(self, task):
+    def _put(self, task):
+        key = time.time() + task.priority * CONF.task_priority_aging
+        lane = self._lane_name(task.get_resource_type())
+        self._depth[(lane, task.priority)] += 1
+        for resource_id in self._resource_ids(task):
+            self._queued[resource_id] += 1
+        self._lanes.get(lane, self._queue).put(
+            (key, self._counter.next(), task))
+
+    def lane_depth(self):
+        """
+        Returns number of queued tasks per priority in each lane, default
+        lane is named 'default'.
+        """
+        depth = collections.defaultdict(dict)
+        for (lane, priority), count in self._depth.items():
+            if count:
+                depth[lane or 'default'][priority] = count
+        return dict(depth)
+
+    def push(self, task, filters=None):
         """
         Adds new task to queue. Unblocks one worker waiting on pop call if
-        there is any.
+        there is any. Subtasks of batch task are journaled separately.
+        Resource is put to processing state when task is journaled if it
+        matches filters, by default if it is in one of in_states of task.
         """
+        if isinstance(task, tasks.BatchTask):
+            for subtask in task.tasks:
+                self._journal(subtask, filters)
+        else:
+            self._journal(task, filters)
+        self._put(task)
+
+    def _journal(self, task, filters=None):
         resource_id = task.get_resource_id()
         LOG.debug(_('Resource state change: %(id)s/%(status)s') % {
             'id': resource_id,
             'status': task.process_state,
         })
-        result = db_api.resource_compare_update(
-            resource_id, {'status': task.in_states},
-            {'status': task.process_state, 'processing': True})
+        if filters is None:
+            filters = {'status': task.in_states}
+        result = db_api.task_push(
+            resource_id, filters,
+            {'status': task.process_state, 'processing': True},
+            type(task).__name__, task.get_params())
         assert result is not None
-        self._queue.put(task)
+        task.task_id = result['id']
+
+    def restore(self):
+        """
+        Requeues tasks left unfinished in task journal by previous run.
+        Resources of tasks that can not be restored are put to error state
+        at once. Returns number of requeued tasks.
+        """
+        entries = db_api.task_find()
+        failed = self.requeue(entries)
+        db_api.task_rollback([entry['id'] for entry in failed],
+                             {'status': base.STATE_ERROR,
+                              'processing': False})
+        LOG.info(_('Restored %(restored)d tasks, rolled back %(failed)d.') %
+                 {'restored': len(entries) - len(failed),
+                  'failed': len(failed)})
+        return len(entries) - len(failed)
 
-    def pop(self, block=True, timeout=None):
+    def requeue(self, entries):
         """
-        Removes task from queue. If optional arg block is true and timeout is
-        None (the default), block if necessary until task is available. If
-        timeout is a positive number, it blocks at most timeout seconds and
-        returns None if no task was available within that time. Otherwise
-        (block is false), return task if one is immediately available, else
-        return None (timeout is ignored in that case).
+        Puts tasks restored from journal entries to queue without changing
+        state of their resources. Returns entries that can not be restored.
+        """
+        failed = []
+        for entry in entries:
+            try:
+                resource = db_api.resource_get_by_id(entry['resource_id'])
+                task = tasks.restore(entry['type'], resource,
+                                     entry['params'])
+            except Exception:
+                LOG.exception(_('Failed to restore task %s.') % entry['id'])
+                failed.append(entry)
+                continue
+            task.task_id = entry['id']
+            self._put(task)
+        return failed
+
+    def pop(self, block=True, timeout=None, lane=None):
         """
+        Removes task from queue lane, default lane is used if lane is None.
+        If optional arg block is true and timeout is None (the default), block
+        if necessary until task is available. If timeout is a positive number,
+        it blocks at most timeout seconds and returns None if no task was
+        available within that time. Otherwise (block is false), return task if
+        one is immediately available, else return None (timeout is ignored in
+        that case).
+        """
+        lane = self._lane_name(lane)
         try:
-            return self._queue.get(block=block, timeout=timeout)
+            _key, _count, task = self._lanes.get(lane, self._queue).get(
+                block=block, timeout=timeout)
         except queue.Empty:
             return None
+        self._depth[(lane, task.priority)] -= 1
+        now = timeutils.utcnow()
+        for resource_id in self._resource_ids(task):
+            self._queued[resource_id] -= 1
+            if self._queued[resource_id] <= 0:
+                del self._queued[resource_id]
+            self._started[resource_id] = now
+        return task
+
+    def finished(self, task):
+        """Notifies queue that task taken by pop is done."""
+        for resource_id in self._resource_ids(task):
+            self._started.pop(resource_id, None)
+
+    def is_queued(self, resource_id):
+        """Returns True if task of resource waits in queue."""
+        return resource_id in self._queued
+
+    def started_at(self, resource_id):
+        """
+        Returns time when task of resource was taken from queue, or None if
+        no task of resource is being executed.
+        """
+        return self._started.get(resource_id)
@@ -19,6 +19,7 @@ Module contains task classes used by balancer.
 """
 import abc
 
+from dnrm import exceptions
 from dnrm.openstack.common import excutils
 from dnrm.openstack.common import log
 from dnrm.resources import base
@@ -27,12 +28,21 @@ LOG = log.getLogger(__name__)
 
 
 class Task(object):
-    """Base class for task objects."""
+    """
+    Base class for task objects. Tasks with smaller priority value are
+    executed first.
+    """
 
     __metaclass__ = abc.ABCMeta
 
+    priority = 0
+
+    # True if task is restored from task journal after restart.
+    restored = False
+
     def __init__(self, resource):
         self._resource = resource
+        self.task_id = None
 
     @abc.abstractmethod
     def execute(self, driver_factory):
@@ -43,6 +53,32 @@ class Task(object):
         """Returns resource id that task is working on."""
         return self._resource['id']
 
+    def get_resource_type(self):
+        """Returns type of resource that task is working on."""
+        return self._resource['type']
+
+    def get_resource(self):
+        """Returns resource that task is working on."""
+        return self._resource
+
+    def poll(self, driver_factory):
+        """
+        Continues asynchronous operation started by execute. Returns number
+        of seconds before next poll or None when task is done.
+        """
+        return None
+
+    def get_params(self):
+        """Returns constructor arguments to be saved in task journal."""
+        return {}
+
+    def get_progress(self):
+        """
+        Returns resource values set by execute that are saved before task
+        is polled, so that task restored after restart may continue.
+        """
+        return {}
+
 
 class StartTask(Task):
     """Task that puts resource to started state."""
@@ -51,13 +87,104 @@ class StartTask(Task):
     process_state = base.STATE_STARTING
     success_state = base.STATE_STARTED
     fail_state = base.STATE_ERROR
+    priority = 1
+
+    def __init__(self, resource):
+        super(StartTask, self).__init__(resource)
+        self._handle = None
+        self._progress = {}
 
     def execute(self, driver_factory):
         resource = self._resource
         driver = driver_factory.get(resource['type'])
-        driver.init(resource)
+        if self.restored:
+            # Interrupted start may have created backend instance already,
+            # starting again would leak it.
+            self._handle = driver.resume_init(resource)
+            if self._handle is None:
+                raise exceptions.InitNotResumable(resource_id=resource['id'])
+            return resource
+        initial = dict(resource)
+        handle = driver.begin_init(resource)
+        if handle is None:
+            driver.init(resource)
+        else:
+            self.begun(handle, initial)
         return resource
 
+    def begun(self, handle, initial):
+        """
+        Records that driver started resource asynchronously, initial is
+        resource as it was before start.
+        """
+        self._handle = handle
+        self._progress = dict(
+            (key, value) for key, value in self._resource.items()
+            if key not in initial or initial[key] != value)
+
+    def get_progress(self):
+        return self._progress
+
+    def poll(self, driver_factory):
+        if self._handle is None:
+            return None
+        resource = self._resource
+        driver = driver_factory.get(resource['type'])
+        return driver.poll(resource, self._handle)
+
+
+class BatchTask(Task):
+    """
+    Base class for tasks that work on several resources of one type with one
+    driver call. Each resource has its own subtask that is journaled, polled
+    and finished separately, so unfinished batch is restored as single tasks.
+    """
+
+    def __init__(self, tasks):
+        super(BatchTask, self).__init__(None)
+        self.tasks = tasks
+
+    @abc.abstractmethod
+    def execute(self, driver_factory):
+        """Returns list of subtask resources, None for failed subtasks."""
+        pass
+
+    def get_resource_id(self):
+        return [task.get_resource_id() for task in self.tasks]
+
+    def get_resource_type(self):
+        return self.tasks[0].get_resource_type()
+
+
+class StartManyTask(BatchTask):
+    """Task that puts several resources to started state at once."""
+
+    priority = StartTask.priority
+
+    def __init__(self, resources):
+        super(StartManyTask, self).__init__(
+            [StartTask(resource) for resource in resources])
+
+    def execute(self, driver_factory):
+        resources = [task.get_resource() for task in self.tasks]
+        driver = driver_factory.get(self.get_resource_type())
+        initial = [dict(resource) for resource in resources]
+        handles = driver.begin_init_many(resources)
+        if handles is not None:
+            # Subtasks are polled separately until resources boot.
+            for task, handle, resource in zip(self.tasks, handles, initial):
+                task.begun(handle, resource)
+            return resources
+        errors = driver.init_many(resources)
+        results = []
+        for resource, error in zip(resources, errors):
+            if error is not None:
+                LOG.error(_('Failed to start resource %(id)s: %(error)s') %
+                          {'id': resource['id'], 'error': error})
+                resource = None
+            results.append(resource)
+        return results
+
 
 class StopTask(Task):
     """Task that puts resource to stopped state."""
@@ -66,6 +193,7 @@ class StopTask(Task):
     process_state = base.STATE_STOPPING
     success_state = base.STATE_STOPPED
     fail_state = base.STATE_ERROR
+    priority = 3
 
     def execute(self, driver_factory):
         resource = self._resource
@@ -81,6 +209,8 @@ class WipeTask(Task):
     process_state = base.STATE_WIPING
     success_state = base.STATE_STARTED
     fail_state = base.STATE_ERROR
+    # Wiped resource returns to pool, so wipe goes before others.
+    priority = 0
 
     def execute(self, driver_factory):
         resource = self._resource
@@ -96,11 +226,15 @@ class DeleteTask(Task):
     process_state = base.STATE_DELETING
     success_state = base.STATE_DELETED
     fail_state = base.STATE_ERROR
+    priority = 2
 
     def __init__(self, resource, force=False):
         super(DeleteTask, self).__init__(resource)
         self._force = force
 
+    def get_params(self):
+        return {'force': self._force}
+
     def execute(self, driver_factory):
         resource = self._resource
         driver = driver_factory.get(resource['type'])
@@ -111,3 +245,15 @@ class DeleteTask(Task):
                 LOG.exception(_('Failed to delete resource'))
                 exc_reraiser.reraise = not self._force
         return resource
+
+
+TASK_TYPES = dict((task_class.__name__, task_class)
+                  for task_class in (StartTask, StopTask, WipeTask,
+                                     DeleteTask))
+
+
+def restore(task_type, resource, params):
+    """Creates task of task_type from its journal entry."""
+    task = TASK_TYPES[task_type](resource, **params)
+    task.restored = True
+    return task
@@ -20,8 +20,10 @@ from mock import patch
 
 from dnrm.api import collections
 from dnrm.api import drivers
+from dnrm.api import pools
 from dnrm.api import resources
 from dnrm.api import router
+from dnrm.api import stats
 from dnrm.api import versions
 from dnrm.openstack.common.fixture import mockpatch
 from dnrm.tests import base
@@ -84,6 +86,15 @@ class RouterTestCase(base.BaseTestCase):
             req.get_response(self.app)
             self.assertTrue(mock_method.called)
 
+    def test_resource_batch(self):
+        with patch.object(resources.ResourceController, 'batch',
+                          return_value={}) as mock_method:
+            req = fakes.HTTPRequest.blank('/v1/resources/batch')
+            req.method = 'POST'
+            req.body = json.dumps({'operations': []})
+            req.get_response(self.app)
+            self.assertTrue(mock_method.called)
+
     def test_resource_update(self):
         with patch.object(resources.ResourceController, 'update',
                           return_value={}) as mock_method:
@@ -121,3 +132,29 @@ class RouterTestCase(base.BaseTestCase):
             req.method = 'GET'
             req.get_response(self.app)
             self.assertTrue(mock_method.called)
+
+    # Pools test case
+    def test_pool_index(self):
+        with patch.object(pools.PoolController, 'index',
+                          return_value={}) as mock_method:
+            req = fakes.HTTPRequest.blank('/v1/pools/')
+            req.get_response(self.app)
+            self.assertTrue(mock_method.called)
+
+    def test_pool_allocate(self):
+        with patch.object(pools.PoolController, 'allocate',
+                          return_value={}) as mock_method:
+            url = '/v1/pools/%s/allocate' % FAKE_RESOURCE_TYPE
+            req = fakes.HTTPRequest.blank(url)
+            req.method = 'POST'
+            req.get_response(self.app)
+            self.assertTrue(mock_method.called)
+
+    # Stats test case
+    def test_stats(self):
+        with patch.object(stats.StatsController, 'index',
+                          return_value={}) as mock_method:
+            req = fakes.HTTPRequest.blank('/v1/stats')
+            req.method = 'GET'
+            req.get_response(self.app)
+            self.assertTrue(mock_method.called)
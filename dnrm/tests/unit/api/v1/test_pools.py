@@ -0,0 +1,87 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from webob import exc
+
+from dnrm.api import pools
+from dnrm import exceptions
+from dnrm.openstack.common.fixture import mockpatch
+from dnrm.tests import base
+from dnrm.tests.unit.api import fakes
+
+
+FAKE_DRIVER_TYPE = "com.router.brocade.vyatta.6000"
+
+
+class PoolApiTest(base.BaseTestCase):
+    def setUp(self):
+        super(PoolApiTest, self).setUp()
+        self.manager = mock.Mock()
+        self.useFixture(mockpatch.Patch(
+            'dnrm.resources.manager.ResourceManager',
+            return_value=self.manager))
+
+        self.controller = pools.PoolController()
+        url = '/v1/pools/%s/allocate' % FAKE_DRIVER_TYPE
+        self.req = fakes.HTTPRequest.blank(url)
+        self.req.method = 'POST'
+
+    def test_index(self):
+        self.manager.list_pools.return_value = ['fake-driver']
+        result = self.controller.index(self.req)
+        self.manager.list_pools.assert_called_once_with(None)
+        self.assertEqual({'pools': ['fake-driver']}, result)
+
+    def test_allocate_one(self):
+        self.manager.allocate_from_pool.return_value = [{'id': 'fake-id'}]
+        result = self.controller.allocate(self.req, FAKE_DRIVER_TYPE)
+        self.manager.allocate_from_pool.assert_called_with(
+            None, FAKE_DRIVER_TYPE, 1)
+        self.assertEqual({'resources': [{'id': 'fake-id'}]}, result)
+
+    def test_allocate_count(self):
+        self.controller.allocate(self.req, FAKE_DRIVER_TYPE,
+                                 {'pool': {'count': 3}})
+        self.manager.allocate_from_pool.assert_called_with(
+            None, FAKE_DRIVER_TYPE, 3)
+
+    def test_allocate_invalid_count(self):
+        self.assertRaises(exc.HTTPBadRequest, self.controller.allocate,
+                          self.req, FAKE_DRIVER_TYPE, {'pool': {'count': 0}})
+        self.assertRaises(exc.HTTPBadRequest, self.controller.allocate,
+                          self.req, FAKE_DRIVER_TYPE,
+                          {'pool': {'count': 'fake'}})
+
+    def test_allocate_unknown_pool(self):
+        self.manager.allocate_from_pool.side_effect = (
+            exceptions.InvalidDriverName(driver_name=FAKE_DRIVER_TYPE))
+        self.assertRaises(exc.HTTPNotFound, self.controller.allocate,
+                          self.req, FAKE_DRIVER_TYPE)
+
+    def test_allocate_exhausted_pool(self):
+        self.manager.allocate_from_pool.side_effect = (
+            exceptions.PoolExhausted(driver_name=FAKE_DRIVER_TYPE,
+                                     available=1, count=3))
+        self.assertRaises(exc.HTTPConflict, self.controller.allocate,
+                          self.req, FAKE_DRIVER_TYPE, {'pool': {'count': 3}})
+
+    def test_allocate_claim_conflict(self):
+        self.manager.allocate_from_pool.side_effect = (
+            exceptions.ResourceClaimConflict(filters={}))
+        self.assertRaises(exc.HTTPConflict, self.controller.allocate,
+                          self.req, FAKE_DRIVER_TYPE)
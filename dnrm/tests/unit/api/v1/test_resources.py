@@ -16,8 +16,10 @@
 #    under the License.
 import json
 import mock
+import webob
 
 from dnrm.api import resources
+from dnrm import exceptions
 from dnrm.openstack.common.fixture import mockpatch
 from dnrm.openstack.common import log as logging
 from dnrm.tests import base
@@ -41,8 +43,53 @@ class ResourceApiTest(base.DBBaseTestCase):
 
     def test_resources_list(self):
         req = fakes.HTTPRequest.blank('/v1/resources/')
+        self.manager.iterate.return_value = iter([{'id': 'fake-id-1'},
+                                                  {'id': 'fake-id-2'}])
+        response = self.controller.index(req)
+        self.manager.iterate.assert_called_with(None, {})
+        self.assertEqual(0, self.manager.list.call_count)
+        self.assertEqual('application/json', response.content_type)
+        self.assertEqual({'resources': [{'id': 'fake-id-1'},
+                                        {'id': 'fake-id-2'}]},
+                         json.loads(response.body))
+
+    def test_resources_list_next_link(self):
+        req = fakes.HTTPRequest.blank('/v1/resources/?limit=2&pool=fake')
+        self.manager.list.return_value = [{'id': 'fake-id-1'},
+                                          {'id': 'fake-id-2'}]
+        result = self.controller.index(req)
+        self.manager.list.assert_called_with(None, {'limit': 2,
+                                                    'pool': 'fake'})
+        link = result['resources_links'][0]
+        self.assertEqual('next', link['rel'])
+        self.assertIn('marker=fake-id-2', link['href'])
+        self.assertIn('limit=2', link['href'])
+        self.assertIn('pool=fake', link['href'])
+
+    def test_resources_list_fields(self):
+        req = fakes.HTTPRequest.blank('/v1/resources/?limit=1&fields=status')
+        self.manager.list.return_value = []
         self.controller.index(req)
-        self.manager.list.assert_called_with(None, {})
+        self.manager.list.assert_called_with(None, {'limit': 1,
+                                                    'fields': ['status']})
+
+    def test_resources_list_last_page(self):
+        req = fakes.HTTPRequest.blank('/v1/resources/?limit=2')
+        self.manager.list.return_value = [{'id': 'fake-id-1'}]
+        result = self.controller.index(req)
+        self.assertNotIn('resources_links', result)
+
+    def test_resources_list_invalid_limit(self):
+        req = fakes.HTTPRequest.blank('/v1/resources/?limit=fake')
+        self.assertRaises(webob.exc.HTTPBadRequest, self.controller.index,
+                          req)
+
+    def test_resources_list_invalid_marker(self):
+        req = fakes.HTTPRequest.blank('/v1/resources/?marker=fake-id')
+        self.manager.iterate.side_effect = exceptions.MarkerNotFound(
+            marker='fake-id')
+        self.assertRaises(webob.exc.HTTPBadRequest, self.controller.index,
+                          req)
 
     def test_resource_add(self):
         req = fakes.HTTPRequest.blank('/v1/resources/')
@@ -53,12 +100,57 @@ class ResourceApiTest(base.DBBaseTestCase):
         self.manager.add.assert_called_with(None, FAKE_RESOURCE_TYPE,
                                             body['resource'])
 
+    def test_resource_batch(self):
+        req = fakes.HTTPRequest.blank('/v1/resources/batch')
+        req.method = 'POST'
+        body = {'operations': [
+            {'action': 'create',
+             'resource': {'resource_type': FAKE_RESOURCE_TYPE}},
+            {'action': 'allocate', 'id': FAKE_RESOURCE_ID},
+            {'action': 'create', 'resource': {'resource_type': 'fake'}},
+            {'action': 'delete', 'id': FAKE_RESOURCE_ID, 'force': True},
+            {'action': 'deallocate', 'id': FAKE_RESOURCE_ID},
+            {'action': 'fake'},
+        ]}
+        self.manager.add_many.return_value = [
+            {'id': 'fake-id-1'}, exceptions.InvalidResource()]
+        self.manager.allocate.return_value = {'id': FAKE_RESOURCE_ID}
+        self.manager.deallocate.side_effect = exceptions.ResourceProcessing(
+            resource_id=FAKE_RESOURCE_ID)
+
+        results = self.controller.batch(req, body)['results']
+
+        self.manager.add_many.assert_called_once_with(
+            None, [(FAKE_RESOURCE_TYPE, body['operations'][0]['resource']),
+                   ('fake', body['operations'][2]['resource'])])
+        self.manager.allocate.assert_called_once_with(None, FAKE_RESOURCE_ID)
+        self.manager.delete.assert_called_once_with(None, FAKE_RESOURCE_ID,
+                                                    True)
+        self.assertEqual([201, 200, 400, 204, 409, 400],
+                         [result['status'] for result in results])
+        self.assertEqual({'id': 'fake-id-1'}, results[0]['resource'])
+        self.assertIn('error', results[2])
+
+    def test_resource_batch_invalid_body(self):
+        req = fakes.HTTPRequest.blank('/v1/resources/batch')
+        req.method = 'POST'
+        self.assertRaises(webob.exc.HTTPBadRequest, self.controller.batch,
+                          req, {'operations': 'fake'})
+
     def test_resource_get(self):
         url = '/v1/resources/%s' % FAKE_RESOURCE_ID
         req = fakes.HTTPRequest.blank(url)
         req.method = 'GET'
         self.controller.show(req, FAKE_RESOURCE_ID)
-        self.manager.get.assert_called_with(None, FAKE_RESOURCE_ID)
+        self.manager.get.assert_called_with(None, FAKE_RESOURCE_ID, None)
+
+    def test_resource_get_fields(self):
+        url = '/v1/resources/%s?fields=status,%%20pool' % FAKE_RESOURCE_ID
+        req = fakes.HTTPRequest.blank(url)
+        req.method = 'GET'
+        self.controller.show(req, FAKE_RESOURCE_ID)
+        self.manager.get.assert_called_with(None, FAKE_RESOURCE_ID,
+                                            ['status', 'pool'])
 
     def test_resource_allocate(self):
         url = '/v1/resources/%s' % FAKE_RESOURCE_ID
@@ -80,6 +172,18 @@ class ResourceApiTest(base.DBBaseTestCase):
         self.controller.update(req, FAKE_RESOURCE_ID, body)
         self.manager.deallocate.assert_called_with(None, FAKE_RESOURCE_ID)
 
+    def test_resource_allocate_conflict(self):
+        url = '/v1/resources/%s' % FAKE_RESOURCE_ID
+        req = fakes.HTTPRequest.blank(url)
+        req.method = 'PUT'
+        body = {"resource": {"allocated": True}}
+        req.body = json.dumps(body)
+        self.manager.get.return_value = {'id': FAKE_RESOURCE_ID}
+        self.manager.allocate.side_effect = exceptions.ResourceUpdateConflict(
+            resource_id=FAKE_RESOURCE_ID)
+        self.assertRaises(webob.exc.HTTPConflict, self.controller.update,
+                          req, FAKE_RESOURCE_ID, body)
+
     def test_resource_delete(self):
         url = '/v1/resources/%s' % FAKE_RESOURCE_ID
         req = fakes.HTTPRequest.blank(url)
@@ -88,6 +192,15 @@ class ResourceApiTest(base.DBBaseTestCase):
         self.controller.delete(req, FAKE_RESOURCE_ID)
         self.manager.delete.assert_called_with(None, FAKE_RESOURCE_ID, False)
 
+    def test_resource_delete_conflict(self):
+        url = '/v1/resources/%s' % FAKE_RESOURCE_ID
+        req = fakes.HTTPRequest.blank(url)
+        req.method = 'DELETE'
+        self.manager.delete.side_effect = exceptions.ResourceAllocated(
+            resource_id=FAKE_RESOURCE_ID)
+        self.assertRaises(webob.exc.HTTPConflict, self.controller.delete,
+                          req, FAKE_RESOURCE_ID)
+
     def test_resource_force_delete(self):
         url = '/v1/resources/%s?force=True' % FAKE_RESOURCE_ID
         req = fakes.HTTPRequest.blank(url)
@@ -0,0 +1,53 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from webob import exc
+
+from dnrm.api import stats
+from dnrm.openstack.common.fixture import mockpatch
+from dnrm.tests import base
+from dnrm.tests.unit.api import fakes
+
+
+class StatsApiTest(base.BaseTestCase):
+    def setUp(self):
+        super(StatsApiTest, self).setUp()
+        self.manager = mock.Mock()
+        self.useFixture(mockpatch.Patch(
+            'dnrm.resources.manager.ResourceManager',
+            return_value=self.manager))
+
+        self.controller = stats.StatsController()
+
+    def test_stats(self):
+        self.manager.stats.return_value = {'resources': [], 'watermarks': {}}
+        req = fakes.HTTPRequest.blank('/v1/stats')
+        result = self.controller.index(req)
+        self.manager.stats.assert_called_with(None, None)
+        self.assertEqual({'stats': {'resources': [], 'watermarks': {}}},
+                         result)
+
+    def test_stats_group_by(self):
+        req = fakes.HTTPRequest.blank('/v1/stats?group_by=type,%20pool')
+        self.controller.index(req)
+        self.manager.stats.assert_called_with(None, ['type', 'pool'])
+
+    def test_stats_invalid_group_by(self):
+        self.manager.stats.side_effect = ValueError('fake-error')
+        req = fakes.HTTPRequest.blank('/v1/stats?group_by=data')
+        self.assertRaises(exc.HTTPBadRequest, self.controller.index, req)
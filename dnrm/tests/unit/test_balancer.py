@@ -14,6 +14,9 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import math
+
+import eventlet
 import mock
 from oslo.config import cfg
 
@@ -53,6 +56,171 @@ class DNRMBalancersManagerTestCase(base.BaseTestCase):
         self.assertRaises(ValueError, self.balancers_manager.add_balancer,
                           self.pool, self.unused_set, 10, 20)
 
+    def test_balance_pools_selected(self):
+        bal1 = mock.Mock()
+        bal2 = mock.Mock()
+        self.balancers_manager.balancers = {'pool-1': bal1, 'pool-2': bal2}
+        self.balancers_manager.balance_pools(['pool-2', 'unknown-pool'])
+        self.assertEqual(0, bal1.balance.call_count)
+        bal2.balance.assert_called_once_with()
+
+    def test_kill_waiting(self):
+        self.balancers_manager.SLEEP = 60
+        self.balancers_manager.run()
+        eventlet.sleep()
+        self.assertTrue(self.balancers_manager.waiting)
+        self.balancers_manager.kill()
+        self.balancers_manager.join()
+        self.assertFalse(self.balancers_manager.waiting)
+
+    def test_kill_finishes_pass(self):
+        finished = []
+
+        def balance():
+            eventlet.sleep(0.01)
+            finished.append(True)
+
+        bal = mock.Mock()
+        bal.balance.side_effect = balance
+        self.balancers_manager.balancers = {'pool-1': bal}
+        self.balancers_manager.run()
+        eventlet.sleep()
+        self.balancers_manager.kill()
+        self.balancers_manager.join()
+        self.assertEqual([True], finished)
+
+    def test_full_pass_under_notifications(self):
+        self.useFixture(mockpatch.PatchObject(
+            self.balancers_manager, 'wait_notifications',
+            return_value=set(['pool-1'])))
+        balance_pools = self.useFixture(mockpatch.PatchObject(
+            self.balancers_manager, 'balance_pools')).mock
+        time = self.useFixture(mockpatch.Patch(
+            'dnrm.balancer.manager.time.time')).mock
+        self.balancers_manager.SLEEP = 30
+        self.balancers_manager.is_runned = True
+
+        def advance(pool_keys):
+            if balance_pools.call_count == 4:
+                self.balancers_manager.is_runned = False
+            time.return_value += 20
+
+        balance_pools.side_effect = advance
+        time.return_value = 0
+        self.balancers_manager.balance_forever()
+        self.assertEqual([mock.call(None), mock.call(set(['pool-1'])),
+                          mock.call(None), mock.call(set(['pool-1']))],
+                         balance_pools.call_args_list)
+
+    def test_wait_notifications_timeout(self):
+        self.balancers_manager.SLEEP = 0
+        self.assertIsNone(self.balancers_manager.wait_notifications())
+
+    def test_wait_notifications_coalesced(self):
+        CONF.set_override('balancer_notify_delay', 0)
+        for pool_key in ('pool-1', 'pool-2', 'pool-1'):
+            self.balancers_manager.notify(pool_key)
+        self.assertEqual(set(['pool-1', 'pool-2']),
+                         self.balancers_manager.wait_notifications())
+        self.assertTrue(self.balancers_manager.notifications.empty())
+
+
+class ParallelDNRMBalancersManagerTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(ParallelDNRMBalancersManagerTestCase, self).setUp()
+
+        CONF.set_override('balancer', 'dnrm.tests.unit.test_balancer.'
+                                      'FakeBalancer')
+
+        self.balancers_manager = manager.ParallelDNRMBalancersManager(
+            'empty-queue')
+        self.greenpool = self.useFixture(mockpatch.PatchObject(
+            self.balancers_manager, 'greenpool')).mock
+
+    def _add_balancer(self, name):
+        bal = mock.Mock()
+        self.balancers_manager.balancers[name] = bal
+        return bal
+
+    def test_balance_pools_spawns_each_pool(self):
+        bal1 = self._add_balancer('pool-1')
+        bal2 = self._add_balancer('pool-2')
+        self.balancers_manager.balance_pools()
+        self.assertEqual(2, self.greenpool.spawn_n.call_count)
+        self.greenpool.spawn_n.assert_any_call(
+            self.balancers_manager._balance, 'pool-1', bal1)
+        self.greenpool.spawn_n.assert_any_call(
+            self.balancers_manager._balance, 'pool-2', bal2)
+
+    def test_balance_pools_skips_running(self):
+        self._add_balancer('pool-1')
+        self.balancers_manager.balance_pools()
+        self.balancers_manager.balance_pools()
+        self.assertEqual(1, self.greenpool.spawn_n.call_count)
+        self.assertEqual(set(['pool-1']), self.balancers_manager.rebalance)
+
+    def test_balance_again_if_notified(self):
+        bal = self._add_balancer('pool-1')
+        self.balancers_manager.balancing.add('pool-1')
+
+        def balance():
+            if bal.balance.call_count == 1:
+                self.balancers_manager.balance_pools(['pool-1'])
+
+        bal.balance.side_effect = balance
+        self.balancers_manager._balance('pool-1', bal)
+        self.assertEqual(2, bal.balance.call_count)
+        self.assertEqual(0, self.greenpool.spawn_n.call_count)
+        self.assertFalse(self.balancers_manager.rebalance)
+        self.assertFalse(self.balancers_manager.balancing)
+
+    def test_balance(self):
+        bal = self._add_balancer('pool-1')
+        self.balancers_manager.balancing.add('pool-1')
+        self.balancers_manager._balance('pool-1', bal)
+        bal.balance.assert_called_once_with()
+        self.assertNotIn('pool-1', self.balancers_manager.balancing)
+
+    def test_balance_error(self):
+        bal = self._add_balancer('pool-1')
+        bal.balance.side_effect = Exception('fake-error')
+        self.balancers_manager.balancing.add('pool-1')
+        self.balancers_manager._balance('pool-1', bal)
+        self.assertNotIn('pool-1', self.balancers_manager.balancing)
+
+    def test_overdue_passes(self):
+        CONF.set_override('sleep_time', 30)
+        bal = self._add_balancer('pool-1')
+        self._add_balancer('pool-2')
+        self.balancers_manager.balancing.update(['pool-1', 'pool-2'])
+        self.balancers_manager.passes = {'pool-1': 100, 'pool-2': 120}
+        with mock.patch('time.time', return_value=140):
+            self.assertEqual({'pool-1': 40},
+                             self.balancers_manager.overdue_passes())
+            with mock.patch.object(manager.LOG, 'warning') as warning:
+                self.balancers_manager.balance_pools()
+        self.assertEqual(1, warning.call_count)
+        self.assertIn('pool-1', warning.call_args[0][0])
+        self.assertEqual(set(['pool-1', 'pool-2']),
+                         self.balancers_manager.rebalance)
+        self.assertFalse(bal.balance.called)
+
+    def test_balance_tracks_pass(self):
+        bal = self._add_balancer('pool-1')
+
+        def balance():
+            self.assertIn('pool-1', self.balancers_manager.passes)
+
+        bal.balance.side_effect = balance
+        self.balancers_manager.balancing.add('pool-1')
+        self.balancers_manager._balance('pool-1', bal)
+        bal.balance.assert_called_once_with()
+        self.assertFalse(self.balancers_manager.passes)
+
+    def test_join_waits_for_balancers(self):
+        self.balancers_manager.join()
+        self.greenpool.waitall.assert_called_once_with()
+
 
 class DNRMBalancerTestCase(base.BaseTestCase):
     def setUp(self):
@@ -63,8 +231,11 @@ class DNRMBalancerTestCase(base.BaseTestCase):
         self.queue = mock.Mock()
 
         def push_side_effect(task):
-            res = task._resource
-            res['status'] = task.success_state
+            subtasks = (task.tasks if isinstance(task, tasks.BatchTask)
+                        else [task])
+            for subtask in subtasks:
+                res = subtask._resource
+                res['status'] = subtask.success_state
 
         self.queue.push.side_effect = push_side_effect
 
@@ -132,9 +303,19 @@ class DNRMBalancerTestCase(base.BaseTestCase):
         self.unused_set.get.side_effect = [res1, res2]
         self.unused_set.list.return_value = res1
         self.balancer.eliminate_deficit(4)
-        self.assertEqual(2, self.queue.push.call_count)
+        self.queue.push.assert_called_once_with(mock.ANY)
+        task = self.queue.push.call_args[0][0]
+        self.assertIsInstance(task, tasks.StartManyTask)
+        self.assertEqual(res2, [t.get_resource() for t in task.tasks])
         self.pool.push.assert_has_calls([mock.call(r['id']) for r in res1])
 
+    def test_start_many_one_resource(self):
+        resource = {'id': 'fake-resource-id', 'type': 'fake-resource-type',
+                    'status': resources.STATE_STOPPED}
+        self.balancer.start_many([resource])
+        task = self.queue.push.call_args[0][0]
+        self.assertIsInstance(task, tasks.StartTask)
+
     def test_eliminate_overflow(self):
         self.pool.pop.return_value = [
             {'id': 'fake-resource-id-1', 'type': 'fake-resource-type',
@@ -145,9 +326,37 @@ class DNRMBalancerTestCase(base.BaseTestCase):
         self.pool.pop.assert_called_once_with(2)
         self.assertEqual(2, self.queue.push.call_count)
 
+    def _stats(self, pool=0, processing=0, unused=0):
+        return [
+            {'pool': self.pool.name, 'status': resources.STATE_STARTED,
+             'processing': False, 'allocated': False, 'deleted': False,
+             'count': pool},
+            {'pool': self.pool.name, 'status': resources.STATE_STARTED,
+             'processing': False, 'allocated': True, 'deleted': False,
+             'count': 100},
+            {'pool': None, 'status': resources.STATE_STARTING,
+             'processing': True, 'allocated': False, 'deleted': False,
+             'count': processing},
+            {'pool': None, 'status': resources.STATE_STARTED,
+             'processing': False, 'allocated': False, 'deleted': False,
+             'count': unused},
+            {'pool': None, 'status': resources.STATE_STOPPED,
+             'processing': False, 'allocated': False, 'deleted': False,
+             'count': 100},
+        ]
+
+    def test_count_resources(self):
+        stats = self._stats(pool=1, processing=2, unused=3)
+        self.assertEqual(1, balancer.count_resources(
+            stats, pool=self.pool.name, allocated=False))
+        self.assertEqual(5, balancer.count_resources(
+            stats, pool=None, allocated=False,
+            status=resources.ACTIVE_STATES))
+        self.assertEqual(206, balancer.count_resources(stats))
+
     def test_balance_deficit(self):
-        self.pool.count.return_value = 0
-        self.unused_set.count.return_value = 0
+        self.unused_set.stats.return_value = self._stats(pool=0,
+                                                         processing=0)
         deficit = self.useFixture(
             mockpatch.PatchObject(self.balancer, 'eliminate_deficit')).mock
         overflow = self.useFixture(
@@ -155,24 +364,35 @@ class DNRMBalancerTestCase(base.BaseTestCase):
         self.useFixture(mockpatch.PatchObject(self.balancer,
                                               'stop_unused'))
         self.balancer.balance()
-        deficit.asserd_called_once_with(10)
+        deficit.assert_called_once_with(10)
         self.assertEqual(0, overflow.call_count)
 
+    def test_balance_deficit_processing(self):
+        self.unused_set.stats.return_value = self._stats(pool=3,
+                                                         processing=4)
+        deficit = self.useFixture(
+            mockpatch.PatchObject(self.balancer, 'eliminate_deficit')).mock
+        self.useFixture(mockpatch.PatchObject(self.balancer,
+                                              'stop_unused'))
+        self.balancer.balance()
+        deficit.assert_called_once_with(3)
+
     def test_balance_overflow(self):
-        self.pool.count.return_value = 30
-        self.unused_set.count.return_value = 5
+        self.unused_set.stats.return_value = self._stats(pool=30,
+                                                         processing=5)
         deficit = self.useFixture(
             mockpatch.PatchObject(self.balancer, 'eliminate_deficit')).mock
         overflow = self.useFixture(
             mockpatch.PatchObject(self.balancer, 'eliminate_overflow')).mock
         self.useFixture(mockpatch.PatchObject(self.balancer, 'stop_unused'))
         self.balancer.balance()
-        overflow.asserd_called_once_with(10)
+        overflow.assert_called_once_with(10)
         self.assertEqual(0, deficit.call_count)
 
     def test_balance(self):
-        self.pool.count.return_value = 10
-        self.unused_set.count.return_value = 5
+        self.unused_set.stats.return_value = self._stats(pool=10,
+                                                         processing=5,
+                                                         unused=2)
         deficit = self.useFixture(
             mockpatch.PatchObject(self.balancer, 'eliminate_deficit')).mock
         overflow = self.useFixture(
@@ -183,3 +403,84 @@ class DNRMBalancerTestCase(base.BaseTestCase):
         self.assertEqual(0, overflow.call_count)
         self.assertEqual(0, deficit.call_count)
         self.assertEqual(1, stop_unused.call_count)
+        self.assertEqual(1, self.unused_set.stats.call_count)
+        self.assertEqual(0, self.pool.count.call_count)
+        self.assertEqual(0, self.unused_set.count.call_count)
+
+    def test_balance_nothing_to_stop(self):
+        self.unused_set.stats.return_value = self._stats(pool=10)
+        stop_unused = self.useFixture(
+            mockpatch.PatchObject(self.balancer, 'stop_unused')).mock
+        self.balancer.balance()
+        self.assertEqual(0, stop_unused.call_count)
+
+
+class PredictiveBalancerTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(PredictiveBalancerTestCase, self).setUp()
+        self.config(predictive_window=60, predictive_boot_time=120,
+                    predictive_max_extra=10)
+        self.pool = mock.Mock()
+        self.pool.name = 'fake-pool'
+        self.unused_set = mock.Mock()
+        self.queue = mock.Mock()
+        self.time = self.useFixture(mockpatch.Patch(
+            'dnrm.balancer.balancer.time.time', return_value=1000.0)).mock
+        self.balancer = balancer.PredictiveDNRMBalancer(
+            self.pool, self.unused_set, 2, 5, self.queue)
+
+    def _stats(self, allocated):
+        return [{'pool': self.pool.name, 'status': resources.STATE_STARTED,
+                 'processing': False, 'allocated': True, 'deleted': False,
+                 'count': allocated}]
+
+    def test_no_allocations(self):
+        self.balancer.observe_allocations(1000.0)
+        self.balancer.observe_allocations(1060.0)
+        self.assertEqual(0, self.balancer.allocation_rate)
+        self.assertEqual((2, 5), self.balancer.compute_watermarks())
+
+    def test_allocation_rate(self):
+        self.balancer.observe_allocations(1000.0)
+        self.balancer.count_allocations(20)
+        self.balancer.count_allocations(40)
+        self.balancer.observe_allocations(1060.0)
+        rate = 1 - math.exp(-1)
+        self.assertAlmostEqual(rate, self.balancer.allocation_rate)
+        # Demand expected over 120 seconds of boot exceeds max extra.
+        self.assertEqual((12, 12), self.balancer.compute_watermarks())
+
+    def test_allocations_counted_once(self):
+        self.balancer.observe_allocations(1000.0)
+        self.balancer.count_allocations(60)
+        self.balancer.observe_allocations(1060.0)
+        self.balancer.observe_allocations(1120.0)
+        rate = 1 - math.exp(-1)
+        self.assertAlmostEqual(rate * math.exp(-1),
+                               self.balancer.allocation_rate)
+
+    def test_watermarks_bounded(self):
+        self.config(predictive_max_extra=3)
+        self.balancer.allocation_rate = 0.1
+        self.assertEqual((5, 5), self.balancer.compute_watermarks())
+
+    def test_boot_time(self):
+        res = [{'id': 'fake-id-1', 'type': 'fake-type'},
+               {'id': 'fake-id-2', 'type': 'fake-type'}]
+        self.balancer.start_many(res)
+        self.time.return_value = 1020.0
+        self.balancer.push_resources(res[:1])
+        self.assertAlmostEqual(120 + 0.3 * (20 - 120),
+                               self.balancer.boot_time)
+        self.pool.push.assert_called_once_with('fake-id-1')
+
+    def test_balance_updates_targets(self):
+        self.balancer.allocation_rate = 0.05
+        self.unused_set.stats.return_value = self._stats(0)
+        deficit = self.useFixture(mockpatch.PatchObject(
+            self.balancer, 'eliminate_deficit')).mock
+        self.balancer.balance()
+        deficit.assert_called_once_with(8)
+        self.assertEqual({'low_watermark': 8, 'high_watermark': 8,
+                          'allocation_rate': 0.05, 'boot_time': 120.0},
+                         self.balancer.get_targets())
@@ -32,6 +32,11 @@ class ResourceTestCase(base.BaseTestCase):
         db.resource_create(*args)
         self.mock.resource_create.assert_with_call(args)
 
+    def test_create_many(self):
+        args = [[('fake-resource', {})]]
+        db.resource_create_many(*args)
+        self.mock.resource_create_many.assert_called_once_with(*args)
+
     def test_delete(self):
         args = ['fake-resource-id']
         db.resource_delete(*args)
@@ -57,7 +62,60 @@ class ResourceTestCase(base.BaseTestCase):
         db.resource_find(*args)
         self.mock.resource_find.assert_with_call(args)
 
+    def test_iter(self):
+        db.resource_iter({}, 10)
+        self.mock.resource_iter.assert_called_once_with({}, 10)
+
     def test_compare_update(self):
         args = [0, {1: 2}, {3: 4}]
         db.resource_compare_update(*args)
         self.mock.resource_compare_update.assert_with_call(args)
+
+    def test_claim(self):
+        args = [{1: 2}, {3: 4}, 5, True]
+        db.resource_claim(*args)
+        self.mock.resource_claim.assert_called_once_with(*args)
+
+    def test_find_stuck(self):
+        db.resource_find_stuck({'STARTING': 0})
+        self.mock.resource_find_stuck.assert_called_once_with(
+            {'STARTING': 0})
+
+    def test_bulk_update(self):
+        args = [['fake-resource-id'], {1: 2}, True, {'STARTING': 0}]
+        db.resource_bulk_update(*args)
+        self.mock.resource_bulk_update.assert_called_once_with(*args)
+
+    def test_stats(self):
+        db.resource_stats('fake-resource-type')
+        self.mock.resource_stats.assert_called_once_with('fake-resource-type')
+
+    def test_aggregate(self):
+        db.resource_aggregate(['type'])
+        self.mock.resource_aggregate.assert_called_once_with(['type'])
+
+
+class TaskTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(TaskTestCase, self).setUp()
+        self.mock = self.useFixture(mockpatch.Patch('dnrm.db.api.IMPL',
+                                                    new=mock.Mock())).mock
+
+    def test_push(self):
+        args = ['fake-resource-id', {1: 2}, {3: 4}, 'fake-type', {}]
+        db.task_push(*args)
+        self.mock.task_push.assert_called_once_with(*args)
+
+    def test_finish(self):
+        args = ['fake-task-id', 'fake-resource-id', {1: 2}, {3: 4}]
+        db.task_finish(*args)
+        self.mock.task_finish.assert_called_once_with(*args)
+
+    def test_find(self):
+        db.task_find()
+        self.mock.task_find.assert_called_once_with(None)
+
+    def test_rollback(self):
+        args = [['fake-task-id'], {1: 2}]
+        db.task_rollback(*args)
+        self.mock.task_rollback.assert_called_once_with(*args)
@@ -14,6 +14,7 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+from eventlet import greenthread
 import mock
 
 from dnrm.drivers import base as driver_base
@@ -77,3 +78,52 @@ class DriverFactoryTestCase(base.BaseTestCase):
     def test_get_names_null(self):
         drivers = self.factory.get_names('L2')
         self.assertEqual(0, len(drivers))
+
+
+class ConcurrentDriver(TestDriver1):
+    def __init__(self):
+        super(ConcurrentDriver, self).__init__()
+        self.running = 0
+        self.max_running = 0
+
+    def init(self, resource):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        greenthread.sleep(0)
+        self.running -= 1
+        if resource.get('fail'):
+            raise RuntimeError('fake')
+
+
+class DriverBaseTestCase(base.BaseTestCase):
+    """DriverBase test case."""
+
+    def test_init_many(self):
+        self.config(init_concurrency=2)
+        driver = ConcurrentDriver()
+        errors = driver.init_many([{}, {'fail': True}, {}, {}, {}])
+        self.assertEqual(2, driver.max_running)
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], RuntimeError)
+        self.assertEqual([None] * 3, errors[2:])
+
+    def test_begin_init_many_not_supported(self):
+        self.assertIsNone(TestDriver1().begin_init_many([{}, {}]))
+
+    def test_begin_init_many(self):
+        driver = TestDriver1()
+        self.useFixture(mockpatch.PatchObject(
+            driver, 'begin_init', side_effect=['handle-1', 'handle-2']))
+        self.assertEqual(['handle-1', 'handle-2'],
+                         driver.begin_init_many([{'id': 1}, {'id': 2}]))
+
+    def test_begin_init_many_failed(self):
+        driver = TestDriver1()
+        self.useFixture(mockpatch.PatchObject(
+            driver, 'begin_init', side_effect=['handle-1', RuntimeError()]))
+        stop = self.useFixture(mockpatch.PatchObject(
+            driver, 'stop', side_effect=ValueError())).mock
+        self.assertRaises(RuntimeError, driver.begin_init_many,
+                          [{'id': 1}, {'id': 2}, {'id': 3}])
+        stop.assert_called_once_with({'id': 1})
+
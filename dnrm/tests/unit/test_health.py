@@ -0,0 +1,105 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import mock
+
+from dnrm import exceptions
+from dnrm.openstack.common.fixture import mockpatch
+from dnrm.resources import base as resources
+from dnrm.resources import health
+from dnrm.tests import base
+
+
+class HealthCheckerTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(HealthCheckerTestCase, self).setUp()
+        self.db = self.useFixture(mockpatch.Patch(
+            'dnrm.resources.health.db')).mock
+        self.driver = mock.Mock()
+        self.driver.check_many.side_effect = lambda items: [None] * len(items)
+        self.driver_factory = mock.Mock()
+        self.driver_factory.get.return_value = self.driver
+        self.checker = health.HealthChecker(self.driver_factory)
+        self.config(health_check_batch_size=2)
+
+    def _resources(self, count):
+        return [{'id': 'fake-id-%d' % i, 'type': 'fake-type',
+                 'pool': 'fake-type', 'status': resources.STATE_STARTED}
+                for i in xrange(count)]
+
+    def _pages(self, items):
+        return [items[i:i + 2] for i in xrange(0, len(items) + 1, 2)]
+
+    def test_sweep_all_healthy(self):
+        pooled = self._resources(5)
+        self.db.resource_find.side_effect = self._pages(pooled)
+
+        stats = self.checker.sweep()
+
+        filters = {'unused': False, 'allocated': False, 'processing': False,
+                   'deleted': False, 'status': resources.STATE_STARTED}
+        self.assertEqual(
+            [mock.call({'filters': filters, 'limit': 2}),
+             mock.call({'filters': filters, 'limit': 2,
+                        'marker': 'fake-id-1'}),
+             mock.call({'filters': filters, 'limit': 2,
+                        'marker': 'fake-id-3'})],
+            self.db.resource_find.call_args_list)
+        self.assertEqual(3, self.driver.check_many.call_count)
+        self.assertEqual(0, self.db.resource_compare_update.call_count)
+        self.assertEqual(5, stats['checked'])
+        self.assertEqual(0, stats['failed'])
+        self.assertIn('duration', stats)
+        self.assertEqual(stats, self.checker.last_sweep)
+
+    def test_sweep_marks_failed_as_error(self):
+        pooled = self._resources(3)
+        self.db.resource_find.side_effect = self._pages(pooled)
+
+        def check_many(items):
+            return [exceptions.ResourceCheckFailed(error='fake-error')
+                    if item['id'] == 'fake-id-1' else None for item in items]
+
+        self.driver.check_many.side_effect = check_many
+        self.db.resource_compare_update.return_value = {
+            'id': 'fake-id-1', 'status': resources.STATE_ERROR}
+
+        stats = self.checker.sweep()
+
+        self.db.resource_compare_update.assert_called_once_with(
+            'fake-id-1',
+            {'pool': 'fake-type', 'allocated': False, 'processing': False,
+             'status': resources.STATE_STARTED},
+            {'pool': None, 'status': resources.STATE_ERROR})
+        self.assertEqual(1, stats['failed'])
+
+    def test_sweep_skips_resource_taken_from_pool(self):
+        self.db.resource_find.side_effect = self._pages(self._resources(1))
+        self.driver.check_many.side_effect = Exception('fake-error')
+        self.db.resource_compare_update.return_value = None
+
+        stats = self.checker.sweep()
+
+        self.assertEqual(1, self.db.resource_compare_update.call_count)
+        self.assertEqual(0, stats['failed'])
+
+    def test_sweep_marker_gone(self):
+        self.db.resource_find.side_effect = [
+            self._resources(2), exceptions.MarkerNotFound(marker='fake-id-1')]
+
+        stats = self.checker.sweep()
+
+        self.assertEqual(2, stats['checked'])
@@ -16,6 +16,7 @@
 #    under the License.
 import mock
 
+from dnrm import exceptions
 from dnrm.openstack.common.fixture import mockpatch
 from dnrm.resources import manager
 from dnrm.tests import base
@@ -28,12 +29,17 @@ class ManagerTestCase(base.DBBaseTestCase):
     def setUpClass(cls):
         super(ManagerTestCase, cls).setUpClass()
         cls.df = mock.Mock()
-        cls.dv = mock.Mock()
-        cls.df.get.return_value = cls.dv
 
     def setUp(self):
         super(ManagerTestCase, self).setUp()
         self.context = None
+        # Driver factory is shared by the test case because resource
+        # manager is a singleton, so calls of previous tests are dropped.
+        # Driver is created anew, attributes patched by previous tests can't
+        # be reset.
+        self.dv = mock.Mock()
+        self.df.get.return_value = self.dv
+        self.df.reset_mock()
         self.useFixture(mockpatch.Patch('dnrm.drivers.factory.DriverFactory',
                                         return_value=self.df))
 
@@ -44,6 +50,7 @@ class ManagerTestCase(base.DBBaseTestCase):
                                                   'TaskQueue')).mock
 
         self.useFixture(mockpatch.Patch('dnrm.task_queue.QueuedTaskWorker'))
+        self.useFixture(mockpatch.Patch('dnrm.task_queue.TaskPoller'))
 
         self.bm = self.useFixture(mockpatch.Patch('dnrm.balancer.manager.'
                                                   'DNRMBalancersManager')).mock
@@ -52,6 +59,9 @@ class ManagerTestCase(base.DBBaseTestCase):
         self.useFixture(mockpatch.Patch('dnrm.pools.unused_set.UnusedSet'))
 
         self.useFixture(mockpatch.Patch('dnrm.resources.cleaner.Cleaner'))
+        self.useFixture(mockpatch.Patch('dnrm.resources.health.'
+                                        'HealthChecker'))
+        self.useFixture(mockpatch.Patch('dnrm.resources.reaper.Reaper'))
 
         self.manager = manager.ResourceManager()
 
@@ -66,7 +76,8 @@ class ManagerTestCase(base.DBBaseTestCase):
     def test_get(self):
         self.db.resource_get_by_id.return_value = {'id': 'fake-resource-id'}
         resource = self.manager.get(self.context, 'fake-resource-id')
-        self.db.resource_get_by_id.assert_called_once_with('fake-resource-id')
+        self.db.resource_get_by_id.assert_called_once_with('fake-resource-id',
+                                                           None)
         self.assertEqual(1, self.db.resource_get_by_id.call_count)
         self.assertDictEqual({'id': 'fake-resource-id'}, resource)
 
@@ -77,3 +88,200 @@ class ManagerTestCase(base.DBBaseTestCase):
             {'filters': {'id': 'fake-resource-id'}})
         self.assertEqual(1, self.db.resource_find.call_count)
         self.assertListEqual([{'id': 'fake-resource-id'}], resources)
+
+    def test_allocate(self):
+        self.db.resource_compare_update.return_value = {
+            'id': 'fake-resource-id', 'type': 'fake-type', 'allocated': True,
+            'pool': None}
+        resource = self.manager.allocate(self.context, 'fake-resource-id')
+        self.db.resource_compare_update.assert_called_once_with(
+            'fake-resource-id', {'processing': False, 'allocated': False},
+            {'allocated': True, 'processing': False})
+        self.assertEqual(0, self.db.resource_get_by_id.call_count)
+        self.assertEqual(0, self.db.resource_update.call_count)
+        self.assertTrue(resource['allocated'])
+
+    def test_allocate_counted(self):
+        balancer = mock.Mock()
+        self.useFixture(mockpatch.PatchObject(
+            self.manager, 'pools',
+            new={'fake-type': {'balancer': balancer}}))
+        self.db.resource_compare_update.return_value = {
+            'id': 'fake-resource-id', 'type': 'fake-type', 'allocated': True,
+            'pool': 'fake-type'}
+        self.manager.allocate(self.context, 'fake-resource-id')
+        balancer.count_allocations.assert_called_once_with(1)
+
+    def test_allocate_allocated(self):
+        self.db.resource_compare_update.return_value = None
+        self.db.resource_get_by_id.return_value = {
+            'id': 'fake-resource-id', 'processing': False, 'allocated': True}
+        self.assertRaises(exceptions.ResourceAllocated, self.manager.allocate,
+                          self.context, 'fake-resource-id')
+
+    def test_allocate_processing(self):
+        self.db.resource_compare_update.return_value = None
+        self.db.resource_get_by_id.return_value = {
+            'id': 'fake-resource-id', 'processing': True, 'allocated': False}
+        self.assertRaises(exceptions.ResourceProcessing,
+                          self.manager.allocate, self.context,
+                          'fake-resource-id')
+
+    def test_deallocate_allocated(self):
+        resource = {'id': 'fake-resource-id', 'type': 'fake-type',
+                    'allocated': False, 'processing': True}
+        self.db.resource_compare_update.side_effect = [None, resource]
+        self.db.resource_get_by_id.return_value = {
+            'id': 'fake-resource-id', 'processing': False, 'allocated': True}
+        self.assertEqual(resource, self.manager.deallocate(
+            self.context, 'fake-resource-id'))
+        self.db.resource_compare_update.assert_called_with(
+            'fake-resource-id', {'processing': False},
+            {'allocated': False, 'processing': True})
+        self.assertEqual(2, self.db.resource_compare_update.call_count)
+
+    def test_deallocate_keeps_changing(self):
+        self.db.resource_compare_update.return_value = None
+        self.db.resource_get_by_id.return_value = {
+            'id': 'fake-resource-id', 'processing': False, 'allocated': True}
+        self.assertRaises(exceptions.ResourceUpdateConflict,
+                          self.manager.deallocate, self.context,
+                          'fake-resource-id')
+        self.assertEqual(3, self.db.resource_compare_update.call_count)
+
+    def test_delete_allocated(self):
+        self.db.resource_compare_update.return_value = None
+        self.db.resource_get_by_id.return_value = {
+            'id': 'fake-resource-id', 'processing': False, 'allocated': True}
+        self.assertRaises(exceptions.ResourceAllocated, self.manager.delete,
+                          self.context, 'fake-resource-id')
+
+    def test_delete_force(self):
+        task_queue = self.useFixture(mockpatch.PatchObject(
+            self.manager, 'task_queue')).mock
+        resource = {'id': 'fake-resource-id', 'type': 'fake-type',
+                    'allocated': True, 'processing': True}
+        self.db.resource_get_by_id.return_value = resource
+        self.manager.delete(self.context, 'fake-resource-id', force=True)
+        self.assertFalse(self.db.resource_update.called)
+        self.assertFalse(self.db.resource_compare_update.called)
+        task = task_queue.push.call_args[0][0]
+        self.assertEqual(resource, task.get_resource())
+        self.assertEqual({'force': True}, task.get_params())
+        task_queue.push.assert_called_once_with(task, filters={})
+
+    def test_allocate_from_pool(self):
+        fake_pool = mock.Mock()
+        fake_pool.allocate.return_value = [{'id': 'fake-resource-id-1'},
+                                           {'id': 'fake-resource-id-2'}]
+        balancer = mock.Mock()
+        self.manager.pools['fake-driver'] = {'pool': fake_pool,
+                                             'balancer': balancer}
+        self.addCleanup(self.manager.pools.pop, 'fake-driver')
+        resources = self.manager.allocate_from_pool(self.context,
+                                                    'fake-driver', 2)
+        fake_pool.allocate.assert_called_once_with(2)
+        self.manager.balancer_manager.notify.assert_called_with(
+            'fake-driver')
+        self.assertListEqual([{'id': 'fake-resource-id-1'},
+                              {'id': 'fake-resource-id-2'}], resources)
+        balancer.count_allocations.assert_called_once_with(2)
+
+    def test_allocate_from_exhausted_pool(self):
+        fake_pool = mock.Mock()
+        fake_pool.allocate.return_value = []
+        fake_pool.count.return_value = 1
+        balancer = mock.Mock()
+        self.manager.pools['fake-driver'] = {'pool': fake_pool,
+                                             'balancer': balancer}
+        self.addCleanup(self.manager.pools.pop, 'fake-driver')
+        self.assertRaises(exceptions.PoolExhausted,
+                          self.manager.allocate_from_pool, self.context,
+                          'fake-driver', 2)
+        self.assertFalse(balancer.count_allocations.called)
+
+    def test_list_pools(self):
+        self.useFixture(mockpatch.PatchObject(
+            self.manager, 'pools',
+            new={'fake-driver-2': {}, 'fake-driver-1': {}}))
+        self.assertEqual(['fake-driver-1', 'fake-driver-2'],
+                         self.manager.list_pools(self.context))
+
+    def test_allocate_from_unknown_pool(self):
+        self.assertRaises(exceptions.InvalidDriverName,
+                          self.manager.allocate_from_pool, self.context,
+                          'unknown-driver')
+
+    def test_iterate(self):
+        self.db.resource_iter.return_value = iter([{'id': 'fake-id'}])
+        resources = self.manager.iterate(self.context,
+                                         {'pool': 'fake-pool',
+                                          'sort_key': 'status'})
+        self.db.resource_iter.assert_called_once_with(
+            {'filters': {'pool': 'fake-pool'}, 'sort_key': 'status'})
+        self.assertEqual([{'id': 'fake-id'}], list(resources))
+
+    def test_stats(self):
+        self.db.resource_aggregate.return_value = [{'count': 1}]
+        balancer = mock.Mock()
+        balancer.get_targets.return_value = {'low_watermark': 2,
+                                             'high_watermark': 3}
+        self.useFixture(mockpatch.PatchObject(
+            self.manager, 'pools',
+            new={'fake-driver': {'balancer': balancer}}))
+        task_queue = self.useFixture(mockpatch.PatchObject(
+            self.manager, 'task_queue')).mock
+        task_queue.lane_depth.return_value = {'default': {1: 2}}
+        self.manager.balancer_manager.overdue_passes.return_value = {
+            'fake-driver': 61}
+        health_checker = self.useFixture(mockpatch.PatchObject(
+            self.manager, 'health_checker')).mock
+        health_checker.last_sweep = {'duration': 0.5, 'checked': 10,
+                                     'failed': 1}
+        with mock.patch('dnrm.common.config.get_driver_config',
+                        return_value={'low_watermark': '1',
+                                      'high_watermark': '3'}):
+            stats = self.manager.stats(self.context)
+        self.db.resource_aggregate.assert_called_once_with(
+            ['type', 'status', 'unused', 'allocated'])
+        self.assertEqual({'resources': [{'count': 1}],
+                          'watermarks': {'fake-driver': {
+                              'low_watermark': 1, 'high_watermark': 3}},
+                          'targets': {'fake-driver': {
+                              'low_watermark': 2, 'high_watermark': 3}},
+                          'queue': {'default': {1: 2}},
+                          'overdue_balancers': {'fake-driver': 61},
+                          'health': {'duration': 0.5, 'checked': 10,
+                                     'failed': 1}},
+                         stats)
+
+    def test_add_many(self):
+        self.useFixture(mockpatch.PatchObject(
+            self.dv, 'validate_resource',
+            side_effect=[None, ValueError('fake'), None]))
+        self.useFixture(mockpatch.PatchObject(
+            self.dv, 'prepare_resource',
+            side_effect=lambda state, data: data))
+        self.db.resource_create_many.return_value = [{'id': 'fake-id-1'},
+                                                     {'id': 'fake-id-3'}]
+        results = self.manager.add_many(self.context,
+                                        [('fake-driver', {'n': 1}),
+                                         ('fake-driver', {'n': 2}),
+                                         ('fake-driver', {'n': 3})])
+        self.db.resource_create_many.assert_called_once_with(
+            [('fake-driver', {'n': 1}), ('fake-driver', {'n': 3})])
+        self.assertEqual({'id': 'fake-id-1'}, results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual({'id': 'fake-id-3'}, results[2])
+
+    def test_add_many_insert_failed(self):
+        self.useFixture(mockpatch.PatchObject(
+            self.dv, 'prepare_resource',
+            side_effect=lambda state, data: data))
+        error = exceptions.ResourceFieldRequired(field='class')
+        self.db.resource_create_many.return_value = [error,
+                                                     {'id': 'fake-id-2'}]
+        results = self.manager.add_many(self.context,
+                                        [('fake-driver', {'n': 1}),
+                                         ('fake-driver', {'n': 2})])
+        self.assertEqual([error, {'id': 'fake-id-2'}], results)
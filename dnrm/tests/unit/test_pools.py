@@ -36,51 +36,51 @@ class PoolTestCase(base.BaseTestCase):
                                                     'processing': False})
 
     def test_pop_one(self):
-        resources = [{'id': 'fake-uuid', 'pool': self.pool_name}]
-        self.db.resource_find.return_value = resources
-        self.db.resource_update.return_value = {'pool': None,
-                                                'processing': True}
+        resources = [{'id': 'fake-uuid', 'pool': None, 'processing': True}]
+        self.db.resource_claim.return_value = resources
 
         pop_resources = self.pool.pop()
 
         self.assertIsNone(pop_resources[0]['pool'])
         self.assertTrue(pop_resources[0]['processing'])
 
-        self.db.resource_find.assert_called_with({
-            'limit': 1,
-            'filters': {'allocated': False, 'pool': self.pool_name}
-        })
-        self.db.resource_update.assert_called_with('fake-uuid',
-                                                   {'pool': None,
-                                                    'processing': True})
-
-        self.assertEqual(1, self.db.resource_find.call_count)
-        self.assertEqual(1, self.db.resource_update.call_count)
+        self.db.resource_claim.assert_called_once_with(
+            {'allocated': False, 'pool': self.pool_name},
+            {'pool': None, 'processing': True}, 1)
+        self.assertEqual(0, self.db.resource_find.call_count)
+        self.assertEqual(0, self.db.resource_update.call_count)
 
     def test_pop_two(self):
-        resources = [{'id': 'fake-uuid-1', 'pool': self.pool_name},
-                     {'id': 'fake-uuid-2', 'pool': self.pool_name}]
-        self.db.resource_find.return_value = resources
-        self.db.resource_update.return_value = {'pool': None,
-                                                'processing': True}
+        resources = [{'id': 'fake-uuid-1', 'pool': None, 'processing': True},
+                     {'id': 'fake-uuid-2', 'pool': None, 'processing': True}]
+        self.db.resource_claim.return_value = resources
 
         pop_resources = self.pool.pop(2)
 
-        for resource in pop_resources:
-            self.assertIsNone(resource['pool'])
-            self.assertTrue(resource['processing'])
-
-        self.db.resource_find.assert_called_with({
-            'limit': 2,
-            'filters': {'allocated': False, 'pool': self.pool_name}
-        })
-
-        self.assertEqual(1, self.db.resource_find.call_count)
-        self.assertEqual(2, self.db.resource_update.call_count)
-
-        calls = [mock.call('fake-uuid-1', {'pool': None, 'processing': True}),
-                 mock.call('fake-uuid-2', {'pool': None, 'processing': True})]
-        self.db.resource_update.assert_has_calls(calls)
+        self.assertListEqual(resources, pop_resources)
+        self.db.resource_claim.assert_called_once_with(
+            {'allocated': False, 'pool': self.pool_name},
+            {'pool': None, 'processing': True}, 2)
+        self.assertEqual(0, self.db.resource_update.call_count)
+
+    def test_pop_all_not_processing(self):
+        self.db.resource_claim.return_value = []
+        self.pool.pop(count=None, processing=False)
+        self.db.resource_claim.assert_called_once_with(
+            {'allocated': False, 'pool': self.pool_name},
+            {'pool': None, 'processing': False}, None)
+
+    def test_allocate(self):
+        resources = [{'id': 'fake-uuid', 'pool': self.pool_name,
+                      'allocated': True}]
+        self.db.resource_claim.return_value = resources
+
+        allocated = self.pool.allocate(1)
+
+        self.assertListEqual(resources, allocated)
+        self.db.resource_claim.assert_called_once_with(
+            {'allocated': False, 'pool': self.pool_name, 'processing': False},
+            {'allocated': True}, 1, all_or_nothing=True)
 
     def test_list(self):
         resources = [{'id': 'fake-uuid-1', 'pool': self.pool_name},
@@ -141,17 +141,24 @@ class UnusedSetTestCase(base.BaseTestCase):
         self.assertEqual(0, self.dv.prepare_resource.call_count)
 
     def test_get_resources(self):
-        self.db.resource_find.return_value = []
-        self.db.resource_update.return_value = {'processing': True}
+        self.db.resource_claim.return_value = []
         self.unused_set.get('STARTED', 2)
-        filter_opts = {'filters': {'type': 'fake-resource_type',
-                                   'pool': None, 'allocated': False,
-                                   'processing': False, 'deleted': False,
-                                   'status': 'STARTED'},
-                       'limit': 2}
-        self.db.resource_find.assert_called_with(filter_opts)
+        filters = {'type': 'fake-resource_type', 'pool': None,
+                   'allocated': False, 'processing': False, 'deleted': False,
+                   'status': 'STARTED'}
+        self.db.resource_claim.assert_called_once_with(
+            filters, {'processing': True}, 2)
+        self.assertEqual(0, self.db.resource_find.call_count)
         self.assertEqual(2, self.dv.prepare_resource.call_count)
 
+    def test_get_resources_exists(self):
+        self.db.resource_claim.return_value = [{'id': 'id-1'},
+                                               {'id': 'id-2'}]
+        resources = self.unused_set.get('STARTED', 2)
+        self.assertEqual(2, len(resources))
+        self.assertEqual(0, self.dv.prepare_resource.call_count)
+        self.assertEqual(0, self.db.resource_update.call_count)
+
     def test_count(self):
         self.db.resource_count.return_value = 10
         res = self.unused_set.count('status')
@@ -161,3 +168,8 @@ class UnusedSetTestCase(base.BaseTestCase):
                          'processing': False, 'deleted': False}})
         self.assertEqual(1, self.db.resource_count.call_count)
         self.assertEqual(10, res)
+
+    def test_stats(self):
+        self.db.resource_stats.return_value = []
+        self.assertEqual([], self.unused_set.stats())
+        self.db.resource_stats.assert_called_once_with('fake-resource_type')
@@ -0,0 +1,106 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import datetime
+
+import mock
+
+from dnrm.openstack.common.fixture import mockpatch
+from dnrm.openstack.common import timeutils
+from dnrm.resources import base as resources
+from dnrm.resources import reaper
+from dnrm.tests import base
+
+
+class ReaperTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(ReaperTestCase, self).setUp()
+        self.db = self.useFixture(mockpatch.Patch(
+            'dnrm.resources.reaper.db')).mock
+        self.task_queue = mock.Mock()
+        self.task_queue.is_queued.return_value = False
+        self.task_queue.started_at.return_value = None
+        self.reaper = reaper.Reaper(self.task_queue)
+        self.config(processing_deadlines={'STARTING': '30'})
+        now = datetime.datetime(2013, 10, 1, 12, 0, 0)
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
+        self.deadline = now - datetime.timedelta(seconds=30)
+
+    def test_sweep_nothing_stuck(self):
+        self.db.resource_find_stuck.return_value = []
+        self.reaper.sweep()
+        self.db.resource_find_stuck.assert_called_once_with(
+            {'STARTING': self.deadline})
+        self.assertEqual(0, self.db.resource_bulk_update.call_count)
+
+    def test_sweep_error(self):
+        self.db.resource_find_stuck.return_value = [
+            {'id': 'fake-id-1', 'status': 'STARTING'},
+            {'id': 'fake-id-2', 'status': 'STARTING'}]
+        self.reaper.sweep()
+        self.assertEqual(0, self.task_queue.requeue.call_count)
+        self.db.resource_bulk_update.assert_called_once_with(
+            mock.ANY, {'status': resources.STATE_ERROR, 'processing': False},
+            finish_tasks=True, deadlines={'STARTING': self.deadline})
+        self.assertEqual(
+            ['fake-id-1', 'fake-id-2'],
+            sorted(self.db.resource_bulk_update.call_args[0][0]))
+
+    def test_sweep_requeue(self):
+        self.config(reaper_requeue=True)
+        self.db.resource_find_stuck.return_value = [
+            {'id': 'fake-id-1', 'status': 'STARTING'},
+            {'id': 'fake-id-2', 'status': 'STARTING'},
+            {'id': 'fake-id-3', 'status': 'STARTING'}]
+        entries = [{'id': 'fake-task-1', 'resource_id': 'fake-id-1'},
+                   {'id': 'fake-task-2', 'resource_id': 'fake-id-2'}]
+        self.db.task_find.return_value = entries
+        self.task_queue.requeue.return_value = [entries[1]]
+
+        self.reaper.sweep()
+
+        self.task_queue.requeue.assert_called_once_with(entries)
+        self.db.resource_bulk_update.assert_has_calls([
+            mock.call(['fake-id-1'], {'processing': True},
+                      deadlines={'STARTING': self.deadline}),
+            mock.call(mock.ANY, {'status': resources.STATE_ERROR,
+                                 'processing': False}, finish_tasks=True,
+                      deadlines={'STARTING': self.deadline})])
+        self.assertEqual(
+            ['fake-id-2', 'fake-id-3'],
+            sorted(self.db.resource_bulk_update.call_args[0][0]))
+
+    def test_sweep_skips_queued(self):
+        self.db.resource_find_stuck.return_value = [
+            {'id': 'fake-id-1', 'status': 'STARTING'}]
+        self.task_queue.is_queued.return_value = True
+        self.reaper.sweep()
+        self.task_queue.is_queued.assert_called_once_with('fake-id-1')
+        self.assertEqual(0, self.db.resource_bulk_update.call_count)
+
+    def test_sweep_skips_recently_started(self):
+        self.db.resource_find_stuck.return_value = [
+            {'id': 'fake-id-1', 'status': 'STARTING'},
+            {'id': 'fake-id-2', 'status': 'STARTING'}]
+        started = {'fake-id-1': self.deadline + datetime.timedelta(seconds=1),
+                   'fake-id-2': self.deadline - datetime.timedelta(seconds=1)}
+        self.task_queue.started_at.side_effect = started.get
+        self.reaper.sweep()
+        self.db.resource_bulk_update.assert_called_once_with(
+            ['fake-id-2'],
+            {'status': resources.STATE_ERROR, 'processing': False},
+            finish_tasks=True, deadlines={'STARTING': self.deadline})
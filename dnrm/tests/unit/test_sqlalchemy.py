@@ -14,11 +14,19 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import datetime
+
+import fixtures
 import sqlalchemy
+from sqlalchemy.engine import reflection
 
 from dnrm.db import sqlalchemy as db
+from dnrm.db.sqlalchemy import api as db_api
 from dnrm.db.sqlalchemy import models
 from dnrm import exceptions
+from dnrm.openstack.common.db import exception as db_exception
+from dnrm.openstack.common.db.sqlalchemy import session as db_session
+from dnrm.openstack.common import timeutils
 from dnrm.tests import base
 
 
@@ -83,6 +91,38 @@ class ResourceTestCase(base.DBBaseTestCase):
         res = self._create()
         self.assertEqual('fake-resource-type', res['type'])
 
+    def test_create_many(self):
+        resources = db.resource_create_many(
+            [('fake-resource-type', {'class': 'L3', 'address': '10.0.0.1'}),
+             ('fake-resource-type-2', {'class': 'L3', 'status': 'STARTED'})])
+        self.assertEqual(2, len(resources))
+        self.assertEqual('10.0.0.1', resources[0]['address'])
+        self.assertEqual('STOPPED', resources[0]['status'])
+        self.assertEqual('STARTED', resources[1]['status'])
+        for resource in resources:
+            self.assertDictEqual(resource,
+                                 db.resource_get_by_id(resource['id']))
+
+    def test_create_many_required_field(self):
+        resources = db.resource_create_many(
+            [('fake-resource-type', {'address': '10.0.0.1'}),
+             ('fake-resource-type', {'class': 'L3'})])
+        self.assertIsInstance(resources[0], exceptions.ResourceFieldRequired)
+        self.assertEqual('L3', resources[1]['class'])
+        self.assertEqual(1, len(db.resource_find({})))
+
+    def test_create_many_insert_failed(self):
+        resources = db.resource_create_many(
+            [('fake-resource-type', {'class': 'L3', 'status': 'FAKE'}),
+             ('fake-resource-type', {'class': 'L3', 'address': '10.0.0.1'})])
+        self.assertIsInstance(resources[0], db_exception.DBError)
+        self.assertEqual('10.0.0.1', resources[1]['address'])
+        self.assertDictEqual(resources[1],
+                             db.resource_get_by_id(resources[1]['id']))
+
+    def test_create_many_empty(self):
+        self.assertEqual([], db.resource_create_many([]))
+
     def test_delete(self):
         res = self._create()
         db.resource_delete(res['id'])
@@ -118,6 +158,96 @@ class ResourceTestCase(base.DBBaseTestCase):
         for i, r in enumerate(resources):
             self.assertDictEqual(r, dict(resources2[i]))
 
+    def test_iter(self):
+        resources = [self._create() for _i in range(3)]
+        found = db.resource_iter({'filters': {'type': 'fake-resource-type'}},
+                                 batch_size=2)
+        self.assertEqual(resources, list(found))
+
+    def test_iter_invalid_options(self):
+        self.assertRaises(ValueError, db.resource_iter, {'fake': 'fake'})
+
+    def test_find_fields(self):
+        res = db.resource_create('fake-resource-type',
+                                 {'class': 'L3', 'address': '10.0.0.1'})
+        found = db.resource_find({'fields': ['status', 'class', 'unused']})
+        self.assertEqual([{'id': res['id'], 'status': res['status'],
+                           'class': 'L3', 'unused': True}], found)
+
+    def test_find_data_fields(self):
+        res = db.resource_create('fake-resource-type',
+                                 {'class': 'L3', 'address': '10.0.0.1'})
+        found = list(db.resource_iter({'fields': ['address']}))
+        self.assertEqual([{'id': res['id'], 'address': '10.0.0.1'}], found)
+
+    def test_get_by_id_fields(self):
+        res = self._create()
+        self.assertEqual({'id': res['id'], 'pool': None},
+                         db.resource_get_by_id(res['id'], ['pool']))
+        self.assertRaises(exceptions.ResourceNotFound,
+                          db.resource_get_by_id, 'fake-id', ['pool'])
+
+    def test_aggregate(self):
+        self._create()
+        self._create()
+        res = self._create('fake-resource-type-2')
+        db.resource_update(res['id'], {'pool': 'fake-resource-type-2'})
+        stats = db.resource_aggregate(['type', 'unused'])
+        self.assertEqual(
+            sorted([{'type': 'fake-resource-type', 'unused': True,
+                     'count': 2},
+                    {'type': 'fake-resource-type-2', 'unused': False,
+                     'count': 1}]),
+            sorted(stats))
+
+    def test_aggregate_invalid_field(self):
+        self.assertRaises(ValueError, db.resource_aggregate, ['data'])
+
+    def test_find_offset(self):
+        ids = sorted(self._create()['id'] for _i in range(3))
+        resources = db.resource_find({'limit': 1, 'offset': 1})
+        self.assertEqual([ids[1]], [r['id'] for r in resources])
+
+    def test_find_marker(self):
+        ids = sorted(self._create()['id'] for _i in range(5))
+        page1 = db.resource_find({'limit': 2})
+        self.assertEqual(ids[:2], [r['id'] for r in page1])
+        page2 = db.resource_find({'limit': 2, 'marker': page1[-1]['id']})
+        self.assertEqual(ids[2:4], [r['id'] for r in page2])
+        page3 = db.resource_find({'limit': 2, 'marker': page2[-1]['id']})
+        self.assertEqual(ids[4:], [r['id'] for r in page3])
+
+    def test_find_sort(self):
+        resources = [self._create('fake-resource-type-%d' % i)
+                     for i in range(3)]
+        found = db.resource_find({'sort_key': 'type', 'sort_dir': 'desc'})
+        self.assertEqual([r['id'] for r in reversed(resources)],
+                         [r['id'] for r in found])
+
+    def test_find_sort_marker(self):
+        resources = [self._create('fake-resource-type-%d' % (i % 2))
+                     for i in range(4)]
+        expected = sorted(resources, key=lambda r: (r['type'], r['id']),
+                          reverse=True)
+        page1 = db.resource_find({'sort_key': 'type', 'sort_dir': 'desc',
+                                  'limit': 3})
+        page2 = db.resource_find({'sort_key': 'type', 'sort_dir': 'desc',
+                                  'limit': 3, 'marker': page1[-1]['id']})
+        self.assertEqual([r['id'] for r in expected],
+                         [r['id'] for r in page1 + page2])
+
+    def test_find_invalid_sort(self):
+        self.assertRaises(ValueError, db.resource_find,
+                          {'sort_key': 'data'})
+        self.assertRaises(ValueError, db.resource_find,
+                          {'sort_key': 'pool'})
+        self.assertRaises(ValueError, db.resource_find,
+                          {'sort_dir': 'fake'})
+
+    def test_find_marker_not_found(self):
+        self.assertRaises(exceptions.MarkerNotFound, db.resource_find,
+                          {'marker': 'fake-id'})
+
     def test_compare_update(self):
         resource1 = self._create()
         values = {'processing': not resource1['processing']}
@@ -133,6 +263,15 @@ class ResourceTestCase(base.DBBaseTestCase):
                                                values)
         self.assertIsNone(resource2)
 
+    def test_compare_update_not_found(self):
+        self.assertIsNone(db.resource_compare_update('fake-id', {},
+                                                     {'processing': True}))
+
+    def test_compare_update_data_field(self):
+        resource = self._create()
+        self.assertRaises(ValueError, db.resource_compare_update,
+                          resource['id'], {}, {'fake-field': 'fake-value'})
+
     def test_compare_update_updates_right_resource(self):
         self._create()
         resource2 = self._create()
@@ -143,3 +282,280 @@ class ResourceTestCase(base.DBBaseTestCase):
         self.assertIsNotNone(retval)
         resource2 = db.resource_get_by_id(resource2['id'])
         self.assertEqual('ERROR', resource2['status'])
+
+    def test_claim(self):
+        resources = [self._create() for _i in range(3)]
+        self._create('fake-resource-type-2')
+        claimed = db.resource_claim({'type': 'fake-resource-type'},
+                                    {'pool': 'fake-pool',
+                                     'processing': True}, 2)
+        self.assertEqual(2, len(claimed))
+        for resource in claimed:
+            self.assertEqual('fake-pool', resource['pool'])
+            self.assertTrue(resource['processing'])
+            self.assertFalse(resource['unused'])
+            self.assertDictEqual(resource,
+                                 db.resource_get_by_id(resource['id']))
+        claimed_ids = set(r['id'] for r in claimed)
+        for resource in resources:
+            if resource['id'] not in claimed_ids:
+                self.assertDictEqual(resource,
+                                     db.resource_get_by_id(resource['id']))
+
+    def test_claim_all(self):
+        for _i in range(3):
+            self._create()
+        claimed = db.resource_claim({'type': 'fake-resource-type'},
+                                    {'processing': True})
+        self.assertEqual(3, len(claimed))
+        self.assertEqual(0, db.resource_count(
+            {'filters': {'processing': False}}))
+
+    def test_claim_all_or_nothing(self):
+        for _i in range(2):
+            self._create()
+        claimed = db.resource_claim({'type': 'fake-resource-type'},
+                                    {'processing': True}, 3,
+                                    all_or_nothing=True)
+        self.assertEqual([], claimed)
+        self.assertEqual(0, db.resource_count(
+            {'filters': {'processing': True}}))
+        claimed = db.resource_claim({'type': 'fake-resource-type'},
+                                    {'processing': True}, 2,
+                                    all_or_nothing=True)
+        self.assertEqual(2, len(claimed))
+
+    def test_claim_nothing(self):
+        self._create()
+        claimed = db.resource_claim({'type': 'fake-resource-type-2'},
+                                    {'processing': True}, 1)
+        self.assertEqual([], claimed)
+
+    def test_claim_changed_after_select(self):
+        for _i in range(3):
+            self._create()
+        claim_ids = db_api._claim_ids
+        changed = []
+
+        def change_first(session, filters, limit):
+            ids = claim_ids(session, filters, limit)
+            if not changed:
+                changed.append(ids[0])
+                db.resource_update(ids[0], {'processing': True})
+            return ids
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'dnrm.db.sqlalchemy.api._claim_ids', change_first))
+        claimed = db.resource_claim({'type': 'fake-resource-type',
+                                     'processing': False},
+                                    {'pool': 'fake-pool',
+                                     'processing': True}, 2)
+        self.assertEqual(2, len(claimed))
+        self.assertNotIn(changed[0], [r['id'] for r in claimed])
+        self.assertIsNone(db.resource_get_by_id(changed[0])['pool'])
+        self.assertEqual(2, db.resource_count(
+            {'filters': {'pool': 'fake-pool'}}))
+
+    def test_claim_keeps_changing(self):
+        for _i in range(3):
+            self._create()
+        claim_ids = db_api._claim_ids
+
+        def change_first(session, filters, limit):
+            ids = claim_ids(session, filters, limit)
+            db.resource_update(ids[0], {'processing': True})
+            return ids
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'dnrm.db.sqlalchemy.api._claim_ids', change_first))
+        self.assertRaises(exceptions.ResourceClaimConflict,
+                          db.resource_claim,
+                          {'type': 'fake-resource-type', 'processing': False},
+                          {'pool': 'fake-pool', 'processing': True})
+        self.assertEqual(0, db.resource_count(
+            {'filters': {'pool': 'fake-pool'}}))
+
+    def test_claim_invalid_values(self):
+        self.assertRaises(ValueError, db.resource_claim, {}, {'foo': 'bar'})
+
+    def test_stats(self):
+        for _i in range(3):
+            self._create()
+        resource = self._create()
+        db.resource_update(resource['id'], {'pool': 'fake-pool'})
+        self._create('fake-resource-type-2')
+        stats = db.resource_stats('fake-resource-type')
+        self.assertEqual(2, len(stats))
+        expected = [
+            {'pool': None, 'status': 'STOPPED', 'processing': False,
+             'allocated': False, 'deleted': False, 'count': 3},
+            {'pool': 'fake-pool', 'status': 'STOPPED', 'processing': False,
+             'allocated': False, 'deleted': False, 'count': 1},
+        ]
+        for item in expected:
+            self.assertIn(item, stats)
+
+    def test_indexes(self):
+        inspector = reflection.Inspector.from_engine(db_session.get_engine())
+        indexes = dict((index['name'], index['column_names'])
+                       for index in inspector.get_indexes('resources'))
+        self.assertEqual(['type', 'pool', 'allocated', 'processing',
+                          'deleted', 'status'], indexes['ix_resources_unused'])
+        self.assertEqual(['pool', 'allocated'], indexes['ix_resources_pool'])
+        self.assertEqual(['status', 'processing'],
+                         indexes['ix_resources_status'])
+        self.assertEqual(['processing', 'status', 'updated_at'],
+                         indexes['ix_resources_processing'])
+
+    def test_find_stuck(self):
+        res1 = self._create()
+        res2 = self._create()
+        self._create()
+        for res in (res1, res2):
+            db.resource_update(res['id'], {'status': 'STARTING',
+                                           'processing': True})
+        future = timeutils.utcnow() + datetime.timedelta(seconds=60)
+        past = timeutils.utcnow() - datetime.timedelta(seconds=60)
+        stuck = db.resource_find_stuck({'STARTING': future,
+                                        'STOPPING': future})
+        self.assertEqual(sorted([res1['id'], res2['id']]),
+                         sorted(res['id'] for res in stuck))
+        self.assertNotIn('updated_at', stuck[0])
+        self.assertEqual([], db.resource_find_stuck({'STARTING': past}))
+        self.assertEqual([], db.resource_find_stuck({}))
+
+    def test_find_stuck_never_updated(self):
+        values = {'class': 'L3', 'status': 'STARTING', 'processing': True}
+        res1 = db.resource_create('fake-resource-type', values)
+        res2, = db.resource_create_many([('fake-resource-type', values)])
+        future = timeutils.utcnow() + datetime.timedelta(seconds=60)
+        past = timeutils.utcnow() - datetime.timedelta(seconds=60)
+        self.assertEqual(sorted([res1['id'], res2['id']]),
+                         sorted(r['id'] for r in db.resource_find_stuck(
+                             {'STARTING': future})))
+        self.assertEqual([], db.resource_find_stuck({'STARTING': past}))
+
+    def test_bulk_update(self):
+        res1 = self._create()
+        res2 = self._create()
+        db.resource_update(res1['id'], {'processing': True})
+        count = db.resource_bulk_update([res1['id'], res2['id']],
+                                        {'status': 'ERROR',
+                                         'processing': False})
+        self.assertEqual(1, count)
+        self.assertEqual('ERROR', db.resource_get_by_id(res1['id'])['status'])
+        self.assertEqual('STOPPED',
+                         db.resource_get_by_id(res2['id'])['status'])
+
+    def test_bulk_update_deadlines(self):
+        res1 = self._create()
+        res2 = self._create()
+        db.resource_update(res1['id'], {'status': 'STARTING',
+                                        'processing': True})
+        db.resource_update(res2['id'], {'status': 'STOPPING',
+                                        'processing': True})
+        future = timeutils.utcnow() + datetime.timedelta(seconds=60)
+        past = timeutils.utcnow() - datetime.timedelta(seconds=60)
+        count = db.resource_bulk_update([res1['id'], res2['id']],
+                                        {'status': 'ERROR',
+                                         'processing': False},
+                                        deadlines={'STARTING': future,
+                                                   'STARTED': future})
+        self.assertEqual(1, count)
+        self.assertEqual('ERROR', db.resource_get_by_id(res1['id'])['status'])
+        self.assertEqual('STOPPING',
+                         db.resource_get_by_id(res2['id'])['status'])
+        self.assertEqual(0, db.resource_bulk_update(
+            [res2['id']], {'status': 'ERROR'},
+            deadlines={'STOPPING': past}))
+
+
+class TaskTestCase(base.DBBaseTestCase):
+    def setUp(self):
+        super(TaskTestCase, self).setUp()
+        self.resource = db.resource_create('fake-resource-type',
+                                           {'class': 'L3'})
+
+    def _push(self, filters=None):
+        return db.task_push(self.resource['id'],
+                            filters or {'status': ('STOPPED',)},
+                            {'status': 'STARTING', 'processing': True},
+                            'StartTask', {'fake': 'fake'})
+
+    def test_push(self):
+        task = self._push()
+        self.assertEqual(self.resource['id'], task['resource_id'])
+        self.assertEqual('StartTask', task['type'])
+        self.assertEqual({'fake': 'fake'}, task['params'])
+        self.assertEqual([task], db.task_find())
+        resource = db.resource_get_by_id(self.resource['id'])
+        self.assertEqual('STARTING', resource['status'])
+        self.assertTrue(resource['processing'])
+
+    def test_push_not_matched(self):
+        self.assertIsNone(self._push({'status': ('STARTED',)}))
+        self.assertEqual([], db.task_find())
+        resource = db.resource_get_by_id(self.resource['id'])
+        self.assertEqual('STOPPED', resource['status'])
+
+    def _finish(self, task):
+        return db.task_finish(task['id'], self.resource['id'],
+                              {'status': 'STARTING', 'processing': True},
+                              {'status': 'STARTED', 'processing': False})
+
+    def test_finish(self):
+        task = self._push()
+        resource = self._finish(task)
+        self.assertEqual('STARTED', resource['status'])
+        self.assertFalse(resource['processing'])
+        self.assertEqual([], db.task_find())
+
+    def test_finish_rolled_back(self):
+        task = self._push()
+        db.task_rollback([task['id']], {'status': 'ERROR',
+                                        'processing': False})
+        self.assertIsNone(self._finish(task))
+        resource = db.resource_get_by_id(self.resource['id'])
+        self.assertEqual('ERROR', resource['status'])
+
+    def test_finish_superseded(self):
+        task = self._push()
+        db.resource_update(self.resource['id'], {'status': 'DELETING'})
+        self.assertIsNone(self._finish(task))
+        self.assertEqual([], db.task_find())
+        resource = db.resource_get_by_id(self.resource['id'])
+        self.assertEqual('DELETING', resource['status'])
+
+    def test_find_by_resource(self):
+        task = self._push()
+        self.assertEqual([task], db.task_find([self.resource['id']]))
+        self.assertEqual([], db.task_find(['fake-id']))
+
+    def test_bulk_update_finish_tasks(self):
+        self._push()
+        db.resource_bulk_update([self.resource['id']],
+                                {'status': 'ERROR', 'processing': False},
+                                finish_tasks=True)
+        self.assertEqual([], db.task_find())
+
+    def test_bulk_update_finish_tasks_deadlines(self):
+        self._push()
+        past = timeutils.utcnow() - datetime.timedelta(seconds=60)
+        count = db.resource_bulk_update([self.resource['id']],
+                                        {'status': 'ERROR',
+                                         'processing': False},
+                                        finish_tasks=True,
+                                        deadlines={'STARTING': past})
+        self.assertEqual(0, count)
+        self.assertEqual(1, len(db.task_find()))
+        resource = db.resource_get_by_id(self.resource['id'])
+        self.assertEqual('STARTING', resource['status'])
+
+    def test_rollback(self):
+        task = self._push()
+        db.task_rollback([task['id']], {'status': 'ERROR',
+                                        'processing': False})
+        self.assertEqual([], db.task_find())
+        resource = db.resource_get_by_id(self.resource['id'])
+        self.assertEqual('ERROR', resource['status'])
+        self.assertFalse(resource['processing'])
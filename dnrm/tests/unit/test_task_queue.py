@@ -14,10 +14,14 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import datetime
+
 import mock
 
 import dnrm.common.config  # noqa
 from dnrm.db import api as db_api
+from dnrm.openstack.common.fixture import mockpatch
+from dnrm.openstack.common import timeutils
 from dnrm.resources import base as resource_base
 from dnrm import task_queue
 from dnrm import tasks
@@ -36,7 +40,8 @@ class TestTask(tasks.Task):
         self.process_state = process_state
         self.success_state = success_state
         self.fail_state = fail_state
-        res = dict(id='fake-id', status=resource_base.STATE_STOPPED, foo='bar')
+        res = dict(id='fake-id', type='fake-type',
+                   status=resource_base.STATE_STOPPED, foo='bar')
         super(TestTask, self).__init__(res)
 
     def execute(self):
@@ -45,14 +50,13 @@ class TestTask(tasks.Task):
 
 class MockedEventletTestCase(base.BaseTestCase):
     def setUp(self):
-        self.config(task_queue_timeout=1)
-        self.light_queue_cls = self._mock('eventlet.queue.LightQueue')
+        self.light_queue_cls = self._mock('eventlet.queue.PriorityQueue')
         self.light_queue = self.light_queue_cls.return_value
         self.task_queue = task_queue.TaskQueue()
         self.driver_factory = mock.MagicMock()
         self.worker = task_queue.QueuedTaskWorker(self.task_queue,
                                                   self.driver_factory)
-        self.db = self._mock('dnrm.db.api.resource_update')
+        self.resource_update = self._mock('dnrm.db.api.resource_update')
         super(MockedEventletTestCase, self).setUp()
 
     def _mock(self, function, retval=None, side_effect=None):
@@ -80,27 +84,145 @@ class TaskQueueTestCase(MockedEventletTestCase):
 
     def test_push(self):
         task = TestTask()
+        self.db.task_push.return_value = {'id': 'fake-task-id'}
+        self.task_queue.push(task)
+        self.light_queue.put.assert_called_once_with((mock.ANY, 0, task))
+        self.assertEqual({'default': {0: 1}}, self.task_queue.lane_depth())
+        self.db.task_push.assert_called_once_with(
+            'fake-id', {'status': (resource_base.STATE_ERROR,)},
+            {'status': resource_base.STATE_ERROR, 'processing': True},
+            'TestTask', {})
+        self.assertEqual('fake-task-id', task.task_id)
+
+    def test_push_batch(self):
+        task = tasks.StartManyTask([{'id': 'fake-id-1', 'type': 'fake-type'},
+                                    {'id': 'fake-id-2', 'type': 'fake-type'}])
+        self.db.task_push.side_effect = [{'id': 'fake-task-1'},
+                                         {'id': 'fake-task-2'}]
         self.task_queue.push(task)
-        self.light_queue.put.assert_called_once_with(task)
+        self.light_queue.put.assert_called_once_with((mock.ANY, 0, task))
+        self.assertEqual(['fake-task-1', 'fake-task-2'],
+                         [subtask.task_id for subtask in task.tasks])
+        self.assertEqual(['StartTask', 'StartTask'],
+                         [c[0][3] for c in self.db.task_push.call_args_list])
+
+    def test_restore(self):
+        self.db.task_find.return_value = [
+            {'id': 'fake-task-1', 'resource_id': 'fake-id-1',
+             'type': 'DeleteTask', 'params': {'force': True}},
+            {'id': 'fake-task-2', 'resource_id': 'fake-id-2',
+             'type': 'FakeTask', 'params': {}},
+            {'id': 'fake-task-3', 'resource_id': 'fake-id-1',
+             'type': 'StartTask', 'params': {}},
+        ]
+        self.db.resource_get_by_id.return_value = {'id': 'fake-id-1',
+                                                   'type': 'fake-type'}
+
+        self.assertEqual(2, self.task_queue.restore())
+        self.assertEqual(2, self.light_queue.put.call_count)
+
+        task = self.light_queue.put.call_args_list[0][0][0][2]
+        self.assertIsInstance(task, tasks.DeleteTask)
+        self.assertEqual('fake-task-1', task.task_id)
+        self.assertEqual({'force': True}, task.get_params())
+        task = self.light_queue.put.call_args_list[1][0][0][2]
+        self.assertIsInstance(task, tasks.StartTask)
+        self.assertTrue(task.restored)
+        self.db.task_rollback.assert_called_once_with(
+            ['fake-task-2'], {'status': resource_base.STATE_ERROR,
+                              'processing': False})
 
     def test_pop(self):
         task = TestTask()
-        self.light_queue.get.return_value = task
+        self.task_queue._depth[(None, task.priority)] = 1
+        self.light_queue.get.return_value = (0, 0, task)
         self.assertEquals(task, self.task_queue.pop(timeout=31337))
+        self.assertEqual({}, self.task_queue.lane_depth())
         self.light_queue.get.assert_called_once_with(block=True, timeout=31337)
 
+    def test_track_resources(self):
+        task = TestTask()
+        self.db.task_push.return_value = {'id': 'fake-task-id'}
+        self.task_queue.push(task)
+        self.assertTrue(self.task_queue.is_queued('fake-id'))
+        self.assertIsNone(self.task_queue.started_at('fake-id'))
+
+        now = datetime.datetime(2013, 10, 1, 12, 0, 0)
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
+        self.light_queue.get.return_value = (0, 0, task)
+        self.task_queue.pop()
+        self.assertFalse(self.task_queue.is_queued('fake-id'))
+        self.assertEqual(now, self.task_queue.started_at('fake-id'))
+
+        self.task_queue.finished(task)
+        self.assertIsNone(self.task_queue.started_at('fake-id'))
+
     def test_pop_empty(self):
         self.light_queue.get.side_effect = queue.Empty
         self.assertIsNone(self.task_queue.pop(block=False))
         self.light_queue.get.assert_called_once_with(block=False, timeout=None)
 
 
+class TaskQueuePriorityTestCase(base.BaseTestCase):
+    """TaskQueue ordering test case."""
+
+    def setUp(self):
+        super(TaskQueuePriorityTestCase, self).setUp()
+        self.config(task_priority_aging=60)
+        self.time = self.useFixture(mockpatch.Patch(
+            'dnrm.task_queue.time.time', return_value=1000.0)).mock
+        self.task_queue = task_queue.TaskQueue()
+
+    def _task(self, priority, resource_type='fake-type'):
+        task = TestTask()
+        task.priority = priority
+        task._resource['type'] = resource_type
+        self.task_queue._put(task)
+        return task
+
+    def test_priority(self):
+        stop = self._task(3)
+        wipe = self._task(0)
+        start = self._task(1)
+        self.assertEqual({'default': {0: 1, 1: 1, 3: 1}},
+                         self.task_queue.lane_depth())
+        self.assertEqual([wipe, start, stop],
+                         [self.task_queue.pop(block=False)
+                          for _i in range(3)])
+        self.assertEqual({}, self.task_queue.lane_depth())
+
+    def test_same_priority_fifo(self):
+        first = self._task(1)
+        second = self._task(1)
+        self.assertIs(first, self.task_queue.pop(block=False))
+        self.assertIs(second, self.task_queue.pop(block=False))
+
+    def test_aging(self):
+        stop = self._task(3)
+        self.time.return_value += 3 * 60 + 1
+        wipe = self._task(0)
+        self.assertIs(stop, self.task_queue.pop(block=False))
+        self.assertIs(wipe, self.task_queue.pop(block=False))
+
+    def test_lanes(self):
+        self.task_queue = task_queue.TaskQueue(['slow-type'])
+        slow = self._task(0, 'slow-type')
+        fast = self._task(1)
+        self.assertEqual({'slow-type': {0: 1}, 'default': {1: 1}},
+                         self.task_queue.lane_depth())
+        self.assertIs(fast, self.task_queue.pop(block=False))
+        self.assertIsNone(self.task_queue.pop(block=False))
+        self.assertIs(slow, self.task_queue.pop(block=False,
+                                                lane='slow-type'))
+        self.assertEqual({}, self.task_queue.lane_depth())
+
+
 class QueuedTaskWorkerTestCase(base.BaseTestCase):
     """QueuedTaskWorker test case."""
 
     def setUp(self):
         self.resource_update = self._mock('dnrm.db.api.resource_update')
-        self.config(task_queue_timeout=1)
         self.task_queue = task_queue.TaskQueue()
         self.driver_factory = mock.MagicMock()
         self.worker = task_queue.QueuedTaskWorker(self.task_queue,
@@ -129,32 +251,214 @@ class QueuedTaskWorkerTestCase(base.BaseTestCase):
         task.get_resource_id.return_value = 'fake-id'
         task.process_state = resource_base.STATE_STARTING
         task.in_states = (resource_base.STATE_ERROR,)
-        self.db.resource_compare_update.return_value = 1
+        task.get_params.return_value = {}
+        self.db.task_push.return_value = {'id': 'fake-task-id'}
         resource = {'id': 'fake-id'}
         task.execute.return_value = resource
+        task.poll.return_value = None
         self.task_queue.push(task)
         self.worker.start()
         greenthread.sleep()
         task.execute.assert_called_once(self.driver_factory)
-        self.db.resource_compare_update.assert_called_once_with(
+        self.db.task_push.assert_called_once_with(
             'fake-id', {'status': (resource_base.STATE_ERROR,)},
-            {'status': resource_base.STATE_STARTING, 'processing': True})
+            {'status': resource_base.STATE_STARTING, 'processing': True},
+            'MagicMock', {})
+        self.db.task_finish.assert_called_once_with(
+            'fake-task-id', 'fake-id',
+            {'status': resource_base.STATE_STARTING, 'processing': True},
+            resource)
 
     def test_execute_exception(self):
         task = mock.MagicMock()
         task.in_states = (resource_base.STATE_ERROR,)
         task.get_resource_id.return_value = 'fake-id'
         task.execute.side_effect = RuntimeError('fake-exception for test')
-        self.db.resource_compare_update.return_value = 1
+        self.db.task_push.return_value = {'id': 'fake-task-id'}
         self.task_queue.push(task)
         self.worker.start()
         greenthread.sleep()
         task.execute.assert_called_once(self.driver_factory)
-        self.db.resource_compare_update.assert_called_once_with(
+        self.db.task_push.assert_called_once_with(
             task.get_resource_id(), {'status': (resource_base.STATE_ERROR,)},
-            mock.ANY)
+            mock.ANY, mock.ANY, mock.ANY)
+        self.db.task_finish.assert_called_once_with(
+            'fake-task-id', 'fake-id',
+            {'status': task.process_state, 'processing': True},
+            {'status': task.fail_state, 'processing': False})
+
+    def test_execute_notify(self):
+        notify = mock.Mock()
+        self.worker = task_queue.QueuedTaskWorker(self.task_queue,
+                                                  self.driver_factory,
+                                                  notify)
+        task = mock.MagicMock()
+        task.get_resource_type.return_value = 'fake-type'
+        task.execute.return_value = {'id': 'fake-id'}
+        task.poll.return_value = None
+        self.worker._execute(task)
+        notify.assert_called_once_with('fake-type')
+
+    def test_execute_batch(self):
+        task = tasks.StartManyTask([{'id': 'fake-id-1', 'type': 'fake-type'},
+                                    {'id': 'fake-id-2', 'type': 'fake-type'}])
+        task.tasks[0].task_id = 'fake-task-1'
+        task.tasks[1].task_id = 'fake-task-2'
+        driver = self.driver_factory.get.return_value
+        driver.begin_init_many.return_value = None
+        driver.init_many.return_value = [None, RuntimeError('fake')]
+        self.worker._execute(task)
+        filters = {'status': resource_base.STATE_STARTING,
+                   'processing': True}
+        self.db.task_finish.assert_has_calls([
+            mock.call('fake-task-1', 'fake-id-1', filters,
+                      {'id': 'fake-id-1', 'type': 'fake-type',
+                       'status': resource_base.STATE_STARTED,
+                       'processing': False}),
+            mock.call('fake-task-2', 'fake-id-2', filters,
+                      {'status': resource_base.STATE_ERROR,
+                       'processing': False})])
+
+    def test_execute_batch_async(self):
+        poller = mock.Mock()
+        self.worker = task_queue.QueuedTaskWorker(self.task_queue,
+                                                  self.driver_factory,
+                                                  poller=poller)
+        task = tasks.StartManyTask([{'id': 'fake-id-1', 'type': 'fake-type'},
+                                    {'id': 'fake-id-2', 'type': 'fake-type'}])
+        driver = self.driver_factory.get.return_value
+
+        def begin_init_many(resources):
+            for i, resource in enumerate(resources):
+                resource['instance_id'] = 'fake-instance-%d' % i
+            return ['fake-handle-0', 'fake-handle-1']
+
+        driver.begin_init_many.side_effect = begin_init_many
+        driver.poll.return_value = 5
+        self.worker._execute(task)
+        self.assertEqual(0, driver.init_many.call_count)
+        self.assertEqual(
+            [mock.call('fake-id-1', {'instance_id': 'fake-instance-0'}),
+             mock.call('fake-id-2', {'instance_id': 'fake-instance-1'})],
+            self.resource_update.call_args_list)
+        self.assertEqual(
+            [mock.call(task.tasks[0], 5, self.worker._complete),
+             mock.call(task.tasks[1], 5, self.worker._complete)],
+            poller.add.call_args_list)
+        self.assertEqual(0, self.db.task_finish.call_count)
+
+    def test_execute_polls(self):
+        sleep = self._mock('eventlet.greenthread.sleep')
+        task = mock.MagicMock()
+        task.task_id = None
+        task.execute.return_value = {'id': 'fake-id'}
+        task.get_progress.return_value = {}
+        task.poll.side_effect = [5, None]
+        self.worker._execute(task)
+        sleep.assert_called_once_with(5)
+        self.resource_update.assert_called_once_with(
+            'fake-id', {'id': 'fake-id', 'processing': False,
+                        'status': task.success_state})
+
+    def test_execute_async(self):
+        poller = mock.Mock()
+        self.worker = task_queue.QueuedTaskWorker(self.task_queue,
+                                                  self.driver_factory,
+                                                  poller=poller)
+        task = mock.MagicMock()
+        task.get_resource_id.return_value = 'fake-id'
+        task.execute.return_value = {'id': 'fake-id'}
+        task.get_progress.return_value = {'instance_id': 'fake-instance-id'}
+        task.poll.return_value = 5
+        self.worker._execute(task)
+        self.resource_update.assert_called_once_with(
+            'fake-id', {'instance_id': 'fake-instance-id'})
+        poller.add.assert_called_once_with(task, 5, self.worker._complete)
+        self.assertEqual(1, task.poll.call_count)
+        self.assertEqual(0, self.db.task_finish.call_count)
 
     def test_stop(self):
         self.worker.start()
         self.worker.stop()
         self.assertFalse(self.worker._running)
+
+    def test_stop_idle(self):
+        pop = self._mock('dnrm.task_queue.TaskQueue.pop',
+                         side_effect=self.task_queue.pop)
+        self.worker.start()
+        greenthread.sleep()
+        pop.assert_called_once_with(lane=None)
+        self.assertTrue(self.worker._waiting)
+        self.worker.stop()
+        self.assertFalse(self.worker._waiting)
+        self.assertIsNone(self.worker._thread)
+        self.assertEqual(1, pop.call_count)
+        self.assertEqual(0, self.task_queue._queue.getting())
+
+    def test_lane(self):
+        pop = self._mock('dnrm.task_queue.TaskQueue.pop',
+                         side_effect=lambda lane: greenthread.sleep(1))
+        self.worker = task_queue.QueuedTaskWorker(self.task_queue,
+                                                  self.driver_factory,
+                                                  lane='fake-type')
+        self.worker.start()
+        greenthread.sleep()
+        self.worker.stop()
+        pop.assert_called_with(lane='fake-type')
+
+    def test_stop_waits_for_task(self):
+        finished = []
+
+        def execute(driver_factory):
+            greenthread.sleep(0.01)
+            finished.append(True)
+            return {'id': 'fake-id'}
+
+        task = mock.MagicMock()
+        task.get_resource_id.return_value = 'fake-id'
+        task.execute.side_effect = execute
+        task.poll.return_value = None
+        self.db.task_push.return_value = {'id': 'fake-task-id'}
+        self.task_queue.push(task)
+        self.worker.start()
+        greenthread.sleep()
+        self.worker.stop()
+        self.assertEqual([True], finished)
+        self.db.task_finish.assert_called_once_with('fake-task-id',
+                                                    'fake-id', mock.ANY,
+                                                    mock.ANY)
+
+
+class TaskPollerTestCase(base.BaseTestCase):
+    """TaskPoller test case."""
+
+    def setUp(self):
+        super(TaskPollerTestCase, self).setUp()
+        self.driver_factory = mock.Mock()
+        self.poller = task_queue.TaskPoller(self.driver_factory)
+        self.callback = mock.Mock()
+        self.task = mock.Mock()
+        self.task.get_resource.return_value = {'id': 'fake-id'}
+
+    def test_done(self):
+        self.task.poll.side_effect = [0, 0, None]
+        self.poller.add(self.task, 0, self.callback)
+        self.assertEqual(1, self.poller.pending())
+        greenthread.sleep(0.01)
+        self.assertEqual(3, self.task.poll.call_count)
+        self.task.poll.assert_called_with(self.driver_factory)
+        self.callback.assert_called_once_with(self.task, {'id': 'fake-id'})
+        self.assertEqual(0, self.poller.pending())
+
+    def test_failed(self):
+        self.task.poll.side_effect = RuntimeError('fake-error')
+        self.poller.add(self.task, 0, self.callback)
+        greenthread.sleep(0.01)
+        self.callback.assert_called_once_with(self.task, None)
+
+    def test_stop(self):
+        self.poller.add(self.task, 60, self.callback)
+        self.poller.stop()
+        self.assertEqual(0, self.poller.pending())
+        greenthread.sleep(0.01)
+        self.assertEqual(0, self.task.poll.call_count)
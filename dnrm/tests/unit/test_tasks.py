@@ -17,6 +17,7 @@
 import mock
 
 import dnrm.common.config  # noqa
+from dnrm import exceptions
 from dnrm.resources import base as resources
 from dnrm import tasks
 from dnrm.tests import base
@@ -24,7 +25,6 @@ from dnrm.tests import base
 
 class TasksTestCase(base.BaseTestCase):
     def setUp(self):
-        self.config(task_queue_timeout=1)
         self.factory_cls = self._mock('dnrm.drivers.factory.DriverFactory')
         self.factory = self.factory_cls.return_value
         self.driver = self.factory.get.return_value
@@ -47,9 +47,53 @@ class TasksTestCase(base.BaseTestCase):
     def test_start_task(self):
         resource = self._make_resource()
         task = tasks.StartTask(resource)
+        self.driver.begin_init.return_value = None
         self.assertEquals(resource, task.execute(self.factory))
         self.factory.get.assert_called_once_with('fake-driver')
         self.driver.init.assert_called_once_with(resource)
+        self.assertIsNone(task.poll(self.factory))
+
+    def test_start_task_async(self):
+        resource = self._make_resource()
+        task = tasks.StartTask(resource)
+        self.driver.begin_init.return_value = 'fake-handle'
+        self.driver.poll.side_effect = [5, None]
+        self.assertEquals(resource, task.execute(self.factory))
+        self.assertEqual(0, self.driver.init.call_count)
+        self.assertEqual(5, task.poll(self.factory))
+        self.assertIsNone(task.poll(self.factory))
+        self.driver.poll.assert_called_with(resource, 'fake-handle')
+
+    def test_start_many_task(self):
+        res1 = dict(self._make_resource(), id='fake-id-1')
+        res2 = dict(self._make_resource(), id='fake-id-2')
+        task = tasks.StartManyTask([res1, res2])
+        self.driver.begin_init_many.return_value = None
+        self.driver.init_many.return_value = [None, RuntimeError('fake')]
+        self.assertEqual([res1, None], task.execute(self.factory))
+        self.factory.get.assert_called_once_with('fake-driver')
+        self.driver.init_many.assert_called_once_with([res1, res2])
+        self.assertEqual(['fake-id-1', 'fake-id-2'], task.get_resource_id())
+        self.assertEqual(tasks.StartTask.priority, task.priority)
+
+    def test_start_many_task_async(self):
+        res1 = dict(self._make_resource(), id='fake-id-1')
+        res2 = dict(self._make_resource(), id='fake-id-2')
+        task = tasks.StartManyTask([res1, res2])
+
+        def begin_init_many(resources):
+            for resource in resources:
+                resource['instance_id'] = 'instance-' + resource['id']
+            return ['fake-handle-1', 'fake-handle-2']
+
+        self.driver.begin_init_many.side_effect = begin_init_many
+        self.driver.poll.return_value = None
+        self.assertEqual([res1, res2], task.execute(self.factory))
+        self.assertEqual(0, self.driver.init_many.call_count)
+        self.assertEqual({'instance_id': 'instance-fake-id-1'},
+                         task.tasks[0].get_progress())
+        self.assertIsNone(task.tasks[1].poll(self.factory))
+        self.driver.poll.assert_called_once_with(res2, 'fake-handle-2')
 
     def test_stop_task(self):
         resource = self._make_resource()
@@ -71,3 +115,47 @@ class TasksTestCase(base.BaseTestCase):
         self.assertEquals(resource, task.execute(self.factory))
         self.factory.get.assert_called_once_with('fake-driver')
         self.driver.stop.assert_called_once_with(resource)
+
+    def test_restore(self):
+        resource = self._make_resource()
+        task = tasks.restore('DeleteTask', resource, {'force': True})
+        self.assertIsInstance(task, tasks.DeleteTask)
+        self.assertEqual({'force': True}, task.get_params())
+        self.assertEqual({}, tasks.StartTask(resource).get_params())
+
+    def test_start_task_progress(self):
+        resource = self._make_resource()
+        task = tasks.StartTask(resource)
+
+        def begin_init(resource):
+            resource['instance_id'] = 'fake-instance-id'
+            return 'fake-handle'
+
+        self.driver.begin_init.side_effect = begin_init
+        self.assertEqual({}, task.get_progress())
+        task.execute(self.factory)
+        self.assertEqual({'instance_id': 'fake-instance-id'},
+                         task.get_progress())
+
+    def test_start_task_resumed(self):
+        resource = dict(self._make_resource(), id='fake-id',
+                        instance_id='fake-instance-id')
+        task = tasks.restore('StartTask', resource, {})
+        self.assertTrue(task.restored)
+        self.driver.resume_init.return_value = 'fake-handle'
+        self.driver.poll.return_value = None
+        self.assertEqual(resource, task.execute(self.factory))
+        self.assertEqual(0, self.driver.begin_init.call_count)
+        self.assertEqual(0, self.driver.init.call_count)
+        self.assertIsNone(task.poll(self.factory))
+        self.driver.resume_init.assert_called_once_with(resource)
+        self.driver.poll.assert_called_once_with(resource, 'fake-handle')
+
+    def test_start_task_not_resumable(self):
+        resource = dict(self._make_resource(), id='fake-id')
+        task = tasks.restore('StartTask', resource, {})
+        self.driver.resume_init.return_value = None
+        self.assertRaises(exceptions.InitNotResumable, task.execute,
+                          self.factory)
+        self.assertEqual(0, self.driver.begin_init.call_count)
+        self.assertEqual(0, self.driver.init.call_count)
@@ -15,11 +15,25 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import contextlib
+import datetime
+import httplib
 import mock
 import socket
 
+from eventlet import event
+from eventlet import greenpool
+from eventlet import greenthread
+from novaclient import exceptions as nova_exceptions
+
+from dnrm.drivers.vyatta.vrouter_driver import BackoffPolicy
+from dnrm.drivers.vyatta.vrouter_driver import BootHistory
+from dnrm.drivers.vyatta.vrouter_driver import InstanceProber
+from dnrm.drivers.vyatta.vrouter_driver import NovaClientCache
+from dnrm.drivers.vyatta.vrouter_driver import ServerStatusPoller
 from dnrm.drivers.vyatta.vrouter_driver import VyattaVRouterDriver
 from dnrm import exceptions
+from dnrm.openstack.common.fixture import mockpatch
+from dnrm.openstack.common import timeutils
 from dnrm.resources import base as resources
 from dnrm.tests import base
 from oslo.config import cfg
@@ -37,6 +51,309 @@ def make_resource(instance_id='inst-id', address='10.0.0.1',
     return res
 
 
+class FakeNovaClient(object):
+    """Nova client stand-in that counts Keystone authentications."""
+
+    def __init__(self, keystone):
+        self._keystone = keystone
+        self.client = mock.MagicMock()
+        self.servers = mock.MagicMock()
+
+    def authenticate(self):
+        # Let other greenthreads run as real Keystone request would do.
+        greenthread.sleep()
+        self._keystone.authenticate(self)
+
+
+class FakeKeystone(object):
+    def __init__(self, token_lifetime=3600):
+        self.token_lifetime = token_lifetime
+        self.auth_calls = 0
+        self.fail = False
+
+    def authenticate(self, client):
+        self.auth_calls += 1
+        if self.fail:
+            raise RuntimeError('fake authentication failure')
+        expires = timeutils.utcnow() + datetime.timedelta(
+            seconds=self.token_lifetime)
+        client.client.service_catalog.catalog = {
+            'access': {'token': {'expires': timeutils.isotime(expires)}}}
+
+
+class NovaClientCacheTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(NovaClientCacheTestCase, self).setUp()
+        self.keystone = FakeKeystone()
+        self.factory = mock.Mock(
+            side_effect=lambda: FakeNovaClient(self.keystone))
+        self.cache = NovaClientCache(self.factory, 60)
+        timeutils.set_time_override(datetime.datetime(2013, 10, 1))
+        self.addCleanup(timeutils.clear_time_override)
+
+    def test_concurrent_get(self):
+        pool = greenpool.GreenPool()
+        clients = list(pool.imap(lambda _i: self.cache.get(), xrange(50)))
+        self.assertEqual(1, self.keystone.auth_calls)
+        self.assertEqual(1, self.factory.call_count)
+        for client in clients:
+            self.assertIs(clients[0], client)
+
+    def test_token_not_expired(self):
+        client = self.cache.get()
+        timeutils.advance_time_seconds(3000)
+        self.assertIs(client, self.cache.get())
+        self.assertEqual(1, self.keystone.auth_calls)
+
+    def test_token_about_to_expire(self):
+        client = self.cache.get()
+        timeutils.advance_time_seconds(3550)
+        self.assertIs(client, self.cache.get())
+        self.assertEqual(2, self.keystone.auth_calls)
+        self.assertEqual(1, self.factory.call_count)
+        self.assertIs(client, self.cache.get())
+        self.assertEqual(2, self.keystone.auth_calls)
+
+    def test_authentication_failure(self):
+        self.keystone.fail = True
+        self.assertRaises(RuntimeError, self.cache.get)
+        self.keystone.fail = False
+        self.cache.get()
+        self.assertEqual(2, self.keystone.auth_calls)
+        self.assertEqual(2, self.factory.call_count)
+
+    def test_invalidate(self):
+        client = self.cache.get()
+        self.cache.invalidate()
+        self.assertIsNot(client, self.cache.get())
+        self.assertEqual(2, self.keystone.auth_calls)
+
+
+class ServerStatusPollerTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(ServerStatusPollerTestCase, self).setUp()
+        self.client = mock.MagicMock()
+        self.poller = ServerStatusPoller(lambda: self.client, 0)
+
+    def _server(self, server_id, status):
+        server = mock.MagicMock()
+        server.id = server_id
+        server.status = status
+        return server
+
+    def test_one_request_for_all_waiters(self):
+        ids = ['inst-%d' % i for i in xrange(10)]
+        building = [self._server(i, 'BUILD') for i in ids]
+        active = [self._server(i, 'ACTIVE') for i in ids]
+        self.client.servers.list.side_effect = [building, building, active]
+        pool = greenpool.GreenPool()
+        servers = list(pool.imap(self.poller.wait, ids))
+        self.assertEqual(active, servers)
+        self.assertEqual(3, self.client.servers.list.call_count)
+        self.assertEqual(0, self.client.servers.get.call_count)
+        self.assertFalse(self.poller._running)
+
+    def test_get_few_waiters(self):
+        building = self._server('inst-id', 'BUILD')
+        active = self._server('inst-id', 'ACTIVE')
+        self.client.servers.get.side_effect = [
+            nova_exceptions.NotFound(404), building, active]
+        self.assertEqual(active, self.poller.wait('inst-id'))
+        self.assertEqual([mock.call('inst-id')] * 3,
+                         self.client.servers.get.call_args_list)
+        self.assertEqual(0, self.client.servers.list.call_count)
+
+    def test_client_error(self):
+        client_error = mock.Mock()
+        self.poller = ServerStatusPoller(lambda: self.client, 0,
+                                         client_error=client_error)
+        self.poller._waiters['inst-id'] = (mock.Mock(), None,
+                                           timeutils.utcnow())
+        self.client.servers.get.side_effect = (
+            nova_exceptions.Unauthorized(401))
+        self.assertRaises(nova_exceptions.Unauthorized,
+                          self.poller._get_servers)
+        client_error.assert_called_once_with()
+
+    def test_pages(self):
+        timeutils.set_time_override(datetime.datetime(2013, 10, 1, 12))
+        self.addCleanup(timeutils.clear_time_override)
+        self.poller = ServerStatusPoller(lambda: self.client, 0, 2,
+                                         get_limit=0)
+        servers = [self._server('inst-%d' % i, 'ACTIVE') for i in xrange(3)]
+        self.client.servers.list.side_effect = [servers[:2], servers[2:]]
+        self.assertEqual(servers[2], self.poller.wait('inst-2'))
+        since = '2013-10-01T12:00:00Z'
+        self.assertEqual(
+            [mock.call(search_opts={'limit': 2, 'changes-since': since}),
+             mock.call(search_opts={'limit': 2, 'changes-since': since,
+                                    'marker': 'inst-1'})],
+            self.client.servers.list.call_args_list)
+
+    def test_changes_since_oldest_waiter(self):
+        self.poller = ServerStatusPoller(lambda: self.client, 0,
+                                         get_limit=1)
+        oldest = datetime.datetime(2013, 10, 1, 12)
+        self.poller._waiters = {
+            'inst-1': (mock.Mock(), None, oldest + datetime.timedelta(1)),
+            'inst-2': (mock.Mock(), None, oldest)}
+        self.client.servers.list.return_value = []
+        self.assertEqual({}, self.poller._get_servers())
+        self.client.servers.list.assert_called_once_with(
+            search_opts={'limit': 1000,
+                         'changes-since': '2013-10-01T12:00:00Z'})
+
+    def test_error(self):
+        self.client.servers.get.return_value = self._server('inst-id',
+                                                            'ERROR')
+        self.assertRaises(exceptions.DriverException, self.poller.wait,
+                          'inst-id')
+
+    def test_timeout(self):
+        self.client.servers.get.side_effect = nova_exceptions.NotFound(404)
+        self.assertRaises(exceptions.DriverException, self.poller.wait,
+                          'inst-id', 0.01)
+        self.assertFalse(self.poller._waiters)
+
+
+class InstanceProberTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(InstanceProberTestCase, self).setUp()
+        patcher = mock.patch('httplib.HTTPConnection')
+        self.addCleanup(patcher.stop)
+        self.httpconn_cls = patcher.start()
+        self.httpconn_cls.side_effect = self._connection
+        self.connections = []
+        self.prober = InstanceProber(31337, 1, 2, concurrency=2)
+
+    def _connection(self, address, port, timeout=None):
+        conn = mock.MagicMock()
+        conn.address = address
+        response = conn.getresponse.return_value
+        response.status = 401
+        response.will_close = False
+        self.connections.append(conn)
+        return conn
+
+    def test_timeouts(self):
+        self.assertTrue(self.prober.probe('10.0.0.1'))
+        self.httpconn_cls.assert_called_once_with('10.0.0.1', 31337,
+                                                  timeout=1)
+        self.connections[0].sock.settimeout.assert_called_once_with(2)
+
+    def test_keep_alive(self):
+        for _i in xrange(3):
+            self.assertTrue(self.prober.probe('10.0.0.1'))
+        self.assertEqual(1, self.httpconn_cls.call_count)
+        self.assertEqual(3, self.connections[0].request.call_count)
+
+    def test_will_close(self):
+        self.prober.probe('10.0.0.1')
+        self.connections[0].getresponse.return_value.will_close = True
+        self.prober.probe('10.0.0.1')
+        self.prober.probe('10.0.0.1')
+        self.assertEqual(2, self.httpconn_cls.call_count)
+        self.connections[0].close.assert_called_once_with()
+
+    def test_broken_keep_alive(self):
+        self.prober.probe('10.0.0.1')
+        self.connections[0].getresponse.side_effect = httplib.BadStatusLine(
+            '')
+        self.assertTrue(self.prober.probe('10.0.0.1'))
+        self.assertEqual(2, self.httpconn_cls.call_count)
+        self.connections[0].close.assert_called_once_with()
+
+    def test_timeout_not_retried(self):
+        self.prober.probe('10.0.0.1')
+        self.connections[0].getresponse.side_effect = socket.timeout()
+        self.assertFalse(self.prober.probe('10.0.0.1'))
+        self.assertEqual(1, self.httpconn_cls.call_count)
+        self.assertNotIn('10.0.0.1', self.prober._idle)
+
+    def test_probe_error_forgets_address(self):
+        self.prober.probe('10.0.0.1')
+        self.assertIn('10.0.0.1', self.prober._idle)
+        self.connections[0].getresponse.side_effect = httplib.BadStatusLine(
+            '')
+        self.httpconn_cls.side_effect = None
+        self.httpconn_cls.return_value.connect.side_effect = socket.error()
+        self.assertFalse(self.prober.probe('10.0.0.1'))
+        self.assertNotIn('10.0.0.1', self.prober._idle)
+
+    def test_connect_error(self):
+        self.httpconn_cls.side_effect = None
+        self.httpconn_cls.return_value.connect.side_effect = socket.error()
+        self.assertFalse(self.prober.probe('10.0.0.1'))
+
+    def test_not_authorized_status(self):
+        self.prober.probe('10.0.0.1')
+        self.connections[0].getresponse.return_value.status = 500
+        self.assertFalse(self.prober.probe('10.0.0.1'))
+
+    def test_probe_many(self):
+        running = []
+        max_running = []
+
+        def request(method, url):
+            running.append(True)
+            max_running.append(len(running))
+            greenthread.sleep()
+            running.pop()
+
+        def connection(address, port, timeout=None):
+            conn = self._connection(address, port, timeout)
+            conn.request.side_effect = request
+            if address == '10.0.0.3':
+                conn.getresponse.return_value.status = 503
+            return conn
+
+        self.httpconn_cls.side_effect = connection
+        statuses = self.prober.probe_many(
+            ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4', '10.0.0.1'])
+        self.assertEqual({'10.0.0.1': True, '10.0.0.2': True,
+                          '10.0.0.3': False, '10.0.0.4': True}, statuses)
+        self.assertEqual(2, max(max_running))
+
+        del max_running[:]
+        self.prober.probe_many(['10.0.0.1', '10.0.0.2'], concurrency=1)
+        self.assertEqual(1, max(max_running))
+
+    def test_forget(self):
+        self.prober.probe('10.0.0.1')
+        self.prober.forget('10.0.0.1')
+        self.connections[0].close.assert_called_once_with()
+        self.prober.probe('10.0.0.1')
+        self.assertEqual(2, self.httpconn_cls.call_count)
+
+
+class BackoffPolicyTestCase(base.BaseTestCase):
+    def _intervals(self, policy, count):
+        intervals = policy.intervals()
+        return [intervals.next() for _i in xrange(count)]
+
+    def test_intervals(self):
+        policy = BackoffPolicy(2, multiplier=2, cap=10)
+        self.assertEqual([2, 4, 8, 10, 10], self._intervals(policy, 5))
+
+    def test_no_cap(self):
+        policy = BackoffPolicy(1, multiplier=10)
+        self.assertEqual([1, 10, 100, 1000], self._intervals(policy, 4))
+
+    def test_jitter(self):
+        policy = BackoffPolicy(10, jitter=0.5)
+        for interval in self._intervals(policy, 100):
+            self.assertTrue(5 <= interval <= 15)
+
+
+class BootHistoryTestCase(base.BaseTestCase):
+    def test_expected(self):
+        history = BootHistory(2)
+        self.assertIsNone(history.expected())
+        for duration in (30, 60, 90):
+            history.add(duration)
+        self.assertEqual(60, history.expected())
+
+
 class VrouterDriverTestCase(base.BaseTestCase):
     """Vyatta vRouter driver test case."""
 
@@ -52,6 +369,7 @@ class VrouterDriverTestCase(base.BaseTestCase):
         CONF.set_override('flavor', 1234, 'VROUTER')
         CONF.set_override('management_network_id', 'fake-net-id', 'VROUTER')
         CONF.set_override('management_network_cidr', '10.0.0.0/24', 'VROUTER')
+        CONF.set_override('poll_backoff_jitter', 0, 'VROUTER')
 
         self.driver = VyattaVRouterDriver()
         self.novaclient_cls = self._mock('novaclient.v1_1.client.Client')
@@ -78,7 +396,7 @@ class VrouterDriverTestCase(base.BaseTestCase):
         self.httpconn.getresponse.return_value = response
         yield
         if self.httpconn_cls.mock_calls:
-            self.httpconn_cls.assert_called_with(address, 31337)
+            self.httpconn_cls.assert_called_with(address, 31337, timeout=5)
 
     @contextlib.contextmanager
     def _check_init(self, instance_state='ACTIVE', num_ifaces=1, num_ips=1):
@@ -98,8 +416,6 @@ class VrouterDriverTestCase(base.BaseTestCase):
 
         self.novaclient.servers.create.assert_called_once_with(
             mock.ANY, 'fake-image-id', 1234, nics=[{'net-id': 'fake-net-id'}])
-        if self.novaclient.servers.get.mock_calls:
-            self.novaclient.servers.get.assert_called_with('inst-id')
 
     def _mock(self, function):
         patcher = mock.patch(function)
@@ -112,6 +428,44 @@ class VrouterDriverTestCase(base.BaseTestCase):
         self._check_novaclient()
         self.novaclient.servers.delete.assert_called_once_with('inst-id')
 
+    def test_stop_deleted_instance(self):
+        self.novaclient.servers.delete.side_effect = (
+            nova_exceptions.NotFound(404))
+        resource = make_resource(instance_id='inst-id', address='10.0.0.1')
+        self.driver.stop(resource)
+        self.novaclient.servers.delete.assert_called_once_with('inst-id')
+        self.assertIsNone(resource['instance_id'])
+        self.assertIsNone(resource['address'])
+
+    def test_stop_forgets_address(self):
+        self.novaclient.servers.delete.side_effect = RuntimeError('fake')
+        resource = make_resource(instance_id='inst-id', address='10.0.0.1')
+        forget = self.useFixture(mockpatch.PatchObject(
+            self.driver.prober, 'forget')).mock
+        self.assertRaises(RuntimeError, self.driver.stop, resource)
+        forget.assert_called_once_with('10.0.0.1')
+
+    def test_stop_client_error(self):
+        self.novaclient.servers.delete.side_effect = (
+            nova_exceptions.Unauthorized(401))
+        resource = make_resource(instance_id='inst-id')
+        self.assertRaises(nova_exceptions.Unauthorized,
+                          self.driver.stop, resource)
+        self.novaclient.servers.delete.side_effect = None
+        self.driver.stop(resource)
+        self.assertEqual(2, self.novaclient_cls.call_count)
+
+    def test_stop_without_instance(self):
+        self.driver.stop(make_resource(instance_id=None, address=None))
+        self.assertEqual(0, self.novaclient.servers.delete.call_count)
+
+    def test_nova_client_cached(self):
+        for _i in xrange(3):
+            self.driver.stop(make_resource(instance_id='inst-id'))
+        self.assertEqual(1, self.novaclient_cls.call_count)
+        self.assertEqual(1, self.novaclient.authenticate.call_count)
+        self.assertEqual(3, self.novaclient.servers.delete.call_count)
+
     def test_check(self):
         resource = make_resource(address='10.0.0.1')
         with self._check_check_instance(resource['address']):
@@ -130,7 +484,7 @@ class VrouterDriverTestCase(base.BaseTestCase):
     def test_check_fail_not_connected(self):
         resource = make_resource()
         with self._check_check_instance(resource['address']):
-            self.httpconn_cls.return_value = None
+            self.httpconn.connect.side_effect = socket.error()
             self.assertRaises(
                 exceptions.ResourceCheckFailed, self.driver.check, resource)
 
@@ -148,6 +502,24 @@ class VrouterDriverTestCase(base.BaseTestCase):
             self.assertRaises(
                 exceptions.ResourceCheckFailed, self.driver.check, resource)
 
+    def test_check_many(self):
+        items = [make_resource(address='10.0.0.1'),
+                 make_resource(address='10.0.1.1'),
+                 make_resource(state=resources.STATE_ERROR),
+                 make_resource(address='10.0.0.2')]
+        probe_many = self.useFixture(mockpatch.PatchObject(
+            self.driver.prober, 'probe_many',
+            return_value={'10.0.0.1': True, '10.0.0.2': False})).mock
+        self.config(health_check_concurrency=3)
+        errors = self.driver.check_many(items)
+        self.assertEqual(['10.0.0.1', '10.0.0.2'],
+                         sorted(probe_many.call_args[0][0]))
+        self.assertEqual(3, probe_many.call_args[0][1])
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], exceptions.ResourceCheckFailed)
+        self.assertIsNone(errors[2])
+        self.assertIsInstance(errors[3], exceptions.ResourceCheckFailed)
+
     def test_check_non_started(self):
         resource = make_resource(state=resources.STATE_ERROR)
         self.httpconn_cls.side_effect = AssertionError(
@@ -172,7 +544,8 @@ class VrouterDriverTestCase(base.BaseTestCase):
                                  instance_id=None)
         with self._check_init():
             server = self.novaclient.servers.create.return_value
-            self.novaclient.servers.get.side_effect = [RuntimeError(), server]
+            self.novaclient.servers.get.side_effect = [RuntimeError(),
+                                                       server]
             self.driver.init(resource)
 
     def test_init_too_much_interfaces(self):
@@ -195,10 +568,13 @@ class VrouterDriverTestCase(base.BaseTestCase):
         with self._check_init():
             server = self.novaclient.servers.create.return_value
             spawning_server = mock.MagicMock()
+            spawning_server.id = 'inst-id'
             spawning_server.status = 'BUILD'
-            self.novaclient.servers.get.side_effect = [spawning_server, server]
-            self.httpconn = mock.MagicMock()
-            self.httpconn_cls.side_effect = [None, self.httpconn]
+            self.novaclient.servers.get.side_effect = [spawning_server,
+                                                       server]
+            refused = mock.MagicMock()
+            refused.connect.side_effect = socket.error()
+            self.httpconn_cls.side_effect = [refused, self.httpconn]
             self.driver.init(resource)
 
     def test_init_nova_timeout(self):
@@ -209,5 +585,195 @@ class VrouterDriverTestCase(base.BaseTestCase):
             self.assertRaises(
                 exceptions.DriverException, self.driver.init, resource)
 
+    def _begin_init(self, resource):
+        spawned = event.Event()
+        self.driver.server_poller = mock.Mock()
+        self.driver.server_poller.watch.return_value = spawned
+        handle = self.driver.begin_init(resource)
+        self.driver.server_poller.watch.assert_called_once_with(
+            'inst-id', timeout=600)
+        return handle, spawned
+
+    def test_begin_init(self):
+        resource = make_resource(state=resources.STATE_STOPPED, address=None,
+                                 instance_id=None)
+        with self._check_init():
+            handle, spawned = self._begin_init(resource)
+            self.assertEqual(5, self.driver.poll(resource, handle))
+            spawned.send(handle.server)
+            self.assertIsNone(self.driver.poll(resource, handle))
+        self.assertEqual('10.0.0.1', resource['address'])
+        self.assertEqual('inst-id', resource['instance_id'])
+        self.assertEqual(0, self.sleep.call_count)
+
+    def test_begin_init_client_error(self):
+        resource = make_resource(state=resources.STATE_STOPPED, address=None,
+                                 instance_id=None)
+        self.driver.server_poller = mock.Mock()
+        self.novaclient.servers.create.side_effect = (
+            nova_exceptions.Unauthorized(401))
+        self.assertRaises(nova_exceptions.Unauthorized,
+                          self.driver.begin_init, resource)
+        self.novaclient.servers.create.side_effect = None
+        self.driver.begin_init(resource)
+        self.assertEqual(2, self.novaclient_cls.call_count)
+
+    def test_resume_init(self):
+        resource = make_resource(state=resources.STATE_STARTING,
+                                 address=None)
+        spawned = event.Event()
+        self.driver.server_poller = mock.Mock()
+        self.driver.server_poller.watch.return_value = spawned
+        server = self.novaclient.servers.get.return_value
+        server.id = 'inst-id'
+        handle = self.driver.resume_init(resource)
+        self.novaclient.servers.get.assert_called_once_with('inst-id')
+        self.assertEqual(0, self.novaclient.servers.create.call_count)
+        self.driver.server_poller.watch.assert_called_once_with(
+            'inst-id', timeout=600)
+        self.assertEqual(server, handle.server)
+        self.assertEqual(spawned, handle.spawned)
+
+    def test_resume_init_client_error(self):
+        resource = make_resource(state=resources.STATE_STARTING,
+                                 address=None)
+        self.driver.server_poller = mock.Mock()
+        self.novaclient.servers.get.side_effect = socket.error()
+        self.assertRaises(socket.error, self.driver.resume_init, resource)
+        self.novaclient.servers.get.side_effect = None
+        self.driver.resume_init(resource)
+        self.assertEqual(2, self.novaclient_cls.call_count)
+
+    def test_resume_init_without_instance(self):
+        resource = make_resource(state=resources.STATE_STARTING,
+                                 address=None, instance_id=None)
+        self.assertIsNone(self.driver.resume_init(resource))
+        self.assertEqual(0, self.novaclient.servers.get.call_count)
+
+    def test_poll_spawn_error(self):
+        resource = make_resource(state=resources.STATE_STOPPED, address=None,
+                                 instance_id=None)
+        with self._check_init():
+            handle, spawned = self._begin_init(resource)
+            spawned.send_exception(exceptions.DriverException())
+            self.assertRaises(exceptions.DriverException,
+                              self.driver.poll, resource, handle)
+
+    def test_poll_boot_timeout(self):
+        resource = make_resource(state=resources.STATE_STOPPED, address=None,
+                                 instance_id=None)
+        with self._check_init():
+            handle, spawned = self._begin_init(resource)
+            spawned.send(handle.server)
+            self.httpconn.connect.side_effect = socket.error()
+            self.assertEqual(5, self.driver.poll(resource, handle))
+            self.time.return_value = 1 << 31
+            self.assertRaises(exceptions.DriverException,
+                              self.driver.poll, resource, handle)
+
+    def test_poll_expected_boot(self):
+        resource = make_resource(state=resources.STATE_STOPPED, address=None,
+                                 instance_id=None)
+        self.driver.boot_history.add(120)
+        with self._check_init():
+            handle, spawned = self._begin_init(resource)
+            spawned.send(handle.server)
+            self.assertEqual(120, self.driver.poll(resource, handle))
+            self.assertEqual(0, self.httpconn_cls.call_count)
+            self.time.return_value = 100
+            self.assertIsNone(self.driver.poll(resource, handle))
+        self.assertEqual(99, self.driver.boot_history.expected())
+
+    def test_init_backoff(self):
+        resource = make_resource(state=resources.STATE_STOPPED, address=None,
+                                 instance_id=None)
+        with self._check_init():
+            refused = mock.MagicMock()
+            refused.connect.side_effect = socket.error()
+            self.httpconn_cls.side_effect = [refused, refused, refused,
+                                             self.httpconn]
+            self.driver.init(resource)
+        # Earlier sleeps are made by Nova server poller.
+        self.assertEqual([mock.call(5), mock.call(7.5), mock.call(11.25)],
+                         self.sleep.call_args_list[-3:])
+
+    def _servers(self, count):
+        servers = []
+        for i in xrange(count):
+            server = mock.MagicMock()
+            server.id = 'inst-id-%d' % i
+            server.status = 'ACTIVE'
+            interface = mock.MagicMock()
+            interface.fixed_ips = [dict(ip_address='10.0.0.%d' % (i + 1))]
+            server.interface_list.return_value = [interface]
+            servers.append(server)
+        self.novaclient.servers.list.return_value = servers
+        self.httpconn.getresponse.return_value.status = 401
+        return servers
+
+    def test_begin_init_many(self):
+        self._servers(2)
+        self.driver.server_poller = mock.Mock()
+        res = [make_resource(state=resources.STATE_STOPPED, address=None,
+                             instance_id=None) for _i in xrange(2)]
+        handles = self.driver.begin_init_many(res)
+        self.novaclient.servers.create.assert_called_once_with(
+            mock.ANY, 'fake-image-id', 1234, nics=[{'net-id': 'fake-net-id'}],
+            min_count=2, max_count=2)
+        name = self.novaclient.servers.create.call_args[0][0]
+        self.novaclient.servers.list.assert_called_once_with(
+            search_opts={'name': name})
+        self.assertEqual(['inst-id-0', 'inst-id-1'],
+                         [r['instance_id'] for r in res])
+        self.assertEqual(['inst-id-0', 'inst-id-1'],
+                         [h.server.id for h in handles])
+        self.assertEqual([mock.call('inst-id-0', timeout=600),
+                          mock.call('inst-id-1', timeout=600)],
+                         self.driver.server_poller.watch.call_args_list)
+        self.assertNotIn('address', res[0])
+
+    def test_init_many_connection_refused(self):
+        self.novaclient.servers.create.side_effect = (
+            nova_exceptions.ConnectionRefused())
+        res = [make_resource(state=resources.STATE_STOPPED, address=None,
+                             instance_id=None) for _i in xrange(2)]
+        invalidate = self.useFixture(mockpatch.PatchObject(
+            self.driver.nova_clients, 'invalidate')).mock
+        self.assertRaises(nova_exceptions.ConnectionRefused,
+                          self.driver.begin_init_many, res)
+        invalidate.assert_called_once_with()
+
+    def test_init_many_servers_missing(self):
+        self._servers(1)
+        res = [make_resource(state=resources.STATE_STOPPED, address=None,
+                             instance_id=None) for _i in xrange(2)]
+        self.assertRaises(exceptions.DriverException,
+                          self.driver.begin_init_many, res)
+        self.novaclient.servers.delete.assert_called_once_with('inst-id-0')
+
+    def test_begin_init_many_list_retried(self):
+        servers = self._servers(2)
+        self.driver.server_poller = mock.Mock()
+        self.novaclient.servers.list.side_effect = [socket.error(), servers]
+        res = [make_resource(state=resources.STATE_STOPPED, address=None,
+                             instance_id=None) for _i in xrange(2)]
+        handles = self.driver.begin_init_many(res)
+        self.assertEqual(['inst-id-0', 'inst-id-1'],
+                         [h.server.id for h in handles])
+        self.assertEqual(1, self.novaclient.servers.create.call_count)
+        self.assertEqual(2, self.novaclient_cls.call_count)
+
+    def test_begin_init_many_list_failed(self):
+        self._servers(2)
+        self.novaclient.servers.list.side_effect = RuntimeError('fake')
+        error = self.useFixture(mockpatch.Patch(
+            'dnrm.drivers.vyatta.vrouter_driver.LOG.error')).mock
+        res = [make_resource(state=resources.STATE_STOPPED, address=None,
+                             instance_id=None) for _i in xrange(2)]
+        self.assertRaises(RuntimeError, self.driver.begin_init_many, res)
+        name = self.novaclient.servers.create.call_args[0][0]
+        self.assertIn(name, error.call_args[0][0])
+        self.assertEqual(1, self.novaclient.servers.list.call_count)
+
     def test_makes_100_coverage(self):
         self.driver.wipe(None)
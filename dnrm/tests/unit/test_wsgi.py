@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import json
 import os
 import socket
 import urllib2
@@ -153,3 +154,35 @@ class TestWSGIServerWithSSL(base.BaseTestCase):
         self.assertEqual(greetings, response.read())
 
         server.stop()
+
+
+class JSONDictSerializerTest(base.BaseTestCase):
+    def test_stream(self):
+        items = iter([{'id': 1}, {'id': 2}])
+        chunks = list(wsgi.JSONDictSerializer().stream('items', items))
+        self.assertEqual({'items': [{'id': 1}, {'id': 2}]},
+                         json.loads(''.join(chunks)))
+        self.assertEqual(4, len(chunks))
+
+    def test_stream_error(self):
+        def items():
+            yield {'id': 1}
+            raise RuntimeError('fake-error')
+
+        with mock.patch.object(wsgi, 'LOG') as logger:
+            chunks = list(wsgi.JSONDictSerializer().stream('items', items()))
+        self.assertEqual(['{"items": [', '{"id": 1}'], chunks)
+        self.assertTrue(logger.exception.called)
+
+    def test_stream_closes_items(self):
+        items = mock.MagicMock()
+        items.__iter__.return_value = iter([{'id': 1}, {'id': 2}])
+        stream = wsgi.JSONDictSerializer().stream('items', items)
+        stream.next()
+        stream.next()
+        stream.close()
+        items.close.assert_called_once_with()
+
+    def test_stream_empty(self):
+        chunks = wsgi.JSONDictSerializer().stream('items', iter([]))
+        self.assertEqual({'items': []}, json.loads(''.join(chunks)))
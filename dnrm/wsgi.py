@@ -291,6 +291,30 @@ class JSONDictSerializer(DictSerializer):
             return unicode(obj)
         return jsonutils.dumps(data, default=sanitizer)
 
+    def stream(self, key, items):
+        """Serializes {key: items} incrementally, yields JSON chunks.
+
+        Items are serialized one at a time, so items iterable is never
+        materialized in memory. Response status is sent before items are
+        fetched, so error raised by items is only logged and the client gets
+        truncated JSON document. Items are closed when stream ends.
+        """
+        yield '{%s: [' % jsonutils.dumps(key)
+        try:
+            separator = ''
+            for item in items:
+                yield separator + self.default(item)
+                separator = ', '
+        except Exception:
+            LOG.exception(_('Streaming of %s failed, response is '
+                            'truncated.') % key)
+            return
+        finally:
+            close = getattr(items, 'close', None)
+            if close is not None:
+                close()
+        yield ']}'
+
 
 class ResponseHeaderSerializer(ActionDispatcher):
     """Default response headers serialization."""
@@ -0,0 +1,135 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of resources table queries used by balancer and pools.
+
+Fills database with generated resources and prints query plans and average
+latency of hot query shapes, with and without resources table indexes.
+Resources table is created and dropped by benchmark, so it refuses to run
+against database that already has one. Use scratch database only, default
+is in-memory SQLite.
+
+Usage: python tools/db_benchmark.py [--rows N] [--repeat N] [--connection URL]
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import dnrm  # noqa
+from dnrm.db.sqlalchemy import models  # noqa
+
+
+TYPES = ['driver-%d' % i for i in range(10)]
+STATES = models.Resource.STATES
+
+QUERIES = (
+    ('unused set', "SELECT id FROM resources WHERE type = :type AND "
+                   "pool IS NULL AND allocated = 0 AND processing = 0 AND "
+                   "deleted = 0 AND status = 'STARTED' LIMIT 10"),
+    ('pool', "SELECT count(id) FROM resources WHERE pool = :type AND "
+             "allocated = 0"),
+    ('stats', "SELECT count(id), pool, status, processing, allocated, "
+              "deleted FROM resources WHERE type = :type GROUP BY pool, "
+              "status, processing, allocated, deleted"),
+    ('cleaner', "SELECT id FROM resources WHERE processing = 0 AND "
+                "status = 'DELETED'"),
+)
+
+
+def fill(engine, rows):
+    table = models.Resource.__table__
+    batch = []
+    for i in xrange(rows):
+        type_ = TYPES[i % len(TYPES)]
+        allocated = i % 3 == 0
+        batch.append({
+            'id': str(uuid.uuid4()), 'type': type_, 'klass': 'L3',
+            'status': STATES[i % len(STATES)], 'data': '{}',
+            'pool': type_ if not allocated and i % 5 == 0 else None,
+            'processing': i % 7 == 0, 'allocated': allocated,
+            'deleted': False,
+        })
+        if len(batch) == 1000:
+            engine.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        engine.execute(table.insert(), batch)
+
+
+def explain(engine, query):
+    if engine.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    result = engine.execute(sa.text(prefix + query), type=TYPES[0])
+    return [' '.join(str(c) for c in row) for row in result]
+
+
+def measure(engine, query, repeat):
+    start = time.time()
+    for _i in xrange(repeat):
+        engine.execute(sa.text(query), type=TYPES[0]).fetchall()
+    return (time.time() - start) / repeat * 1000
+
+
+def run(engine, repeat, title):
+    print(title)
+    for name, query in QUERIES:
+        # Distinct statement text per run, so that cached statements
+        # prepared before schema change are not reused.
+        query = '%s /* %s */' % (query, title)
+        print('  %-10s %8.3f ms' % (name, measure(engine, query, repeat)))
+        for line in explain(engine, query):
+            print('      %s' % line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--connection', default='sqlite://')
+    args = parser.parse_args()
+
+    engine = sa.create_engine(args.connection)
+    table = models.Resource.__table__
+    if engine.has_table(table.name):
+        sys.exit('Table %s already exists in %s, use scratch database.' %
+                 (table.name, args.connection))
+    table.create(engine)
+    try:
+        for index in table.indexes:
+            index.drop(engine)
+        fill(engine, args.rows)
+
+        run(engine, args.repeat, 'Without indexes (%d rows):' % args.rows)
+        for index in table.indexes:
+            index.create(engine)
+        engine.execute('ANALYZE')
+        run(engine, args.repeat, 'With indexes (%d rows):' % args.rows)
+    finally:
+        table.drop(engine)
+
+if __name__ == '__main__':
+    main()